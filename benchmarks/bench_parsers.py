@@ -0,0 +1,61 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#Benchmark of the SteamCharts parser backends over the saved pages in benchmarks/fixtures/steamcharts
+#Run from the repository root: python benchmarks/bench_parsers.py
+
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from steamcharts_parser import PARSERS, available_backends
+
+FIXTURE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "steamcharts")
+
+### Loads every saved SteamCharts page ###
+def load_pages(folder: str = FIXTURE_FOLDER) -> list:
+    pages = []
+    for path in sorted(glob.glob(os.path.join(folder, "*.html"))):
+        with open(path, "r", encoding="utf-8") as f:
+            pages.append(f.read())
+    if not pages:
+        raise FileNotFoundError(f"No fixture pages found in {folder}")
+    return pages
+
+### Parses every page `rounds` times with one backend, returns pages per second and the rows from the last round ###
+def time_backend(backend: str, pages: list, rounds: int) -> tuple:
+    parse = PARSERS[backend]
+    parse(pages[0]) #warm up imports
+    start = time.perf_counter()
+    for _ in range(rounds):
+        rows = [row for page in pages for row in parse(page)]
+    elapsed = time.perf_counter() - start
+    return (rounds * len(pages)) / elapsed, rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare SteamCharts parser backends")
+    parser.add_argument("--rounds", type=int, default=50, help="How many times every fixture page is parsed")
+    args = parser.parse_args()
+
+    pages = load_pages()
+    results = {}
+    for backend in available_backends():
+        results[backend] = time_backend(backend, pages, args.rounds)
+
+    baseline = results.get("bs4", (None,))[0]
+    print(f"{len(pages)} fixture pages x {args.rounds} rounds")
+    for backend, (pages_per_second, rows) in results.items():
+        speedup = f"{pages_per_second / baseline:.1f}x bs4" if baseline else ""
+        print(f"{backend:>10}: {pages_per_second:10.1f} pages/s  {len(rows)} rows  {speedup}")
+
+    ### Every backend has to pull out exactly the same rows ###
+    outputs = [rows for _, rows in results.values()]
+    if any(rows != outputs[0] for rows in outputs[1:]):
+        print("WARNING: backends returned different rows")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#Benchmark of the whole pipeline against the local fixture server, no network needed
+#Measures SteamCharts parse throughput, enrichment throughput at several sizes, DataFrame assembly and analyze_data time and peak memory
+#Every run is saved to benchmarks/results/ and compared with the previous run so regressions show up between commits
+#Run from the repository root: python benchmarks/bench_pipeline.py
+
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_FOLDER = os.path.dirname(os.path.abspath(__file__))
+SRC_FOLDER = os.path.join(BENCH_FOLDER, "..", "src")
+RESULTS_FOLDER = os.path.join(BENCH_FOLDER, "results")
+sys.path.insert(0, SRC_FOLDER)
+sys.path.insert(0, BENCH_FOLDER)
+
+DEFAULT_SIZES = [25, 500, 5000]
+
+### A metric that gets this much worse than the previous run is flagged ###
+REGRESSION_THRESHOLD = 0.10
+
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+### Runs a case in a fresh working directory with its own cache, checkpoints, quota ledger and OpenCritic index ###
+def _workdir() -> str:
+    folder = tempfile.mkdtemp(prefix="bench_")
+    os.chdir(folder)
+    with open("key.txt", "w") as f:
+        f.write("fixture-key")
+    return folder
+
+### The fixture server answers instantly, the Steam rate limit is lifted so the pipeline itself is what gets measured ###
+def _unthrottle(data_pull) -> None:
+    from rate_limiter import TokenBucket
+
+    data_pull.steam_rate_limiter = lambda burst=10: TokenBucket(1_000_000, 1_000_000)
+
+### Dataset rows built from the saved Steam and OpenCritic payloads, with prices, player counts and scores varied per game ###
+def synthetic_rows(n: int, seed: int = 510) -> list:
+    from data_pull import build_game_row
+    from fixture_server import Fixtures
+
+    fixtures = Fixtures()
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        appid = 100_000 + i * 7
+        game_info = fixtures.app(appid if appid % 53 else appid + 1)["data"]
+        game_info = dict(game_info)
+        if not game_info.get("is_free"):
+            initial = rng.choice([499, 999, 1499, 1999, 2999, 3999, 5999, 6999])
+            discount = rng.choice([0, 0, 0, 10, 25, 50, 75])
+            game_info["price_overview"] = {"currency": "USD", "initial": initial, "final": initial * (100 - discount) // 100, "discount_percent": discount}
+        game_info["release_date"] = {"date": f"{rng.choice(['Jan', 'Apr', 'Jul', 'Oct'])} {rng.randint(1, 28)}, {rng.randint(2004, 2025)}"}
+        peak = rng.randint(1_000, 900_000)
+        chart_row = {"appid": appid, "name": game_info["name"], "current_players": int(peak * rng.uniform(0.05, 1.0)), "peak_players": peak}
+        row = build_game_row(appid, chart_row, game_info)
+        oc_id = fixtures.opencritic_id(game_info["name"])
+        game = fixtures.opencritic_game(oc_id)
+        rated = rng.random() < 0.7
+        row.update({
+            "OC_ID": oc_id if rated else None,
+            "OC_Name": game_info["name"] if rated else None,
+            "TopCriticScore": game["topCriticScore"] if rated else None,
+            "MedianCriticScore": game["medianScore"] if rated else None,
+            "PercentRecommended": game["percentRecommended"] if rated else None,
+            "TotalReviews": game["numReviews"] if rated else None,
+            "OC_Tier": game["tier"] if rated else None,
+        })
+        rows.append(row)
+    return rows
+
+
+### SteamCharts pages parsed per second with the backend parse_top_table picks ###
+def case_parse(rounds: int = 200) -> dict:
+    from bench_parsers import load_pages
+    from steamcharts_parser import available_backends, parse_top_table
+
+    pages = load_pages()
+    parse_top_table(pages[0])
+    rows = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for page in pages:
+            rows += len(parse_top_table(page))
+    elapsed = time.perf_counter() - start
+    return {"backend": available_backends()[0], "seconds": elapsed, "pages_per_second": rounds * len(pages) / elapsed, "rows_per_second": rows / elapsed}
+
+### run(size) end to end: SteamCharts scrape, Steam Store and OpenCritic enrichment, csv and Parquet output ###
+def case_enrich(size: int, latency: float = 0.0, max_workers: int = 8) -> dict:
+    import data_pull
+    from fixture_server import FixtureServer
+    from metrics import configure_logging
+
+    configure_logging("WARNING")
+    _workdir()
+    _unthrottle(data_pull)
+    with FixtureServer(latency=latency) as server:
+        server.patch(data_pull)
+        start = time.perf_counter()
+        data_pull.run(size, max_workers=max_workers)
+        elapsed = time.perf_counter() - start
+        served = server.stats
+
+    with open("data/run_report.json", "r") as f:
+        report = json.load(f)
+    rows = report["stages"].get("save", {}).get("rows", 0)
+    return {
+        "size": size,
+        "seconds": elapsed,
+        "rows": rows,
+        "rows_per_second": rows / elapsed if elapsed else None,
+        "requests": sum(route["requests"] for route in served.values()),
+        "bytes": sum(route["bytes"] for route in served.values()),
+        "stages": {name: {"seconds": stage["seconds"], "self_seconds": stage["self_seconds"]} for name, stage in report["stages"].items()},
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+### Building the typed DataFrame from finished records, column by column ###
+def case_dataframe(size: int) -> dict:
+    from data_pull import DATASET_COLUMNS
+    from records import GameRecord, records_to_frame
+    from schema import apply_schema
+
+    records = [GameRecord.from_row(row) for row in synthetic_rows(size)]
+    start = time.perf_counter()
+    df = records_to_frame(records, DATASET_COLUMNS)
+    built = time.perf_counter()
+    df = apply_schema(df)
+    elapsed = time.perf_counter() - start
+    return {
+        "size": size,
+        "seconds": elapsed,
+        "build_seconds": built - start,
+        "schema_seconds": elapsed - (built - start),
+        "rows_per_second": size / elapsed,
+        "memory_mb": df.memory_usage(deep=True).sum() / 2 ** 20,
+    }
+
+### analyze_data on a snapshot of `size` games: wall time with the figure process pool, then peak Python memory with everything in process ###
+def case_analyze(size: int) -> dict:
+    import pandas as pd
+
+    import analysis
+    import data_pull
+    from metrics import configure_logging
+    from schema import write_snapshot
+
+    configure_logging("WARNING")
+    _workdir()
+    write_snapshot(pd.DataFrame(synthetic_rows(size), columns=data_pull.DATASET_COLUMNS))
+
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w") #analyze_data prints its tables
+    try:
+        start = time.perf_counter()
+        analysis.analyze_data()
+        elapsed = time.perf_counter() - start
+
+        shutil.rmtree("results")
+        tracemalloc.start()
+        analysis.analyze_data(max_workers=1)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    return {"size": size, "seconds": elapsed, "peak_python_mb": peak / 2 ** 20, "peak_rss_mb": _peak_rss_mb()}
+
+CASES = {"parse": case_parse, "enrich": case_enrich, "dataframe": case_dataframe, "analyze": case_analyze}
+
+
+### Each case runs in its own process so memory numbers and module state don't leak between cases ###
+def run_case(case: str, size: int = None, latency: float = 0.0) -> dict:
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        output = f.name
+    command = [sys.executable, os.path.abspath(__file__), "--case", case, "--output", output, "--latency", str(latency)]
+    if size is not None:
+        command += ["--size", str(size)]
+    try:
+        subprocess.run(command, check=True)
+        with open(output, "r") as f:
+            return json.load(f)
+    finally:
+        os.remove(output)
+
+def git_commit() -> tuple:
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=BENCH_FOLDER, capture_output=True, text=True).stdout.strip()
+
+    return git("rev-parse", "--short", "HEAD") or "unknown", bool(git("status", "--porcelain", "--", "../src"))
+
+### The numbers compared between runs: (case, metric, True if higher is better) ###
+def headline(results: dict) -> dict:
+    numbers = {}
+    for case, result in results.items():
+        for metric in ("seconds", "pages_per_second", "rows_per_second", "peak_python_mb", "bytes", "requests"):
+            if result.get(metric) is not None:
+                numbers[(case, metric)] = (result[metric], metric.endswith("per_second"))
+    return numbers
+
+def previous_result(exclude: str = None) -> str:
+    paths = sorted(path for path in glob.glob(os.path.join(RESULTS_FOLDER, "*.json")) if path != exclude)
+    return paths[-1] if paths else None
+
+def compare(current: dict, baseline: dict) -> list:
+    regressions = []
+    before = headline(baseline["results"])
+    print(f"\nCompared with {baseline['commit']} ({baseline['timestamp']}):")
+    for key, (value, higher_is_better) in headline(current["results"]).items():
+        if key not in before or not before[key][0]:
+            continue
+        change = (value - before[key][0]) / before[key][0]
+        worse = -change if higher_is_better else change
+        flag = "  REGRESSION" if worse > REGRESSION_THRESHOLD and key[1] not in ("bytes", "requests") else ""
+        if worse > REGRESSION_THRESHOLD and key[1] in ("bytes", "requests"):
+            flag = "  MORE TRAFFIC"
+        print(f"  {key[0]:>16} {key[1]:>17}: {before[key][0]:>14.3f} -> {value:>14.3f} ({change:+.1%}){flag}")
+        if flag:
+            regressions.append(key)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline offline against the fixture server")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Numbers of games enriched, the largest is also used for the DataFrame and analysis cases")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds the fixture server waits before every response")
+    parser.add_argument("--compare", default=None, help="Result file to compare against, defaults to the most recent one in benchmarks/results")
+    parser.add_argument("--no-save", action="store_true", help="Don't store this run in benchmarks/results")
+    parser.add_argument("--case", choices=sorted(CASES), help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        kwargs = {}
+        if args.size is not None:
+            kwargs["size"] = args.size
+        if args.case == "enrich":
+            kwargs["latency"] = args.latency
+        result = CASES[args.case](**kwargs)
+        with open(args.output, "w") as f:
+            json.dump(result, f)
+        return
+
+    largest = max(args.sizes)
+    results = {"parse": run_case("parse")}
+    print(f"parse: {results['parse']['pages_per_second']:.1f} pages/s ({results['parse']['backend']})")
+    for size in args.sizes:
+        result = run_case("enrich", size, args.latency)
+        results[f"enrich_{size}"] = result
+        print(f"enrich {size}: {result['seconds']:.2f}s, {result['rows_per_second']:.1f} rows/s, {result['requests']} requests, {result['bytes'] / 2 ** 20:.1f} MB")
+    results[f"dataframe_{largest}"] = run_case("dataframe", largest)
+    print(f"dataframe {largest}: {results[f'dataframe_{largest}']['seconds'] * 1000:.1f} ms")
+    results[f"analyze_{largest}"] = run_case("analyze", largest)
+    print(f"analyze {largest}: {results[f'analyze_{largest}']['seconds']:.2f}s, peak {results[f'analyze_{largest}']['peak_python_mb']:.1f} MB")
+
+    commit, dirty = git_commit()
+    current = {
+        "commit": commit + ("-dirty" if dirty else ""),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "latency": args.latency,
+        "results": results,
+    }
+
+    baseline_path = args.compare or previous_result()
+    if baseline_path:
+        with open(baseline_path, "r") as f:
+            regressions = compare(current, json.load(f))
+        if regressions:
+            print(f"{len(regressions)} metrics got more than {REGRESSION_THRESHOLD:.0%} worse.")
+
+    if not args.no_save:
+        os.makedirs(RESULTS_FOLDER, exist_ok=True)
+        path = os.path.join(RESULTS_FOLDER, f"{datetime.datetime.now():%Y%m%d-%H%M%S}-{current['commit']}.json")
+        with open(path, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"Saved results to {path}")
+
+if __name__ == "__main__":
+    main()
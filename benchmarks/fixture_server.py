@@ -0,0 +1,233 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#Local stand-in for SteamCharts, the Steam Store API and OpenCritic that replays the saved responses in benchmarks/fixtures
+#The four saved SteamCharts pages are repeated with shifted appids so any number of games can be requested, Steam and OpenCritic
+#responses are filled in from the saved payloads for whichever appid/name is asked for, and the Steam app list is made up on the spot
+#Run on its own with: python benchmarks/fixture_server.py --port 8000
+
+
+import argparse
+import glob
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+### Appids on repeated SteamCharts pages are shifted by this much per repeat so they never collide with the saved ones ###
+APPID_SHIFT = 10_000_000
+
+### Every NOT_FOUND_EVERY-th appid answers success: false, like delisted games do ###
+NOT_FOUND_EVERY = 53
+
+### Path of Steam's GetAppList endpoint, and the first appid and number of apps in the made up list ###
+APP_LIST_PATH = "/ISteamApps/GetAppList/v2/"
+APP_LIST_START = 1000
+APP_LIST_SIZE = 200
+
+### Top level appdetails fields returned for filters=basic ###
+BASIC_FIELDS = {"type", "name", "steam_appid", "required_age", "is_free", "controller_support", "dlc", "detailed_description", "about_the_game",
+                "short_description", "supported_languages", "header_image", "capsule_image", "capsule_imagev5", "website", "pc_requirements",
+                "mac_requirements", "linux_requirements", "legal_notice", "developers", "publishers", "packages", "package_groups", "platforms"}
+
+### Currency and rough price multiplier per store region (cc), regions not listed are priced in USD ###
+REGION_PRICES = {"gb": ("GBP", 0.8), "de": ("EUR", 0.95), "fr": ("EUR", 0.95), "pl": ("PLN", 3.5), "br": ("BRL", 2.5), "jp": ("JPY", 80),
+                 "in": ("INR", 30), "ca": ("CAD", 1.3), "au": ("AUD", 1.4), "tr": ("USD", 0.5), "ar": ("USD", 0.5)}
+
+
+def _read(*parts) -> str:
+    with open(os.path.join(FIXTURE_FOLDER, *parts), "r", encoding="utf-8") as f:
+        return f.read()
+
+### Saved responses, loaded once ###
+class Fixtures:
+    def __init__(self):
+        self.pages = [_read("steamcharts", os.path.basename(path)) for path in sorted(glob.glob(os.path.join(FIXTURE_FOLDER, "steamcharts", "*.html")))]
+        self.appdetails = []
+        for path in sorted(glob.glob(os.path.join(FIXTURE_FOLDER, "steam", "appdetails_*.json"))):
+            (answer,) = json.loads(_read("steam", os.path.basename(path))).values()
+            self.appdetails.append(answer["data"])
+        self.search = json.loads(_read("opencritic", "search.json"))
+        self.game = json.loads(_read("opencritic", "game.json"))
+
+    ### SteamCharts page n, the saved pages repeat with every appid shifted by APPID_SHIFT per repeat ###
+    def page(self, n: int) -> str:
+        repeat, index = divmod(n - 1, len(self.pages))
+        if not repeat:
+            return self.pages[index]
+        return re.sub(r'href="/app/(\d+)"', lambda m: f'href="/app/{int(m.group(1)) + repeat * APPID_SHIFT}"', self.pages[index])
+
+    ### appdetails answer for one appid, a saved game picked by appid with the appid and name swapped in ###
+    def app(self, appid: int, filters: str = None, region: str = "us") -> dict:
+        if appid % NOT_FOUND_EVERY == 0:
+            return {"success": False}
+        data = dict(self.appdetails[appid % len(self.appdetails)])
+        data["steam_appid"] = appid
+        data["name"] = f"{data['name']} {appid}"
+        if region in REGION_PRICES and data.get("price_overview"):
+            currency, factor = REGION_PRICES[region]
+            price = dict(data["price_overview"], currency=currency)
+            price["initial"] = round(price["initial"] * factor)
+            price["final"] = round(price["initial"] * (100 - price["discount_percent"]) / 100)
+            data["price_overview"] = price
+        if filters:
+            wanted = set()
+            for field in filters.split(","):
+                wanted |= BASIC_FIELDS if field == "basic" else {field}
+            data = {key: value for key, value in data.items() if key in wanted}
+            if filters == "price_overview" and not data:
+                data = [] #Steam sends an empty list for games without a price
+        return {"success": True, "data": data}
+
+    ### GetAppList answer with size consecutive appids, the first one listed twice like Steam sometimes does ###
+    @staticmethod
+    def app_list(size: int = APP_LIST_SIZE) -> dict:
+        apps = [{"appid": appid, "name": f"App {appid}"} for appid in range(APP_LIST_START, APP_LIST_START + size)]
+        return {"applist": {"apps": apps + apps[:1]}}
+
+    ### OpenCritic ids are derived from the name so a search and the game lookup that follows agree ###
+    @staticmethod
+    def opencritic_id(name: str) -> int:
+        return zlib.crc32(name.encode("utf-8")) % 1_000_000
+
+    def search_results(self, criteria: str) -> list:
+        results = [dict(result) for result in self.search]
+        results[0].update(id=self.opencritic_id(criteria), name=criteria)
+        for result in results[1:]:
+            result["name"] = f"{criteria}: {result['name']}"
+            result["id"] = self.opencritic_id(result["name"])
+        return results
+
+    def opencritic_game(self, oc_id: int) -> dict:
+        game = dict(self.game)
+        game["id"] = oc_id
+        game["topCriticScore"] = 60 + oc_id % 37 + (oc_id % 100) / 100
+        game["medianScore"] = 60 + oc_id % 35
+        game["percentRecommended"] = 40 + oc_id % 60
+        game["numReviews"] = 5 + oc_id % 200
+        game["tier"] = ["Mighty", "Strong", "Fair", "Weak"][oc_id % 4]
+        return game
+
+
+### Serves the fixtures with an optional artificial latency, request counts and bytes are kept per route ###
+class FixtureServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, app_list_size: int = APP_LIST_SIZE):
+        self.fixtures = Fixtures()
+        self.latency = latency
+        self.app_list_size = app_list_size
+        self.stats = {}
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server._handle(self)
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def app_list_url(self) -> str:
+        return self.base_url + APP_LIST_PATH
+
+    def start(self) -> str:
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.stop()
+        return False
+
+    ### Points data_pull's SteamCharts, Steam Store and OpenCritic URLs at this server ###
+    def patch(self, data_pull) -> None:
+        data_pull.SteamCharts_URL_base = self.base_url + "/top/p.{page}"
+        data_pull.SteamStore_URL = self.base_url + "/api/appdetails"
+        data_pull.OpenCritic_URL = self.base_url
+
+    def _record(self, route: str, size: int) -> None:
+        with self.lock:
+            stats = self.stats.setdefault(route, {"requests": 0, "bytes": 0})
+            stats["requests"] += 1
+            stats["bytes"] += size
+
+    def _handle(self, handler) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        url = urlsplit(handler.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        headers = {}
+
+        page = re.fullmatch(r"/top/p\.(\d+)", url.path)
+        game = re.fullmatch(r"/game/(\d+)", url.path)
+        if page:
+            route, status, content_type = "steamcharts", 200, "text/html; charset=utf-8"
+            body = self.fixtures.page(int(page.group(1)))
+        elif url.path == "/api/appdetails":
+            route, content_type = "steam", "application/json"
+            appids = [int(appid) for appid in query.get("appids", "").split(",") if appid]
+            filters = query.get("filters")
+            if len(appids) > 1 and filters != "price_overview":
+                status, body = 400, "null" #the real endpoint only takes several appids for price_overview
+            else:
+                status, body = 200, json.dumps({str(appid): self.fixtures.app(appid, filters, query.get("cc", "us")) for appid in appids})
+        elif url.path == APP_LIST_PATH:
+            route, status, content_type = "applist", 200, "application/json"
+            body = json.dumps(self.fixtures.app_list(self.app_list_size))
+        elif url.path == "/meta/search" or game:
+            route, status, content_type = "opencritic", 200, "application/json"
+            if game:
+                body = json.dumps(self.fixtures.opencritic_game(int(game.group(1))))
+            else:
+                body = json.dumps(self.fixtures.search_results(query.get("criteria", "")))
+            headers = {"x-ratelimit-requests-limit": "1000000", "x-ratelimit-requests-remaining": "999999", "x-ratelimit-requests-reset": "86400"}
+        else:
+            route, status, content_type, body = "other", 404, "application/json", "{}"
+
+        data = body.encode("utf-8")
+        self._record(route, len(data))
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(data)))
+        for key, value in headers.items():
+            handler.send_header(key, value)
+        handler.end_headers()
+        handler.wfile.write(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the saved SteamCharts, Steam Store and OpenCritic responses locally")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    args = parser.parse_args()
+
+    server = FixtureServer(port=args.port, latency=args.latency)
+    print(f"Serving fixtures on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#Mergeable accumulators for analysing a dataset in chunks: each one is updated chunk by chunk and two of them can be merged,
+#so parts of the data can be scanned separately (or in different processes) and combined at the end
+#Memory only depends on the number of columns, bins, k or the sample size, never on the number of rows
+
+
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from features import top_k
+
+
+def _floats(df: pd.DataFrame, columns: list) -> np.ndarray:
+    return df[columns].to_numpy(dtype="float64", na_value=np.nan)
+
+
+### Count, mean, sum of squared deviations, min and max per column, merged with Chan's parallel update so the variance stays accurate ###
+class RunningMoments:
+    def __init__(self, columns: list):
+        self.columns = list(columns)
+        size = len(self.columns)
+        self.count = np.zeros(size)
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+        self.min = np.full(size, np.inf)
+        self.max = np.full(size, -np.inf)
+
+    def update(self, df: pd.DataFrame) -> None:
+        values = _floats(df, self.columns)
+        other = RunningMoments(self.columns)
+        other.count = (~np.isnan(values)).sum(axis=0).astype("float64")
+        present = other.count > 0
+        with np.errstate(invalid="ignore"):
+            other.mean[present] = np.nanmean(values[:, present], axis=0)
+            other.m2[present] = np.nansum((values[:, present] - other.mean[present]) ** 2, axis=0)
+            other.min[present] = np.nanmin(values[:, present], axis=0)
+            other.max[present] = np.nanmax(values[:, present], axis=0)
+        self.merge(other)
+
+    def merge(self, other: "RunningMoments") -> None:
+        count = self.count + other.count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            delta = other.mean - self.mean
+            mean = np.where(count > 0, self.mean + delta * other.count / count, 0.0)
+            m2 = np.where(count > 0, self.m2 + other.m2 + delta ** 2 * self.count * other.count / count, 0.0)
+        self.count, self.mean, self.m2 = count, mean, m2
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+
+    ### count, mean, std (ddof=1 like pandas), min and max per column ###
+    def summary(self) -> pd.DataFrame:
+        present = self.count > 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            std = np.where(self.count > 1, np.sqrt(self.m2 / (self.count - 1)), np.nan)
+        return pd.DataFrame({
+            "count": self.count,
+            "mean": np.where(present, self.mean, np.nan),
+            "std": std,
+            "min": np.where(present, self.min, np.nan),
+            "max": np.where(present, self.max, np.nan),
+        }, index=self.columns)
+
+### Pearson correlation of every pair of columns over the rows where both are present, the same pairwise-complete rule as DataFrame.corr ###
+### Per pair it keeps the count, both means and the co-moments, which merge the same way as RunningMoments ###
+class PairwiseCorrelation:
+    def __init__(self, columns: list):
+        self.columns = list(columns)
+        shape = (len(self.columns), len(self.columns))
+        self.count = np.zeros(shape)
+        self.mean_x = np.zeros(shape)
+        self.mean_y = np.zeros(shape)
+        self.m2_x = np.zeros(shape)
+        self.m2_y = np.zeros(shape)
+        self.co_moment = np.zeros(shape)
+
+    def update(self, df: pd.DataFrame) -> None:
+        values = _floats(df, self.columns)
+        present = ~np.isnan(values)
+        other = PairwiseCorrelation(self.columns)
+        for i in range(len(self.columns)):
+            for j in range(i, len(self.columns)):
+                both = present[:, i] & present[:, j]
+                n = both.sum()
+                if not n:
+                    continue
+                x, y = values[both, i], values[both, j]
+                mean_x, mean_y = x.mean(), y.mean()
+                dx, dy = x - mean_x, y - mean_y
+                other.count[i, j] = n
+                other.mean_x[i, j], other.mean_y[i, j] = mean_x, mean_y
+                other.m2_x[i, j], other.m2_y[i, j], other.co_moment[i, j] = dx @ dx, dy @ dy, dx @ dy
+        self.merge(other)
+
+    def merge(self, other: "PairwiseCorrelation") -> None:
+        count = self.count + other.count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            weight = np.where(count > 0, self.count * other.count / count, 0.0)
+            share = np.where(count > 0, other.count / count, 0.0)
+        delta_x = other.mean_x - self.mean_x
+        delta_y = other.mean_y - self.mean_y
+        self.m2_x = self.m2_x + other.m2_x + delta_x ** 2 * weight
+        self.m2_y = self.m2_y + other.m2_y + delta_y ** 2 * weight
+        self.co_moment = self.co_moment + other.co_moment + delta_x * delta_y * weight
+        self.mean_x = self.mean_x + delta_x * share
+        self.mean_y = self.mean_y + delta_y * share
+        self.count = count
+
+    ### Correlation matrix, NaN where a pair has no rows in common or one side never varies ###
+    def matrix(self) -> pd.DataFrame:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            divisor = np.sqrt(self.m2_x * self.m2_y)
+            upper = np.where(divisor > 0, self.co_moment / divisor, np.nan)
+        upper = np.clip(upper, -1, 1)
+        full = np.triu(upper) + np.triu(upper, 1).T
+        return pd.DataFrame(full, index=self.columns, columns=self.columns)
+
+    def correlation(self, x: str, y: str) -> float:
+        return float(self.matrix().loc[x, y])
+
+### Histogram counts over fixed bin edges, merging is adding the counts ###
+class BinnedCounts:
+    def __init__(self, edges: np.ndarray):
+        self.edges = np.asarray(edges, dtype="float64")
+        self.counts = np.zeros(len(self.edges) - 1, dtype="int64")
+
+    ### bins equal-width bins between low and high, the same edges numpy and seaborn pick for the whole column ###
+    @classmethod
+    def between(cls, low: float, high: float, bins: int) -> "BinnedCounts":
+        return cls(np.histogram_bin_edges(np.array([low, high]), bins=bins, range=(low, high)))
+
+    def update(self, values: pd.Series) -> None:
+        values = values.to_numpy(dtype="float64", na_value=np.nan)
+        self.counts += np.histogram(values[~np.isnan(values)], bins=self.edges)[0]
+
+    def merge(self, other: "BinnedCounts") -> None:
+        self.counts += other.counts
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({"left": self.edges[:-1], "right": self.edges[1:], "count": self.counts})
+
+### Occurrences of each value of a column ###
+class ValueCounts:
+    def __init__(self):
+        self.counts = Counter()
+
+    def update(self, values: pd.Series) -> None:
+        self.counts.update(values.dropna().astype("string").value_counts().to_dict())
+
+    def merge(self, other: "ValueCounts") -> None:
+        self.counts.update(other.counts)
+
+    def to_series(self) -> pd.Series:
+        return pd.Series(dict(self.counts.most_common()), dtype="int64")
+
+### The k rows with the largest (or smallest) value in a column, only k rows are ever kept ###
+### Rows carry their position in the whole dataset as their index, ties go to the earlier row like nlargest/nsmallest on the full frame ###
+class TopK:
+    def __init__(self, k: int = 5, column: str = "Value", largest: bool = True):
+        self.k = k
+        self.column = column
+        self.largest = largest
+        self.rows = None
+
+    def update(self, df: pd.DataFrame, mask: pd.Series = None) -> None:
+        self._keep(top_k(df, self.k, mask, self.column, self.largest))
+
+    def merge(self, other: "TopK") -> None:
+        if other.rows is not None:
+            self._keep(other.rows)
+
+    def _keep(self, rows: pd.DataFrame) -> None:
+        if self.rows is not None:
+            rows = pd.concat([self.rows, rows]).sort_index()
+        self.rows = top_k(rows, self.k, None, self.column, self.largest)
+
+    def result(self) -> pd.DataFrame:
+        return self.rows
+
+### Uniform random sample of at most size rows: every row gets a random key and the size smallest keys are kept ###
+### Merging two samples is keeping the smallest keys of both, while fewer than size rows have been seen the sample is every row ###
+class ReservoirSample:
+    def __init__(self, size: int, columns: list, seed=None):
+        self.size = size
+        self.columns = list(columns)
+        self.rng = np.random.default_rng(seed)
+        self.rows = None
+        self.seen = 0
+
+    def update(self, df: pd.DataFrame) -> None:
+        self.seen += len(df)
+        keys = self.rng.random(len(df))
+        rows = df[self.columns].assign(_key=keys)
+        if self.rows is not None and len(self.rows) >= self.size:
+            rows = rows[keys < self.rows["_key"].max()] #can't make it in to a full sample
+        self._keep(rows)
+
+    def merge(self, other: "ReservoirSample") -> None:
+        self.seen += other.seen
+        if other.rows is not None:
+            self._keep(other.rows)
+
+    def _keep(self, rows: pd.DataFrame) -> None:
+        if self.rows is not None:
+            rows = pd.concat([self.rows, rows])
+        if len(rows) > self.size:
+            rows = rows.nsmallest(self.size, "_key")
+        self.rows = rows
+
+    ### The sampled rows in their original order ###
+    def sample(self) -> pd.DataFrame:
+        if self.rows is None:
+            return pd.DataFrame(columns=self.columns)
+        return self.rows.sort_index().drop(columns="_key")
@@ -0,0 +1,282 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#Analysis of the enriched dataset: statistics, value rankings and the figures in results/
+#Kept apart from data_pull so a fetch never imports the analysis and plotting libraries, and plotting is only loaded when the figures are drawn
+#analyze_data works on one day loaded in memory, analyze_streaming reads any number of days in chunks with mergeable accumulators
+
+
+import glob
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from accumulators import BinnedCounts, PairwiseCorrelation, ReservoirSample, RunningMoments, TopK, ValueCounts
+from features import (CORRELATION_COLUMNS, SUMMARY_COLUMNS, add_features, correlation, discounted_mask, free_mask, hidden_gems, paid_mask, rated_mask,
+                      summary_statistics, valid_price_mask, worst_value)
+from metrics import reset_metrics, write_run_report
+from schema import DEFAULT_SNAPSHOT_ROOT, apply_schema, read_snapshots, snapshot_dates, snapshot_path
+
+### Columns analyze_data uses, only these are read from the Parquet snapshots ###
+ANALYSIS_COLUMNS = ["appid", "game name", "Current Players", "Peak Players", "Free game?", "Current Price (USD)", "Discount Percentage",
+                    "Release Date", "TopCriticScore", "MedianCriticScore", "PercentRecommended", "TotalReviews", "OC_Tier"]
+
+### Loads the dataset for analysis: one day's Parquet snapshot (the latest by default) or an older csv export ###
+def load_dataset(file_path: str = DEFAULT_SNAPSHOT_ROOT, snapshot_date=None) -> pd.DataFrame:
+    if file_path.endswith(".csv"):
+        return apply_schema(pd.read_csv(file_path))
+    if snapshot_date is None:
+        dates = snapshot_dates(file_path)
+        if not dates:
+            raise FileNotFoundError(f"No snapshots found in {file_path}")
+        snapshot_date = dates[-1]
+    return read_snapshots(file_path, columns=ANALYSIS_COLUMNS, dates=[snapshot_date])
+
+### Rows read at a time by analyze_streaming, and rows kept for the figures that need the raw values (scatter, box and pair plots) ###
+STREAM_CHUNK_SIZE = 50_000
+STREAM_SAMPLE_SIZE = 5_000
+
+### Columns the figures drawn from the sample need ###
+SAMPLE_COLUMNS = ["OC_Tier", "Release Year", "Free game?", "TopCriticScore", "MedianCriticScore", "PercentRecommended", "TotalReviews",
+                  "Current Players", "Peak Players", "Current Price (USD)", "Discount Percentage", "Popularity_Factor", "Game Age (Years)"]
+
+### Bins of the histograms, the same as the in-memory figures ###
+HISTOGRAM_BINS = {"Release Year": 20, "Popularity_Factor": 30}
+
+### The (x, y) columns correlated over the discounted games ###
+DISCOUNT_CORRELATIONS = [("Discount Percentage", "Popularity_Factor"), ("TotalReviews", "Current Players")]
+
+### Value rankings: name, column order and which filtered games they rank ###
+RANKINGS = [("Top 5 best value games:", True, "clean"), ("Bottom 5 value games:", False, "clean"),
+            ("Top 5 best paid value games:", True, "paid"), ("Top 5 best free games:", True, "free")]
+
+
+### Prints the filtering counts, correlations, value rankings and summary statistics, the same report for both analysis paths ###
+def print_statistics(rows: int, counts: dict, correlations: list, rankings: list, summary: pd.DataFrame) -> None:
+    # Only games with an opencritic tier review - eliminates all NaN
+    print("After OpenCritic Filtering:", counts["rated"], "from", rows)
+
+    # Some games are not marked as free and do not contain a price, sometimes these are bundles for games and work as a single launcher. These are filtered out.
+    print("After removing erroneous price entries, for example games that appear as bundles and have no price:",
+          counts["clean"])
+
+    print("Total free games:", counts["free"])
+    print("Total paid games:", counts["paid"])
+    print("Total discounted games:", counts["discounted"])
+
+    correlation_discount_popularity, correlation_totalreviews_currentplayers = correlations
+    print(f"Correlation between the discount percentage and the popularity factor: {correlation_discount_popularity}")
+    print(
+        f"Correlation between the total OpenCritic reviews and the current number of players: {correlation_totalreviews_currentplayers}")
+
+    for (title, _, _), ranking in zip(RANKINGS, rankings):
+        print(title)
+        print(ranking)
+
+    print("Summary statistics of the filtered games:")
+    print(summary)
+
+### Filtering masks over a frame that already has its features, the same for a whole day or one chunk ###
+def analysis_masks(df: pd.DataFrame) -> dict:
+    rated = rated_mask(df)
+    clean = rated & valid_price_mask(df)
+    return {"rated": rated, "clean": clean, "free": clean & free_mask(df), "paid": clean & paid_mask(df), "discounted": clean & discounted_mask(df)}
+
+### Prints the dataset statistics and value rankings and draws the figures in results/ ###
+### Time spent loading, computing features, statistics and figures is written to report_path ###
+### Returns the frame with its features, the masks and the printed statistics, what analyze_streaming's state is checked against ###
+def analyze_data(file_path: str = DEFAULT_SNAPSHOT_ROOT, snapshot_date=None, max_workers: int = None, report_path: str = "data/analysis_report.json") -> dict:
+    metrics = reset_metrics()
+    with metrics.stage("load"):
+        df = load_dataset(file_path, snapshot_date)
+    metrics.add_rows("load", len(df))
+    print(df.shape)
+
+    output_folder = "results"
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    ### Every derived column is computed once on the whole frame, the views below are boolean masks over it ###
+    with metrics.stage("features"):
+        add_features(df)
+    metrics.add_rows("features", len(df))
+    print(df.shape)
+
+    with metrics.stage("statistics"):
+        masks = analysis_masks(df)
+        counts = {name: int(mask.sum()) for name, mask in masks.items()}
+        correlations = [correlation(df, masks["discounted"], x, y) for x, y in DISCOUNT_CORRELATIONS]
+        rankings = [(hidden_gems if largest else worst_value)(df, 5, masks[games]) for _, largest, games in RANKINGS]
+        summary = summary_statistics(df, masks["clean"])
+        print_statistics(len(df), counts, correlations, rankings, summary)
+
+    ### Figures are drawn off-screen in a process pool, any figure whose data hasn't changed since the last run is skipped ###
+    ### matplotlib and seaborn are only imported here, loading a dataset or building a query index doesn't pay for them ###
+    from figures import figure_tasks, render_figures
+
+    with metrics.stage("figures"):
+        rendered = render_figures(figure_tasks(df, masks["clean"], masks["discounted"]), output_folder, max_workers=max_workers)
+    metrics.add_rows("figures", len(rendered))
+    write_run_report(report_path)
+    return {"frame": df, "masks": masks, "counts": counts, "correlations": correlations, "rankings": rankings, "summary": summary}
+
+
+### Everything analyze_streaming keeps while scanning, one per part of the input and merged in to one at the end ###
+class StreamState:
+    def __init__(self, sample_size: int = STREAM_SAMPLE_SIZE, seed=None):
+        self.rows = 0
+        self.shape = None #column counts before and after the features are added
+        self.counts = Counter()
+        self.summary = RunningMoments(SUMMARY_COLUMNS)
+        self.ranges = RunningMoments(list(HISTOGRAM_BINS))
+        self.correlations = PairwiseCorrelation(CORRELATION_COLUMNS)
+        self.discount_correlations = PairwiseCorrelation(list(dict.fromkeys(column for pair in DISCOUNT_CORRELATIONS for column in pair)))
+        self.rankings = [TopK(5, "Value", largest) for _, largest, _ in RANKINGS]
+        self.tiers = ValueCounts()
+        self.sample = ReservoirSample(sample_size, SAMPLE_COLUMNS + ["Discounted"], seed)
+        self.histograms = {} #filled in by the second pass
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        columns = len(chunk.columns)
+        add_features(chunk)
+        self.shape = self.shape or (columns, len(chunk.columns))
+        self.rows += len(chunk)
+
+        masks = analysis_masks(chunk)
+        self.counts.update({name: int(mask.sum()) for name, mask in masks.items()})
+        clean = chunk[masks["clean"]]
+        self.summary.update(clean)
+        self.ranges.update(clean)
+        self.correlations.update(clean)
+        self.discount_correlations.update(chunk[masks["discounted"]])
+        for ranking, (_, _, games) in zip(self.rankings, RANKINGS):
+            ranking.update(chunk, masks[games])
+        self.tiers.update(clean["OC_Tier"])
+        self.sample.update(clean.assign(Discounted=masks["discounted"][masks["clean"]]))
+
+    def merge(self, other: "StreamState") -> None:
+        self.rows += other.rows
+        self.shape = self.shape or other.shape
+        self.counts.update(other.counts)
+        self.summary.merge(other.summary)
+        self.ranges.merge(other.ranges)
+        self.correlations.merge(other.correlations)
+        self.discount_correlations.merge(other.discount_correlations)
+        for ranking, other_ranking in zip(self.rankings, other.rankings):
+            ranking.merge(other_ranking)
+        self.tiers.merge(other.tiers)
+        self.sample.merge(other.sample)
+
+### Parts of the input scanned on their own: every Parquet file of the chosen days (the latest by default), or the csv ###
+### Each part is (path, snapshot_date, first row), rows are numbered across the whole input so they keep the index they'd have in memory ###
+def stream_parts(file_path: str = DEFAULT_SNAPSHOT_ROOT, dates: list = None) -> list:
+    if file_path.endswith(".csv"):
+        return [(file_path, None, 0)]
+    import pyarrow.parquet as pq
+
+    if dates is None:
+        dates = snapshot_dates(file_path)[-1:]
+    parts = []
+    first_row = 0
+    for snapshot_date in dates:
+        for path in sorted(glob.glob(os.path.join(snapshot_path(file_path, snapshot_date), "*.parquet"))):
+            parts.append((path, pd.Timestamp(snapshot_date), first_row))
+            first_row += pq.ParquetFile(path).metadata.num_rows
+    if not parts:
+        raise FileNotFoundError(f"No snapshots found in {file_path}")
+    return parts
+
+### Reads one part chunk_size rows at a time, with the analysis columns and dtypes load_dataset would give them ###
+def iter_chunks(part: tuple, chunk_size: int = STREAM_CHUNK_SIZE):
+    path, snapshot_date, first_row = part
+    if path.endswith(".csv"):
+        chunks = pd.read_csv(path, chunksize=chunk_size)
+    else:
+        import pyarrow.parquet as pq
+
+        parquet = pq.ParquetFile(path)
+        columns = [column for column in ANALYSIS_COLUMNS if column in parquet.schema_arrow.names]
+        chunks = (batch.to_pandas() for batch in parquet.iter_batches(batch_size=chunk_size, columns=columns))
+    for chunk in chunks:
+        if snapshot_date is not None:
+            #Older days may be missing columns added since, they come back empty like in read_snapshots
+            chunk = chunk.reindex(columns=ANALYSIS_COLUMNS)
+            chunk["snapshot_date"] = snapshot_date
+        chunk = apply_schema(chunk)
+        chunk.index = pd.RangeIndex(first_row, first_row + len(chunk))
+        first_row += len(chunk)
+        yield chunk
+
+### First pass over one part: counts, moments, correlations, rankings, tiers and the sample ###
+def scan_part(part: tuple, chunk_size: int = STREAM_CHUNK_SIZE, sample_size: int = STREAM_SAMPLE_SIZE, seed=None) -> StreamState:
+    state = StreamState(sample_size, seed)
+    for chunk in iter_chunks(part, chunk_size):
+        state.update(chunk)
+    return state
+
+### Second pass over one part: histogram counts over the bin edges fixed by the first pass ###
+def bin_part(part: tuple, edges: dict, chunk_size: int = STREAM_CHUNK_SIZE) -> dict:
+    histograms = {column: BinnedCounts(column_edges) for column, column_edges in edges.items()}
+    for chunk in iter_chunks(part, chunk_size):
+        add_features(chunk)
+        clean = chunk[analysis_masks(chunk)["clean"]]
+        for column, histogram in histograms.items():
+            histogram.update(clean[column])
+    return histograms
+
+### Calls function once per part (arguments are one list per parameter), in a process pool when there is more than one part ###
+### Results come back in part order so merging them gives the same answer however many workers there are ###
+def _map_parts(function, max_workers: int, *arguments) -> list:
+    if max_workers == 1 or len(arguments[0]) == 1:
+        return list(map(function, *arguments))
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(function, *arguments))
+
+### Out-of-core version of analyze_data: the input is read chunk_size rows at a time and only the accumulators are kept, ###
+### so memory depends on the chunk and sample sizes and not on how many days are analysed ###
+### Pass 1 collects the counts, summary statistics, correlations, value rankings and a reservoir sample, pass 2 bins the histograms ###
+### between the minimum and maximum found in pass 1. Parts (Parquet files) are scanned in a process pool and merged in order ###
+### On a single day the printed statistics match analyze_data, and while there are fewer filtered games than sample_size the figures do too ###
+def analyze_streaming(file_path: str = DEFAULT_SNAPSHOT_ROOT, dates: list = None, chunk_size: int = STREAM_CHUNK_SIZE,
+                      sample_size: int = STREAM_SAMPLE_SIZE, max_workers: int = None, seed: int = 0, report_path: str = "data/analysis_report.json") -> StreamState:
+    metrics = reset_metrics()
+    parts = stream_parts(file_path, dates)
+
+    with metrics.stage("statistics"):
+        ### Each part gets its own random stream so the sample doesn't depend on how the parts are spread over the workers ###
+        count = len(parts)
+        states = _map_parts(scan_part, max_workers, parts, [chunk_size] * count, [sample_size] * count, [[seed, number] for number in range(count)])
+        state = StreamState(sample_size)
+        for part_state in states:
+            state.merge(part_state)
+    metrics.add_rows("statistics", state.rows)
+
+    columns_before, columns_after = state.shape or (0, 0)
+    print((state.rows, columns_before))
+    print((state.rows, columns_after))
+    correlations = [state.discount_correlations.correlation(x, y) for x, y in DISCOUNT_CORRELATIONS]
+    print_statistics(state.rows, {name: state.counts[name] for name in ("rated", "clean", "free", "paid", "discounted")}, correlations,
+                     [ranking.result() for ranking in state.rankings], state.summary.summary())
+
+    with metrics.stage("histograms"):
+        ranges = state.ranges.summary().fillna({"min": 0.0, "max": 1.0}) #a column with no values gets empty bins
+        state.histograms = {column: BinnedCounts.between(ranges.at[column, "min"], ranges.at[column, "max"], bins) for column, bins in HISTOGRAM_BINS.items()}
+        edges = {column: histogram.edges for column, histogram in state.histograms.items()}
+        for part_histograms in _map_parts(bin_part, max_workers, parts, [edges] * len(parts), [chunk_size] * len(parts)):
+            for column, histogram in part_histograms.items():
+                state.histograms[column].merge(histogram)
+    metrics.add_rows("histograms", state.rows)
+
+    from figures import render_figures, streaming_figure_tasks
+
+    output_folder = "results"
+    os.makedirs(output_folder, exist_ok=True)
+    sample = state.sample.sample()
+    tiers = state.tiers.to_series().rename_axis("OC_Tier").reset_index(name="count")
+    tasks = streaming_figure_tasks(sample.drop(columns="Discounted"), sample["Discounted"].astype(bool), tiers, state.histograms["Release Year"].to_frame(),
+                                   state.histograms["Popularity_Factor"].to_frame(), state.correlations.matrix())
+    with metrics.stage("figures"):
+        rendered = render_figures(tasks, output_folder, max_workers=max_workers)
+    metrics.add_rows("figures", len(rendered))
+    write_run_report(report_path)
+    return state
@@ -0,0 +1,246 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#asyncio version of run(): scraping, Steam enrichment and OpenCritic enrichment run at the same time, joined by bounded queues
+#Each stage has its own number of workers and its own rate limiter, a full queue makes the stage feeding it wait (backpressure)
+#so the run takes about as long as the slowest stage instead of the sum of all three
+#The HTTP calls themselves still go through http_client/cache in a thread pool, asyncio only schedules them
+
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import http_client
+from cache import configure_cache
+from checkpoint import STATUS_FAILED, STATUS_NOT_FOUND, STATUS_OK, Checkpoint
+from data_pull import DEFAULT_CSV_PATH, GAME_COLUMNS, build_game_row, merge_opencritic_fields, opencritic_cost, opencritic_fields, opencritic_priority, request_steam, save_stage, scrape_stage
+from metrics import DEFAULT_REPORT_PATH, get_logger, get_metrics, reset_metrics, write_run_report
+from player_history import DEFAULT_HISTORY_PATH, PlayerHistory
+from quota import QuotaExhausted, get_quota_ledger
+from rate_limiter import opencritic_rate_limiter, steam_rate_limiter, steamcharts_rate_limiter
+from records import GameRecord
+from schema import DEFAULT_SNAPSHOT_ROOT
+
+log = get_logger("async_pipeline")
+
+### Rows a queue holds before the stage feeding it has to wait ###
+QUEUE_SIZE = 50
+
+### Workers per stage, the Steam workers mostly wait on the rate limiter so a few are enough ###
+STEAM_WORKERS = 4
+OPENCRITIC_WORKERS = 2
+
+### Put on a queue once per worker reading it, tells that worker the stage before it is finished ###
+DONE = object()
+
+
+### One stage of the pipeline: its queue in, its workers and the thread pool its blocking calls run on ###
+class Stage:
+    def __init__(self, name: str, loop, executor, workers: int = 1):
+        self.name = name
+        self.loop = loop
+        self.executor = executor
+        self.workers = workers
+        self.stopped = threading.Event()
+
+    ### Runs a blocking call in the thread pool, the time it takes is counted against this stage ###
+    async def call(self, function, *args):
+        def timed():
+            with get_metrics().stage(self.name):
+                return function(*args)
+        return await self.loop.run_in_executor(self.executor, timed)
+
+    ### Puts a row on the next queue, time spent waiting for room is the backpressure this stage felt ###
+    async def put(self, queue: asyncio.Queue, row) -> None:
+        if queue.full():
+            started = time.perf_counter()
+            await queue.put(row)
+            get_metrics().count("queue_wait_seconds", time.perf_counter() - started, stage=self.name)
+        else:
+            queue.put_nowait(row)
+        if row is not DONE:
+            get_metrics().add_rows(self.name, 1)
+
+    ### Runs a whole stage loop in a thread, if the pipeline is cancelled the thread stops at its next queue operation ###
+    async def run_in_thread(self, function, *args):
+        try:
+            return await self.loop.run_in_executor(self.executor, function, *args)
+        except asyncio.CancelledError:
+            self.stopped.set()
+            raise
+
+    ### Runs a queue operation on the event loop from one of the pool's threads and waits for it ###
+    def from_thread(self, coroutine):
+        if self.stopped.is_set():
+            coroutine.close()
+            raise asyncio.CancelledError()
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def close(self, queue: asyncio.Queue, readers: int) -> None:
+        for _ in range(readers):
+            await queue.put(DONE)
+
+
+### Stage 1: the SteamCharts scrape runs in one thread and hands each row to the event loop, waiting whenever the Steam queue is full ###
+async def scrape(stage: Stage, games: int, checkpoint: Checkpoint, history: PlayerHistory, limiter, outbox: asyncio.Queue, readers: int) -> None:
+    def produce():
+        chart_rows = scrape_stage(games, checkpoint, history, limiter)
+        while True:
+            #Only fetching and parsing counts as scrape time, not the wait for room on the queue
+            with get_metrics().stage(stage.name):
+                chart_row = next(chart_rows, DONE)
+            if chart_row is DONE:
+                return
+            stage.from_thread(stage.put(outbox, chart_row))
+
+    await stage.run_in_thread(produce)
+    await stage.close(outbox, readers)
+
+### Stage 2: each worker takes a chart row, skips it if the checkpoint already has it and otherwise asks the Steam Store, retrying through the limiter ###
+async def enrich_steam(stage: Stage, checkpoint: Checkpoint, limiter, retries: int, inbox: asyncio.Queue, outbox: asyncio.Queue, readers: int) -> None:
+    records = {
+        appid: GameRecord.from_row(record["row"]) if record["status"] == STATUS_OK else None
+        for appid, record in checkpoint.load().items() if record["status"] != STATUS_FAILED
+    }
+    log.info(f"Steam stage: {len(records)} appids already done.", extra={"resumed": len(records)})
+
+    async def worker():
+        while (chart_row := await inbox.get()) is not DONE:
+            appid = chart_row["appid"]
+            if appid in records:
+                record = records.pop(appid)
+                if record is not None:
+                    await stage.put(outbox, record.to_row(GAME_COLUMNS))
+                continue
+
+            for attempt in range(retries + 1):
+                game_info, retryable = await stage.call(request_steam, appid, None, limiter)
+                if not retryable:
+                    break
+                if attempt < retries: #the last failed attempt is logged as giving up below, not as a retry
+                    log.info(f"Retrying appid={appid} (attempt {attempt + 1}/{retries})...", extra={"appid": appid})
+            if retryable:
+                status = STATUS_FAILED
+                log.error(f"Gave up on appid: {appid} after {retries} retries...", extra={"appid": appid})
+            else:
+                status = STATUS_OK if game_info else STATUS_NOT_FOUND
+            get_metrics().count("steam_results", status=status)
+
+            row = build_game_row(appid, chart_row, game_info) if status == STATUS_OK else None
+            await stage.call(checkpoint.append, appid, row, status)
+            if row is not None:
+                await stage.put(outbox, row)
+
+    await asyncio.gather(*(worker() for _ in range(stage.workers)))
+    await stage.close(outbox, readers)
+
+### Stage 3: games already stored locally are enriched as they arrive, games that need quota are held back ###
+### and done in priority order once the Steam stage is finished, same as opencritic_stage ###
+### While today's quota covers every game still to come there is nothing to prioritise, so those games go out right away too ###
+async def enrich_opencritic(stage: Stage, checkpoint: Checkpoint, limiter, max_games: int, inbox: asyncio.Queue, outbox: asyncio.Queue) -> None:
+    records = {appid: record for appid, record in checkpoint.load().items() if record["status"] == STATUS_OK}
+    needs_quota = []
+    seen = 0
+    exhausted = False
+
+    async def enrich(row):
+        nonlocal exhausted
+        found = None
+        if not exhausted:
+            name = row["game name"]
+            log.info(f"Currently searching OpenCritic for {name}", extra={"game": name, "appid": row["appid"]})
+            try:
+                found = await stage.call(opencritic_fields, name, row["appid"], limiter)
+            except QuotaExhausted as error:
+                if not exhausted:
+                    log.warning(f"{error}, deferring the rest of the games to the next run.")
+                exhausted = True
+            else:
+                await stage.call(checkpoint.append, row["appid"], found, STATUS_OK if found else STATUS_FAILED)
+        await stage.put(outbox, merge_opencritic_fields(row, found))
+
+    def quota_to_spare() -> bool:
+        if max_games is None:
+            return False
+        #At most a search and a reviews request per game
+        return get_quota_ledger().remaining() >= 2 * (max_games - seen + 1 + len(needs_quota))
+
+    async def worker():
+        nonlocal seen
+        while (row := await inbox.get()) is not DONE:
+            seen += 1
+            record = records.pop(row["appid"], None)
+            if max_games is not None and seen > max_games:
+                await stage.put(outbox, merge_opencritic_fields(row))
+            elif record is not None:
+                await stage.put(outbox, merge_opencritic_fields(row, record["row"]))
+            elif quota_to_spare() or await stage.call(opencritic_cost, row["game name"], row["appid"]) == 0:
+                await enrich(row)
+            else:
+                needs_quota.append((opencritic_priority(row), GameRecord.from_row(row)))
+
+    async def quota_worker(records):
+        for _, record in records:
+            await enrich(record.to_row())
+
+    await asyncio.gather(*(worker() for _ in range(stage.workers)))
+
+    needs_quota.sort(key=lambda item: item[0], reverse=True)
+    log.info(f"{len(needs_quota)} games need OpenCritic requests, {get_quota_ledger().remaining()} requests left today.", extra={"needs_quota": len(needs_quota)})
+    #Worker i takes every stage.workers-th game so the highest priority games still go out first
+    await asyncio.gather(*(quota_worker(needs_quota[i::stage.workers]) for i in range(stage.workers)))
+    await stage.close(outbox, 1)
+
+### Stage 4: the sinks run in a thread that pulls rows off the last queue ###
+async def save(stage: Stage, snapshot_root: str, csv_path: str, inbox: asyncio.Queue) -> int:
+    def rows():
+        while (row := stage.from_thread(inbox.get())) is not DONE:
+            yield row
+
+    return await stage.run_in_thread(save_stage, rows(), snapshot_root, csv_path)
+
+async def pipeline(games: int, steam_workers: int, opencritic_workers: int, queue_size: int, checkpoints: dict, history: PlayerHistory,
+                   snapshot_root: str, csv_path: str, executor: ThreadPoolExecutor) -> int:
+    loop = asyncio.get_running_loop()
+    scraping = Stage("scrape", loop, executor)
+    steam = Stage("steam", loop, executor, steam_workers)
+    opencritic = Stage("opencritic", loop, executor, opencritic_workers)
+    saving = Stage("save", loop, executor)
+
+    chart_rows = asyncio.Queue(maxsize=queue_size)
+    game_rows = asyncio.Queue(maxsize=queue_size)
+    enriched_rows = asyncio.Queue(maxsize=queue_size)
+    results = await asyncio.gather(
+        scrape(scraping, games, checkpoints["scrape"], history, steamcharts_rate_limiter(), chart_rows, steam.workers),
+        enrich_steam(steam, checkpoints["steam"], steam_rate_limiter(), 2, chart_rows, game_rows, opencritic.workers),
+        enrich_opencritic(opencritic, checkpoints["opencritic"], opencritic_rate_limiter(), games, game_rows, enriched_rows),
+        save(saving, snapshot_root, csv_path, enriched_rows),
+    )
+    return results[-1]
+
+### Same inputs, checkpoints and outputs as run(), so either one can resume a run the other started ###
+def run_async(games: int = 100, steam_workers: int = STEAM_WORKERS, opencritic_workers: int = OPENCRITIC_WORKERS, queue_size: int = QUEUE_SIZE,
+              offline: bool = False, checkpoint_dir: str = "data/checkpoints", resume: bool = True, snapshot_root: str = DEFAULT_SNAPSHOT_ROOT,
+              history_path: str = DEFAULT_HISTORY_PATH, report_path: str = DEFAULT_REPORT_PATH, prometheus_path: str = None,
+              csv_path: str = DEFAULT_CSV_PATH) -> int:
+    configure_cache(offline=offline)
+    metrics = reset_metrics()
+    checkpoints = {stage: Checkpoint(os.path.join(checkpoint_dir, f"{stage}.jsonl")) for stage in ("scrape", "steam", "opencritic")}
+    if not resume:
+        for checkpoint in checkpoints.values():
+            checkpoint.clear()
+
+    history = PlayerHistory(history_path)
+    http_client.configure_pool("steam", steam_workers)
+    http_client.configure_pool("opencritic", opencritic_workers)
+    ### One thread for the scrape, one per Steam and OpenCritic worker and one for the sinks ###
+    ### The pool outlives the event loop so a failed run cancels the waiting stages before the pool waits on their threads ###
+    with metrics.stage("pipeline"), ThreadPoolExecutor(max_workers=steam_workers + opencritic_workers + 2, thread_name_prefix="pipeline") as executor:
+        rows = asyncio.run(pipeline(games, steam_workers, opencritic_workers, queue_size, checkpoints, history, snapshot_root, csv_path, executor))
+    history.close()
+
+    for checkpoint in checkpoints.values():
+        checkpoint.clear()
+    write_run_report(report_path, prometheus_path)
+    return rows
@@ -0,0 +1,173 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#On-disk cache for HTTP responses from SteamCharts, the Steam Store API and OpenCritic
+#Responses are stored zlib compressed in SQLite so repeat runs don't spend requests (or OpenCritic quota) on data we already have
+
+
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import urlencode
+
+from metrics import get_metrics
+
+### How long a cached response stays fresh for each source (seconds) ###
+### Player counts move constantly, store pages change daily at most, OpenCritic IDs basically never change ###
+DEFAULT_TTLS = {
+    "steamcharts": 60 * 60,
+    "steam": 24 * 60 * 60,
+    "steam_applist": 24 * 60 * 60,
+    "steam_prices": 60 * 60,
+    "opencritic_search": 30 * 24 * 60 * 60,
+    "opencritic_game": 7 * 24 * 60 * 60,
+}
+
+DEFAULT_CACHE_PATH = "data/http_cache.sqlite"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+### Cache hits only note their access time in memory, the LRU order on disk is updated this many hits at a time (and before any eviction) ###
+ACCESS_BATCH_SIZE = 100
+
+
+### Builds a stable key for a request, sorted params so the same request always maps to the same row ###
+def cache_key(url: str, params: dict = None) -> str:
+    if not params:
+        return url
+    return f"{url}?{urlencode(sorted(params.items()))}"
+
+
+### SQLite backed response cache with per-source TTLs and size bounded LRU eviction ###
+class ResponseCache:
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttls: dict = None, max_bytes: int = DEFAULT_MAX_BYTES, offline: bool = False):
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self.accessed = {} #key -> last hit not written yet
+        self.lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+            """
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self.connection.commit()
+        ### Running total of the stored bytes, kept up to date by put/evict/clear so a put never sums the whole table ###
+        self.total_bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    ### Returns the cached text, or None if missing/expired. Offline mode ignores the TTL and serves anything stored ###
+    def get(self, source: str, key: str):
+        with self.lock:
+            row = self.connection.execute("SELECT body, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                get_metrics().count("cache_misses", source=source)
+                return None
+            body, created = row
+            ttl = self.ttls.get(source)
+            if not self.offline and ttl is not None and time.time() - created > ttl:
+                self.misses += 1
+                get_metrics().count("cache_misses", source=source)
+                return None
+            self.accessed[key] = time.time()
+            if len(self.accessed) >= ACCESS_BATCH_SIZE:
+                self._write_accessed()
+                self.connection.commit()
+            self.hits += 1
+            get_metrics().count("cache_hits", source=source)
+        return zlib.decompress(body).decode("utf-8")
+
+    ### True if get() would return something, without touching the hit/miss counters or the LRU order ###
+    def has(self, source: str, key: str) -> bool:
+        with self.lock:
+            row = self.connection.execute("SELECT created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return False
+        ttl = self.ttls.get(source)
+        return self.offline or ttl is None or time.time() - row[0] <= ttl
+
+    ### When a stored response was fetched (unix time), None if nothing is stored under the key ###
+    def fetched_at(self, key: str) -> float:
+        with self.lock:
+            row = self.connection.execute("SELECT created FROM responses WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    ### Stores a response body and evicts the least recently used rows if the cache is over its size limit ###
+    def put(self, source: str, key: str, text: str) -> None:
+        body = zlib.compress(text.encode("utf-8"))
+        now = time.time()
+        with self.lock:
+            replaced = self.connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, source, body, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, source, body, len(body), now, now),
+            )
+            self.accessed.pop(key, None)
+            self.total_bytes += len(body) - (replaced[0] if replaced else 0)
+            self._evict()
+            self.connection.commit()
+
+    ### Writes the access times of the hits since the last batch ###
+    def _write_accessed(self) -> None:
+        if self.accessed:
+            self.connection.executemany("UPDATE responses SET accessed = ? WHERE key = ?", [(accessed, key) for key, accessed in self.accessed.items()])
+            self.accessed = {}
+
+    def _evict(self) -> None:
+        if self.total_bytes <= self.max_bytes:
+            return
+        self._write_accessed()
+        rows = self.connection.execute("SELECT key, size FROM responses ORDER BY accessed ASC").fetchall()
+        for key, size in rows:
+            if self.total_bytes <= self.max_bytes:
+                break
+            self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.total_bytes -= size
+
+    def clear(self) -> None:
+        with self.lock:
+            self.connection.execute("DELETE FROM responses")
+            self.connection.commit()
+            self.accessed = {}
+            self.total_bytes = 0
+
+    def close(self) -> None:
+        with self.lock:
+            self._write_accessed()
+            self.connection.commit()
+            self.connection.close()
+
+
+### One cache is shared by every fetcher in the process ###
+_cache = None
+
+
+def configure_cache(path: str = DEFAULT_CACHE_PATH, ttls: dict = None, max_bytes: int = DEFAULT_MAX_BYTES, offline: bool = False) -> ResponseCache:
+    global _cache
+    if _cache is not None:
+        _cache.close()
+    _cache = ResponseCache(path, ttls=ttls, max_bytes=max_bytes, offline=offline)
+    return _cache
+
+
+def get_cache() -> ResponseCache:
+    global _cache
+    if _cache is None:
+        _cache = ResponseCache()
+    return _cache
@@ -0,0 +1,174 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#Full catalog mode: every appid in Steam's app list goes through the Steam Store enrichment, not only the SteamCharts top pages
+#The list is split in to shards (appid % shards) so several processes/machines can each take one, and every shard checkpoints and resumes on its own
+
+
+#Source - Steam Web API app list, no key needed
+# https://api.steampowered.com/ISteamApps/GetAppList/v2/
+
+import datetime
+import json
+import os
+import time
+from array import array
+
+import requests
+
+import http_client
+from cache import configure_cache, get_cache
+from checkpoint import STATUS_NOT_FOUND, STATUS_OK, Checkpoint
+from data_pull import GAME_COLUMNS, build_game_row, iter_steam_results
+from metrics import get_logger, get_metrics, reset_metrics, write_run_report
+from rate_limiter import steam_rate_limiter
+from schema import snapshot_path
+from sinks import CsvSink, ParquetSink
+
+SteamAppList_URL = "https://api.steampowered.com/ISteamApps/GetAppList/v2/"
+
+DEFAULT_CATALOG_DIR = "data/catalog"
+
+### Catalog snapshots are kept apart from the top games snapshots, catalog rows have no SteamCharts player counts ###
+DEFAULT_CATALOG_SNAPSHOT_ROOT = "data/catalog_snapshots"
+
+log = get_logger("catalog")
+
+
+### Retrieves Steam's app list and returns the sorted unique appids as a compact int array (4 bytes an appid instead of a dict per app) ###
+def fetch_app_list(url: str = SteamAppList_URL) -> array:
+    cache = get_cache()
+    text = cache.get("steam_applist", url)
+    if text is None:
+        if cache.offline:
+            raise RuntimeError("The Steam app list is not cached, it can't be retrieved in offline mode.")
+        response = http_client.get(url, pool="steam")
+        response.raise_for_status()
+        text = response.text
+        cache.put("steam_applist", url, text)
+
+    apps = json.loads(text).get("applist", {}).get("apps", [])
+    appids = array("i", sorted({app["appid"] for app in apps if isinstance(app.get("appid"), int)}))
+    return appids
+
+### Appids that belong to one shard, every appid lands in exactly one of the shards ###
+def shard_appids(appids, shard: int = 0, shards: int = 1):
+    if not 0 <= shard < shards:
+        raise ValueError(f"Shard {shard} is out of range for {shards} shards")
+    for appid in appids:
+        if appid % shards == shard:
+            yield appid
+
+
+### Progress and throughput for a long run, printed at most every `every` seconds ###
+class Progress:
+    def __init__(self, total: int, label: str = "catalog", every: float = 30.0, done: int = 0):
+        self.total = total
+        self.label = label
+        self.every = every
+        self.resumed = done
+        self.counts = {}
+        self.started = time.monotonic()
+        self.last_report = self.started
+
+    @property
+    def done(self) -> int:
+        return self.resumed + sum(self.counts.values())
+
+    ### Appids finished by this process per second, appids skipped on resume don't count ###
+    def rate(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return sum(self.counts.values()) / elapsed if elapsed > 0 else 0.0
+
+    def update(self, status: str) -> None:
+        self.counts[status] = self.counts.get(status, 0) + 1
+        if time.monotonic() - self.last_report >= self.every:
+            self.report()
+
+    def report(self) -> None:
+        self.last_report = time.monotonic()
+        rate = self.rate()
+        remaining = self.total - self.done
+        eta = datetime.timedelta(seconds=round(remaining / rate)) if rate > 0 else "unknown"
+        percent = 100 * self.done / self.total if self.total else 100.0
+        statuses = ", ".join(f"{status}={count}" for status, count in sorted(self.counts.items()))
+        log.info(f"[{self.label}] {self.done}/{self.total} ({percent:.1f}%) {statuses or 'nothing new'} | {rate:.2f} appids/s, ETA {eta}",
+                 extra={"done": self.done, "total": self.total, "appids_per_second": round(rate, 3), **self.counts})
+
+
+### A catalog row has the same columns as a top games row, the player counts are left empty ###
+def catalog_row(appid: int, game_info: dict) -> dict:
+    chart_row = {"appid": appid, "name": None, "current_players": None, "peak_players": None}
+    return build_game_row(appid, chart_row, game_info)
+
+### Only games are kept, the app list also holds DLC, soundtracks, tools and videos ###
+def is_game(game_info: dict) -> bool:
+    return game_info.get("type", "game") == "game"
+
+### Enriches one shard of the catalog through the Steam Store, every appid is checkpointed as soon as it finishes ###
+### Memory stays bounded: the appids are a compact array, only the appids done are kept for resuming and rows go straight to disk ###
+def fetch_catalog(appids, checkpoint: Checkpoint, shard: int = 0, shards: int = 1, max_workers: int = 4, retries: int = 2, limiter=None,
+                  url: str = None, limit: int = None, every: float = 30.0) -> Progress:
+    done = checkpoint.completed()
+    shard_total = sum(1 for _ in shard_appids(appids, shard, shards))
+    total = min(shard_total, limit) if limit is not None else shard_total
+    progress = Progress(total, label=f"catalog shard {shard + 1}/{shards}", every=every, done=min(len(done), total))
+    log.info(f"Catalog shard {shard + 1}/{shards}: {shard_total} appids, {len(done)} already done.", extra={"shard": shard, "resumed": len(done)})
+
+    def todo():
+        left = total - progress.resumed
+        for appid in shard_appids(appids, shard, shards):
+            if left <= 0:
+                return
+            if appid not in done:
+                left -= 1
+                yield appid
+
+    results = iter_steam_results(todo(), max_workers, retries, limiter or steam_rate_limiter(shards=shards), url)
+    for appid, game_info, status in get_metrics().timed("catalog_steam", results):
+        if status == STATUS_OK and not is_game(game_info):
+            status = STATUS_NOT_FOUND
+        checkpoint.append(appid, catalog_row(appid, game_info) if status == STATUS_OK else None, status)
+        progress.update(status)
+    progress.report()
+    return progress
+
+### Streams the finished rows of a checkpoint in to the sinks without loading the whole checkpoint ###
+def export_checkpoint(checkpoint: Checkpoint, sinks: list) -> int:
+    exported = set()
+    for record in checkpoint.iter_records():
+        if record["status"] != STATUS_OK or record["appid"] in exported:
+            continue
+        exported.add(record["appid"])
+        for sink in sinks:
+            sink.write_row(record["row"])
+    return len(exported)
+
+### Catalog mode entry point: app list -> this shard's appids -> Steam Store -> csv and Parquet part for the shard ###
+### A crashed run is resumed from the shard's checkpoint, the checkpoint is only removed once the output files are written ###
+### Each shard gets 1/shards of Steam's budget so all of them can run at once from one IP, rate (requests a second) overrides that ###
+def run_catalog(shard: int = 0, shards: int = 1, max_workers: int = 4, limit: int = None, offline: bool = False, resume: bool = True,
+                app_list_url: str = SteamAppList_URL, store_url: str = None, catalog_dir: str = DEFAULT_CATALOG_DIR, checkpoint_dir: str = "data/checkpoints",
+                snapshot_root: str = DEFAULT_CATALOG_SNAPSHOT_ROOT, rate: float = None):
+    configure_cache(offline=offline)
+    reset_metrics()
+    checkpoint = Checkpoint(os.path.join(checkpoint_dir, f"catalog-{shard}-of-{shards}.jsonl"))
+    if not resume:
+        checkpoint.clear()
+
+    try:
+        appids = fetch_app_list(app_list_url)
+    except (requests.RequestException, ValueError, RuntimeError) as error:
+        log.error(f"Error retrieving the Steam app list: {error}")
+        return None
+    log.info(f"Steam app list has {len(appids)} appids.", extra={"appids": len(appids)})
+
+    limiter = steam_rate_limiter(shards=shards, rate=rate)
+    log.info(f"Shard {shard + 1}/{shards} sends at most {limiter.rate:.2f} Steam Store requests a second.", extra={"shard": shard, "rate": limiter.rate})
+    progress = fetch_catalog(appids, checkpoint, shard, shards, max_workers=max_workers, limiter=limiter, url=store_url, limit=limit)
+
+    csv_path = os.path.join(catalog_dir, f"steam_catalog-{shard}-of-{shards}.csv")
+    parquet_path = os.path.join(snapshot_path(snapshot_root), f"part-{shard}.parquet")
+    with get_metrics().stage("save"), CsvSink(csv_path, columns=GAME_COLUMNS) as csv_sink, ParquetSink(parquet_path, columns=GAME_COLUMNS) as parquet_sink:
+        export_checkpoint(checkpoint, [csv_sink, parquet_sink])
+    checkpoint.clear()
+    write_run_report(os.path.join(catalog_dir, f"run_report-{shard}-of-{shards}.json"))
+    return progress
@@ -0,0 +1,55 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#Append-only JSONL checkpoints so a crashed run can pick up where it stopped
+
+
+import json
+import os
+
+### Each line is {"appid": ..., "status": ..., "row": {...}}, later lines for the same appid win ###
+STATUS_OK = "ok"
+STATUS_NOT_FOUND = "not_found"
+STATUS_FAILED = "failed"
+
+
+class Checkpoint:
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    ### Streams the records in the order they were written, a half written last line from a crash is skipped ###
+    def iter_records(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                yield record
+
+    ### Reads every record keyed by appid ###
+    def load(self) -> dict:
+        return {record["appid"]: record for record in self.iter_records()}
+
+    ### Appids that don't need to be redone, failed ones are left out so they get retried ###
+    ### Only the latest status of each appid is kept, so a large checkpoint can be resumed without loading its rows ###
+    def completed(self) -> set:
+        statuses = {}
+        for record in self.iter_records():
+            statuses[record["appid"]] = record["status"]
+        return {appid for appid, status in statuses.items() if status != STATUS_FAILED}
+
+    ### Writes one record and flushes it straight to disk so nothing is lost if the process dies ###
+    ### Timestamps in a row (e.g. Steam Updated) are written as text ###
+    def append(self, appid: int, row: dict = None, status: str = STATUS_OK) -> None:
+        line = json.dumps({"appid": appid, "status": status, "row": row}, default=str)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def clear(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -16,23 +16,55 @@
 # https://store.steampowered.com/api/appdetails?appids=%3CAPPID%3E&cc=us&l=en
 
 import requests
+import datetime
+import json
 import math
-import re
 import pandas as pd
 import os
 import time
-
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-
-from bs4 import BeautifulSoup
+import itertools
+import heapq
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache
+
+
+from cache import cache_key, configure_cache, get_cache
+import http_client
+from checkpoint import STATUS_FAILED, STATUS_NOT_FOUND, STATUS_OK, Checkpoint
+from opencritic_index import CONFIDENT_MATCH, get_opencritic_index
+from metrics import DEFAULT_REPORT_PATH, get_logger, get_metrics, reset_metrics, write_run_report
+from player_history import DEFAULT_HISTORY_PATH, PlayerHistory
+from quota import QuotaExhausted, get_quota_ledger
+from records import GameRecord, records_to_frame
+from rate_limiter import TokenBucket, steam_rate_limiter
+from schema import DEFAULT_SNAPSHOT_ROOT, read_snapshots, snapshot_dates, snapshot_path, write_snapshot
+from sinks import CsvSink, ParquetSink
+from steamcharts_parser import parse_top_table
+
+log = get_logger("data_pull")
 
 ### Website URLs ###
 SteamCharts_URL_base = "https://steamcharts.com/top/p.{page}"
 SteamStore_URL = "https://store.steampowered.com/api/appdetails"
 OpenCritic_URL = "https://opencritic-api.p.rapidapi.com"
 
+### Where the enriched dataset's csv is written, the Parquet snapshots go to DEFAULT_SNAPSHOT_ROOT ###
+DEFAULT_CSV_PATH = "data/most_popular_steam_games.csv"
+
+### Fields requested from appdetails, leaves out the long descriptions, screenshots and movies that are never read ###
+STEAM_DETAIL_FILTERS = "basic,price_overview,metacritic,recommendations,release_date"
+
+### appdetails fields build_game_row/is_game read, everything else in the answer (descriptions, requirements, packages...) is dropped as soon as it is parsed ###
+STEAM_DETAIL_FIELDS = ("type", "name", "is_free", "price_overview", "metacritic", "recommendations", "release_date")
+
+### Appids per price request ###
+STEAM_PRICE_BATCH_SIZE = 100
+
+### Days before a refresh fetches a game's Steam Store or OpenCritic data again, OpenCritic scores change a lot less often than store pages ###
+STEAM_MAX_AGE_DAYS = 7
+OPENCRITIC_MAX_AGE_DAYS = 30
+
 ### Retrieves API key for RAPIDAPI for Opencritic API in the 'key.txt' ###
 def retrieve_key(filename="key.txt"):
     try:
@@ -44,19 +76,13 @@ def retrieve_key(filename="key.txt"):
         raise ValueError("Key is empty")
     return key
 
-### Clean and Strip Numbers from Web Scraping ###
-def to_int(text: str):
-    text = text.replace(",", "").strip()
-    try:
-        return int(text)
-    except:
-        return None
-
 ### Scrape Data from SteamCharts ###
-def most_popular_games_steamcharts_scrape(games: int = 100):
-    headers = {"User-Agent": "Mozilla/5.0"}
-    appids = []
-    retrieved_data = []
+### Generator, yields each chart row as soon as its page is parsed so the Steam stage can start after the first page ###
+### parser picks the HTML backend (selectolax, lxml or bs4), "auto" uses the fastest one installed ###
+### An optional limiter spaces out the page requests, cached pages don't wait on it ###
+### Each chart row carries scraped_at, when its page was fetched, so a page served from the cache isn't counted as a new sample ###
+def iter_steamcharts_rows(games: int = 100, parser: str = "auto", limiter: TokenBucket = None):
+    appids = set() #set so checking for repeats across pages stays O(1)
     games_on_page = 25 #games per page on SteamCharts
     pages = math.ceil(games / games_on_page)  # uses math library to effectively round up to nearest integer to ensure enough pages are checked
 
@@ -64,140 +90,369 @@ def most_popular_games_steamcharts_scrape(games: int = 100):
         if len(appids) >= games:
             break
         url = SteamCharts_URL_base.format(page=page)  # The website has 25 games per page, this modifies the end of the URL to swap between pages and collect more games
-        print(f"Taking a closer look at SteamCharts page {page}: {url}")
-        response = requests.get(url, headers=headers, timeout=100)
-
-        if response.status_code != 200:
-            print(f"Error fetching SteamCharts page {page}.")
-            break
-
-        soup = BeautifulSoup(response.text, "html.parser")
-        table = soup.find("table")
-
-        # Iterate over each game row in the table
-        for table_row in table.find_all("tr"):
-            table_data = table_row.find_all("td")
-            # There should be 6 columns of data for the table, Rank / Name / Current Count / Last30 Count / Peak Count / HoursPlayed in last 30d
-            if len(table_data) < 6:
-                continue
-
-            ### Extract the appid and the name
-            Identifier = table_data[1].find("a")
-            if not Identifier:
-                continue
+        log.info(f"Taking a closer look at SteamCharts page {page}: {url}", extra={"page": page})
+        cache = get_cache()
+        html = cache.get("steamcharts", url)
+        scraped_at = cache.fetched_at(url) if html is not None else time.time()
+        if html is None:
+            if cache.offline:
+                log.warning(f"SteamCharts page {page} is not cached, stopping in offline mode.", extra={"page": page})
+                break
+            if limiter is not None:
+                limiter.acquire()
+            try:
+                response = http_client.get(url, pool="steamcharts")
+            except requests.RequestException as error:
+                log.error(f"Error fetching SteamCharts page {page}: {error}", extra={"page": page})
+                break
 
-            href = Identifier.get("href", "")
-            chunk = re.search(r"/app/(\d+)", href)
-            if not chunk:
+            if response.status_code != 200:
+                log.error(f"Error fetching SteamCharts page {page}.", extra={"page": page, "status": response.status_code})
+                break
+            html = response.text
+            cache.put("steamcharts", url, html)
+
+        # Only the top games table is parsed, each row is already reduced to appid / name / player counts
+        with get_metrics().stage("parse_steamcharts"):
+            chart_rows = parse_top_table(html, backend=parser)
+        get_metrics().add_rows("parse_steamcharts", len(chart_rows))
+        for chart_row in chart_rows:
+            if chart_row["appid"] in appids:
                 continue
 
-            appid = int(chunk.group(1))
-            if appid in appids:
-                continue
-
-            ### Extract and strip the player counts
-            current_players = to_int(table_data[2].get_text(strip=True))
-            peak_players = to_int(table_data[4].get_text(strip=True))
-
-            appids.append(appid)
-            retrieved_data.append(
-                {
-                    "appid": appid,
-                    "name": Identifier.get_text(strip=True),
-                    "current_players": current_players,
-                    "peak_players": peak_players,
-                }
-            )
+            appids.add(chart_row["appid"])
+            chart_row["scraped_at"] = int(scraped_at)
+            yield chart_row
 
             if len(appids) >= games:
                 break
 
-        if not retrieved_data:
+        if not appids:
             break
 
+### Same scrape as a list of appids and a list of chart rows ###
+def most_popular_games_steamcharts_scrape(games: int = 100, parser: str = "auto"):
+    retrieved_data = list(get_metrics().timed("steamcharts", iter_steamcharts_rows(games, parser=parser)))
+    appids = [chart_row["appid"] for chart_row in retrieved_data]
     return appids[:games], retrieved_data
 
 
 ### Retrieve Game Data from Steam API via appids ###
-def retrieve_steam(appid: int) ->  dict:
-    params = {"appids": appid, "cc": "us", "l": "en"} #Sets requests for specific game via appid in US currency and English language
+### Returns (data, retryable) so callers can tell a missing game apart from a throttled or failed request ###
+### Cached responses skip the limiter entirely, only real network calls spend a token ###
+### The fetch engine does its own retries through the rate limiter, so the client is only asked for one attempt here ###
+def request_steam(appid: int, url: str = None, limiter: TokenBucket = None) -> tuple:
+    params = {"appids": appid, "cc": "us", "l": "en", "filters": STEAM_DETAIL_FILTERS} #Sets requests for specific game via appid in US currency and English language
+    url = url or SteamStore_URL
+    cache = get_cache()
+    key = cache_key(url, params)
+    text = cache.get("steam", key)
+    fresh = text is None
+    if fresh:
+        if cache.offline:
+            return None, True
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            response = http_client.get(url, pool="steam", params=params, retries=0)
+        except requests.RequestException:
+            return None, True
+        if response.status_code == 429 or response.status_code >= 500:
+            return None, True
+        if response.status_code != 200:
+            return None, False
+        text = response.text
     try:
-        response = requests.get(SteamStore_URL, params=params, timeout=100)
+        question = json.loads(text)
+    except ValueError:
+        return None, True
+    if fresh:
+        cache.put("steam", key, text)
+    if not question:
+        return None, False
+    answer = question.get(str(appid), {})
+    if not answer.get("success"):
+        return None, False
+    data = answer.get("data") or {}
+    return {key: data[key] for key in STEAM_DETAIL_FIELDS if key in data}, False #Return data of game from store given appid
+
+def retrieve_steam(appid: int) ->  dict:
+    game_info, _ = request_steam(appid)
+    return game_info
+
+### Prices for a batch of appids in one request, appdetails only accepts several appids at once with filters=price_overview ###
+### Returns ({appid: price_overview}, retryable), appids missing from the dict weren't found and free games map to None ###
+### (None, False) means the endpoint refused the batch, the caller then falls back to one appid per request ###
+### region is the store's country code, prices come back in that store's currency ###
+def request_steam_prices(appids: list, url: str = None, limiter: TokenBucket = None, region: str = "us") -> tuple:
+    params = {"appids": ",".join(str(appid) for appid in appids), "cc": region, "l": "en", "filters": "price_overview"}
+    url = url or SteamStore_URL
+    cache = get_cache()
+    key = cache_key(url, params)
+    text = cache.get("steam_prices", key)
+    fresh = text is None
+    if fresh:
+        if cache.offline:
+            return None, True
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            response = http_client.get(url, pool="steam", params=params, retries=0)
+        except requests.RequestException:
+            return None, True
+        if response.status_code == 429 or response.status_code >= 500:
+            return None, True
         if response.status_code != 200:
-            return None
-        question = response.json()
-        answer = question.get(str(appid), {})
+            return (None, False) if len(appids) > 1 else ({}, False)
+        text = response.text
+    try:
+        question = json.loads(text)
+    except ValueError:
+        return None, True
+    if not isinstance(question, dict):
+        return (None, False) if len(appids) > 1 else ({}, False)
+    if fresh:
+        cache.put("steam_prices", key, text)
+
+    prices = {}
+    for appid in appids:
+        answer = question.get(str(appid)) or {}
         if not answer.get("success"):
-            return None
-        return answer.get("data", {}) #Return data of game from store given appid
-    except Exception:
+            continue
+        data = answer.get("data")
+        prices[appid] = data.get("price_overview") if isinstance(data, dict) else None #free games come back with an empty list
+    return prices, False
+
+### Streams appids through request_steam_prices in batches for every region, yields (appid, region, price_overview, status) ###
+### Each batch of appids is sent to all the regions before the next batch is read, so the appids are only read once ###
+### A refused batch is split in to single appid requests and every later batch is sent one appid at a time too ###
+def iter_regional_price_results(appids, regions: tuple = ("us",), batch_size: int = STEAM_PRICE_BATCH_SIZE, max_workers: int = 2, retries: int = 2,
+                                limiter: TokenBucket = None, url: str = None):
+    limiter = limiter or steam_rate_limiter()
+    http_client.configure_pool("steam", max_workers)
+    appids = iter(appids)
+    queued = deque() #(region, batch) pairs waiting to be sent
+    retry_queue = deque()
+    attempts = {}
+    in_flight = {}
+    requests_sent = 0
+
+    def next_batch():
+        if not queued:
+            batch = tuple(itertools.islice(appids, batch_size))
+            queued.extend((region, batch) for region in regions if batch)
+        if queued:
+            return queued.popleft()
+        if retry_queue:
+            return retry_queue.popleft()
         return None
 
-### Combines the SteamCharts and Steam API data together in to a dataset within Pandas ###
-def collect_top_steamcharts_games(games: int = 100) -> pd.DataFrame:
-
-    appids, chart_rows = most_popular_games_steamcharts_scrape(games)
-    game_rows = []
-
-    for i, appid in enumerate(appids, start=1):
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        def fill():
+            nonlocal requests_sent
+            while len(in_flight) < max_workers * 2:
+                task = next_batch()
+                if task is None:
+                    return
+                requests_sent += 1
+                region, batch = task
+                in_flight[pool.submit(request_steam_prices, batch, url, limiter, region)] = task
+
+        fill()
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                task = in_flight.pop(future)
+                region, batch = task
+                prices, retryable = future.result()
+                if prices is None and not retryable:
+                    log.warning(f"Steam refused a batch of {len(batch)} appids, falling back to single appid requests...", extra={"batch_size": len(batch), "region": region})
+                    batch_size = 1
+                    retry_queue.extend((region, (appid,)) for appid in batch)
+                    continue
+                if retryable:
+                    attempts[task] = attempts.get(task, 0) + 1
+                    if attempts[task] <= retries:
+                        retry_queue.append(task)
+                        continue
+                    log.error(f"Gave up on the {region} prices of {len(batch)} appids after {retries} retries...", extra={"batch_size": len(batch), "region": region})
+                    for appid in batch:
+                        yield appid, region, None, STATUS_FAILED
+                    continue
+                attempts.pop(task, None)
+                for appid in batch:
+                    if appid in prices:
+                        yield appid, region, prices[appid], STATUS_OK
+                    else:
+                        yield appid, region, None, STATUS_NOT_FOUND
+            fill()
+    log.info(f"Fetched prices for {len(regions)} regions with {requests_sent} Steam Store requests.", extra={"requests": requests_sent, "regions": len(regions)})
+
+### Prices from a single region, yields (appid, price_overview, status) ###
+def iter_price_results(appids, batch_size: int = STEAM_PRICE_BATCH_SIZE, max_workers: int = 2, retries: int = 2, limiter: TokenBucket = None, url: str = None,
+                       region: str = "us"):
+    for appid, _, price_info, status in iter_regional_price_results(appids, (region,), batch_size, max_workers, retries, limiter, url):
+        yield appid, price_info, status
+
+### Fetches appdetails for a stream of appids, every request waits on the shared token bucket ###
+### Yields (appid, game_info, status) as each appid finishes, at most 2 * max_workers requests are in flight so the input is read lazily ###
+### Failed requests are queued behind the rest of the input and wait on the same limiter, retries never add to the request rate ###
+def iter_steam_results(appids, max_workers: int = 4, retries: int = 2, limiter: TokenBucket = None, url: str = None):
+    limiter = limiter or steam_rate_limiter()
+    http_client.configure_pool("steam", max_workers) #one keep-alive connection per worker
+    appids = iter(appids)
+    retry_queue = deque()
+    attempts = {}
+    in_flight = {}
+
+    def next_appid():
+        for appid in appids:
+            return appid
+        if retry_queue:
+            return retry_queue.popleft()
+        return None
 
-        print(f"[{i}/{len(appids)}] Retrieving appid={appid}...")
-        game_info = retrieve_steam(appid)
-        if not game_info:
-            print(f"Looks like the appid: {appid}, was not found in Steam...")
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        def fill():
+            while len(in_flight) < max_workers * 2:
+                appid = next_appid()
+                if appid is None:
+                    return
+                in_flight[pool.submit(request_steam, appid, url, limiter)] = appid
+
+        fill()
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                appid = in_flight.pop(future)
+                game_info, retryable = future.result()
+                if retryable:
+                    attempts[appid] = attempts.get(appid, 0) + 1
+                    if attempts[appid] <= retries:
+                        log.info(f"Retrying appid={appid} after the rest of the queue (attempt {attempts[appid]}/{retries})...", extra={"appid": appid})
+                        retry_queue.append(appid)
+                        continue
+                    log.error(f"Gave up on appid: {appid} after {retries} retries...", extra={"appid": appid})
+                    get_metrics().count("steam_results", status=STATUS_FAILED)
+                    yield appid, None, STATUS_FAILED
+                    continue
+                attempts.pop(appid, None)
+                status = STATUS_OK if game_info else STATUS_NOT_FOUND
+                get_metrics().count("steam_results", status=status)
+                yield appid, game_info, status
+            fill()
+
+### Streams chart rows through the Steam Store and yields (appid, GameRecord, status), the record is None unless the game was found ###
+def iter_game_records(chart_rows, max_workers: int = 4, retries: int = 2, limiter: TokenBucket = None):
+    pending = {} #Only chart rows with a request in flight or queued for retry are held here
+
+    def appids():
+        for chart_row in chart_rows:
+            if chart_row["appid"] in pending:
+                continue
+            pending[chart_row["appid"]] = chart_row
+            yield chart_row["appid"]
+
+    for appid, game_info, status in iter_steam_results(appids(), max_workers, retries, limiter):
+        chart_row = pending.pop(appid)
+        if status != STATUS_OK:
+            if status == STATUS_NOT_FOUND:
+                log.info(f"Looks like the appid: {appid}, was not found in Steam...", extra={"appid": appid})
+            yield appid, None, status
             continue
+        yield appid, build_game_record(appid, chart_row, game_info), status
+
+### Same as iter_game_records but yields (appid, game_row, status), for the stages that checkpoint dataset rows ###
+def iter_game_rows(chart_rows, max_workers: int = 4, retries: int = 2, limiter: TokenBucket = None):
+    for appid, record, status in iter_game_records(chart_rows, max_workers, retries, limiter):
+        yield appid, record.to_row(GAME_COLUMNS) if record is not None else None, status
+
+### Columns that come from price_overview, the only ones a price refresh touches ###
+PRICE_COLUMNS = ["Base Price (USD)", "Current Price (USD)", "Discount Percentage", "On sale?"]
+
+### Price fields of a GameRecord from a price_overview, Steam returns USD prices in cents so they are kept as they are ###
+def price_cents(price_info: dict, free: bool) -> dict:
+    base_cents, final_cents, discount_percentage, discounted = None, None, None, False
+
+    if price_info:
+        if isinstance(price_info.get("initial"), int):
+            base_cents = price_info["initial"]
+        if isinstance(price_info.get("final"), int):
+            final_cents = price_info["final"]
+        discount_percentage = price_info.get("discount_percent")
+        if discount_percentage is not None and discount_percentage > 0:
+            discounted = True
+    if base_cents is None and free:
+        base_cents = final_cents = 0
+
+    return {"base_cents": base_cents, "final_cents": final_cents, "discount": discount_percentage, "on_sale": discounted}
+
+### Price columns of a row from a price_overview, in dollars ###
+def price_fields(price_info: dict, free: bool) -> dict:
+    return GameRecord(None, **price_cents(price_info, free)).to_row(PRICE_COLUMNS)
+
+### Time a row's Steam or OpenCritic data was fetched, kept with the row so a refresh can tell how stale it is ###
+def _now() -> datetime.datetime:
+    return datetime.datetime.now().replace(microsecond=0)
+
+### True if a fetched time is missing or older than max_age_days ###
+def is_stale(updated, max_age_days: float, now=None) -> bool:
+    if updated is None or pd.isna(updated):
+        return True
+    return pd.Timestamp(now or _now()) - pd.Timestamp(updated) > pd.Timedelta(days=max_age_days)
+
+### Turns one SteamCharts row and its Steam Store data in to a record for the dataset, prices stay in integer cents ###
+def build_game_record(appid: int, chart_row: dict, game_info: dict) -> GameRecord:
+    free = game_info.get("is_free", False)
+
+    ### Retrieve some score data and release dates
+    metacritic_score = (game_info.get("metacritic") or {}).get("score")
+    recommendations = (game_info.get("recommendations") or {}).get("total")
+    release_date = (game_info.get("release_date") or {}).get("date", "")
+
+    return GameRecord(
+        appid,
+        chart_name=chart_row["name"],
+        current_players=chart_row["current_players"],
+        peak_players=chart_row["peak_players"],
+        name=game_info.get("name"),
+        free=free,
+        **price_cents(game_info.get("price_overview"), free),
+        release_date=release_date,
+        metacritic=metacritic_score,
+        recommendations=recommendations,
+        steam_updated=_now(),
+    )
+
+### Turns one SteamCharts row and its Steam Store data in to a row for the dataset ###
+def build_game_row(appid: int, chart_row: dict, game_info: dict) -> dict:
+    return build_game_record(appid, chart_row, game_info).to_row(GAME_COLUMNS)
+
+### Columns of a game row, in the order they are written out ###
+GAME_COLUMNS = ["appid", "SteamCharts Name", "Current Players", "Peak Players", "game name", "Free game?", "Base Price (USD)", "Current Price (USD)",
+                "Discount Percentage", "On sale?", "Release Date", "Metacritic Score", "Total Recommendations", "Steam Updated"]
 
-        game_name = game_info.get("name")
-        free = game_info.get("is_free", False)
-
-        base_price, current_price, discount_percentage, discounted = None, None, None, False
-        price_info = game_info.get("price_overview")
-
-        #Return USD currency in cents so must convert in to dollars
-        if price_info:
-            base_price_cents = price_info.get("initial")
-            current_price_cents = price_info.get("final")
-            discount_percentage = price_info.get("discount_percent")
-            if isinstance(base_price_cents, int):
-                base_price = base_price_cents / 100.0
-            if isinstance(current_price_cents, int):
-                current_price = current_price_cents / 100.0
-            if discount_percentage > 0:
-                discounted = True
-        if base_price is None and free:
-            base_price = current_price = 0.0
-
-        ### Retrieve some score data and release dates
-        metacritic_score = (game_info.get("metacritic") or {}).get("score")
-        recommendations = (game_info.get("recommendations") or {}).get("total")
-        release_date = (game_info.get("release_date") or {}).get("date", "")
-
-        row = chart_rows[i-1] #Used to find the additional data scraped off of SteamCharts
-
-        ### Add the retrieved data in to our list
-        game_rows.append({
-            "appid": appid,
-            "SteamCharts Name": row["name"],
-            "Current Players": row["current_players"],
-            "Peak Players": row["peak_players"],
-            "game name": game_name,
-            "Free game?": free,
-            "Base Price (USD)": base_price,
-            "Current Price (USD)": current_price,
-            "Discount Percentage": discount_percentage,
-            "On sale?": discounted,
-            "Release Date": release_date,
-            "Metacritic Score": metacritic_score,
-            "Total Recommendations": recommendations,
-        })
-        time.sleep(1.70) ### Try to slow down our requests and processing to not upset Steam
-        ### Appears that the Steam API has a 5 minute window that allows ~200 requests, so 5 mins * 60 seconds = 300 seconds, 200 requests in 300 seconds is  1.5 reqeust a second
-        ### This ensures that a user requesting > 200 games can fulfill that request without crashing
-
-    dataFrame = pd.DataFrame(game_rows)
+### Combines the SteamCharts and Steam API data together in to a dataset within Pandas ###
+def collect_top_steamcharts_games(games: int = 100, max_workers: int = 4, retries: int = 2, limiter: TokenBucket = None) -> pd.DataFrame:
+
+    ### Appears that the Steam API has a 5 minute window that allows ~200 requests, so 5 mins * 60 seconds = 300 seconds, 200 requests in 300 seconds is ~0.67 requests a second
+    ### The token bucket spreads the requests over the workers instead of sleeping after every game, so a user requesting > 200 games can fulfill that request without crashing
+    metrics = get_metrics()
+    chart_rows = metrics.timed("steamcharts", iter_steamcharts_rows(games))
+    ### Games are built straight in to compact records until the DataFrame is built from them column by column ###
+    game_records = [
+        record for _, record, status in metrics.timed("steam", iter_game_records(chart_rows, max_workers=max_workers, retries=retries, limiter=limiter))
+        if status == STATUS_OK
+    ]
+
+    with metrics.stage("dataframe"):
+        dataFrame = records_to_frame(game_records, GAME_COLUMNS)
+    metrics.add_rows("dataframe", len(dataFrame))
     return dataFrame
 
 ### Retrieves the API Key and contain headers for OpenCritic ###
+### Cached so key.txt is only read once per run ###
+@lru_cache(maxsize=None)
 def opencritic_headers() -> dict:
     key = retrieve_key("key.txt")
     if not key:
@@ -207,63 +462,193 @@ def opencritic_headers() -> dict:
         "x-rapidapi-host": "opencritic-api.p.rapid.com"
     }
 
-### Checks if a certain game is in OpenCritic by searching for the name, takes the first available and returns the game ID in OpenCritic ###
-def check_opencritic(game: str) -> dict:
+### Checks if a certain game is in OpenCritic by searching for the name, takes the closest matching name and returns the game ID in OpenCritic ###
+### Every result name is added to the local index so later games can be matched without a search ###
+def check_opencritic(game: str, limiter: TokenBucket = None) -> dict:
     #Checks Opencritic to verify the game is contained
-    headers = opencritic_headers()
+    url = f"{OpenCritic_URL}/meta/search"
+    params = {"criteria": game}
+    cache = get_cache()
+    key = cache_key(url, params)
+    text = cache.get("opencritic_search", key)
+    fresh = text is None
+
+    if fresh:
+        if cache.offline:
+            log.warning(f"No cached OpenCritic search for {game}, skipping in offline mode.", extra={"game": game})
+            return None
 
-    try:
-        response = requests.get(
-            f"{OpenCritic_URL}/meta/search",
-            headers = headers,
-            params = {"criteria":game},
-            timeout = 50,
-        )
-    except Exception as error:
-        print(f"Error fetching OpenCritic page {game}: {error}")
+        headers = opencritic_headers()
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            response = http_client.get(
+                url,
+                pool = "opencritic",
+                headers = headers,
+                params = params,
+                on_attempt = get_quota_ledger().reserve, #every attempt costs quota, raises QuotaExhausted once today's requests are used up
+            )
+        except requests.RequestException as error:
+            log.error(f"Error fetching OpenCritic page {game}: {error}", extra={"game": game})
+            return None
+        get_quota_ledger().update_from_headers(response.headers)
 
-    if response.status_code != 200:
-        print(f"Search failed for {game} in OpenCritic.")
-        return None
+        if response.status_code != 200:
+            log.error(f"Search failed for {game} in OpenCritic.", extra={"game": game})
+            return None
+        text = response.text
 
     try:
-        results = response.json()
+        results = json.loads(text)
     except ValueError:
-        print(f"Error parsing OpenCritic page {game}: {response.text}")
+        log.error(f"Error parsing OpenCritic page {game}: {text}", extra={"game": game})
         return None
+    if fresh:
+        cache.put("opencritic_search", key, text)
 
     if not results:
-        print(f"No results for {game} in OpenCritic.")
+        log.info(f"No results for {game} in OpenCritic.", extra={"game": game})
         return None
 
-    return results[0]
+    index = get_opencritic_index()
+    for result in results:
+        index.add_name(result.get("id"), result.get("name"))
+    return index.pick_result(game, results)
+
+### Maps a Steam game to OpenCritic: stored appid mapping first, then a confident local fuzzy match, and only then a remote search ###
+def resolve_opencritic(game: str, appid: int = None, limiter: TokenBucket = None) -> dict:
+    index = get_opencritic_index()
+    if appid is not None:
+        known = index.lookup(appid)
+        if known:
+            return known
+
+    match, score = index.best_match(game)
+    if match and score >= CONFIDENT_MATCH:
+        log.info(f"Matched {game} to {match['name']} locally (score {score:.2f}), no search needed.", extra={"game": game, "score": round(score, 3)})
+        index.remember(appid, match["id"], match["name"], "fuzzy")
+        return match
+
+    result = check_opencritic(game, limiter)
+    if result and result.get("id") is not None:
+        index.remember(appid, result.get("id"), result.get("name"), "search")
+    return result
 
 ### Retrieves review information from OpenCritic based on an OpenCritic ID ###
-def retrieve_opencritic(id: int) -> dict:
-    headers = opencritic_headers()
+def retrieve_opencritic(id: int, limiter: TokenBucket = None) -> dict:
+    url = f"{OpenCritic_URL}/game/{id}"
+    cache = get_cache()
+    text = cache.get("opencritic_game", url)
+    fresh = text is None
+
+    if fresh:
+        if cache.offline:
+            log.warning(f"No cached OpenCritic reviews for {id}, skipping in offline mode.", extra={"oc_id": id})
+            return None
 
-    try:
-        response = requests.get(
-            f"{OpenCritic_URL}/game/{id}",
-            headers = headers,
-            timeout = 50,
-        )
-    except Exception as error:
-        print(f"Error fetching OpenCritic page {id}: {error}")
-        return None
+        headers = opencritic_headers()
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            response = http_client.get(
+                url,
+                pool = "opencritic",
+                headers = headers,
+                on_attempt = get_quota_ledger().reserve, #every attempt costs quota, raises QuotaExhausted once today's requests are used up
+            )
+        except requests.RequestException as error:
+            log.error(f"Error fetching OpenCritic page {id}: {error}", extra={"oc_id": id})
+            return None
+        get_quota_ledger().update_from_headers(response.headers)
 
-    if response.status_code != 200:
-        print(f"Search failed for {id} in OpenCritic.")
-        return None
+        if response.status_code != 200:
+            log.error(f"Search failed for {id} in OpenCritic.", extra={"oc_id": id})
+            return None
+        text = response.text
 
     try:
-        reviews = response.json()
+        reviews = json.loads(text)
     except ValueError:
-        print(f"Error parsing OpenCritic page {id}: {response.text}")
+        log.error(f"Error parsing OpenCritic page {id}: {text}", extra={"oc_id": id})
         return None
+    if fresh:
+        cache.put("opencritic_game", url, text)
 
+    if isinstance(reviews, dict):
+        get_opencritic_index().add_name(reviews.get("id"), reviews.get("name"))
     return reviews
 
+### Columns added to the dataset from OpenCritic ###
+OPENCRITIC_COLUMNS = ["OC_ID", "OC_Name", "TopCriticScore", "MedianCriticScore", "PercentRecommended", "TotalReviews", "OC_Tier", "OC Updated"]
+
+### Every column of the final dataset ###
+DATASET_COLUMNS = GAME_COLUMNS + OPENCRITIC_COLUMNS
+
+### Searches OpenCritic for a game name and returns the OpenCritic columns for it, None if the search itself failed ###
+### limiter (optional) spaces out the OpenCritic requests, only requests that aren't cached wait on it ###
+def opencritic_fields(name: str, appid: int = None, limiter: TokenBucket = None) -> dict:
+    results = resolve_opencritic(name, appid, limiter)
+    if not results:
+        get_metrics().count("opencritic_results", status=STATUS_NOT_FOUND)
+        return None
+
+    fields = dict.fromkeys(OPENCRITIC_COLUMNS)
+    fields["OC Updated"] = _now()
+    fields["OC_ID"] = results.get("id")
+    fields["OC_Name"] = results.get("name")
+
+    if fields["OC_ID"] is None:
+        get_metrics().count("opencritic_results", status="no_id")
+        log.info(f"No OpenCritic ID found for {name}... moving on", extra={"game": name})
+        return fields
+
+    reviews = retrieve_opencritic(fields["OC_ID"], limiter)
+    if not reviews:
+        get_metrics().count("opencritic_results", status="no_reviews")
+        log.info(f"No OpenCritic reviews for {fields['OC_ID']}... moving on", extra={"oc_id": fields["OC_ID"]})
+        return fields
+
+    fields["TopCriticScore"] = reviews.get("topCriticScore")
+    fields["MedianCriticScore"] = reviews.get("medianScore")
+    fields["PercentRecommended"] = reviews.get("percentRecommended")
+    fields["TotalReviews"] = reviews.get("numReviews")
+    fields["OC_Tier"] = reviews.get("tier")
+    get_metrics().count("opencritic_results", status=STATUS_OK)
+    return fields
+
+### The row with a lookup's OpenCritic fields laid over it. A failed lookup, or one that found no OpenCritic game, keeps the row's stored values ###
+### A match to the game the row already has only fills in what the lookup returned, a match to a different game replaces every column ###
+def merge_opencritic_fields(row: dict, found: dict = None) -> dict:
+    fields = {column: row.get(column) for column in OPENCRITIC_COLUMNS}
+    if found and found.get("OC_ID") is not None and found["OC_ID"] != fields["OC_ID"]:
+        fields = {column: found.get(column) for column in OPENCRITIC_COLUMNS}
+    else:
+        fields.update({column: value for column, value in (found or {}).items() if value is not None})
+    return {**row, **fields}
+
+### Estimated OpenCritic requests a game still needs, 0 if its mapping and reviews are already stored locally ###
+def opencritic_cost(game: str, appid: int = None) -> int:
+    index = get_opencritic_index()
+    cache = get_cache()
+    known = index.lookup(appid) if appid is not None else None
+    if known is None:
+        match, score = index.best_match(game)
+        if match and score >= CONFIDENT_MATCH:
+            known = match
+    if known is None:
+        searched = cache.has("opencritic_search", cache_key(f"{OpenCritic_URL}/meta/search", {"criteria": game}))
+        return (0 if searched else 1) + 1
+    return 0 if cache.has("opencritic_game", f"{OpenCritic_URL}/game/{known['id']}") else 1
+
+### Quota is spent on the highest priority games first: popular games, boosted if never matched or matched long ago ###
+def opencritic_priority(row) -> float:
+    players = row.get("Current Players")
+    players = 0 if players is None or pd.isna(players) else players
+    updated = get_opencritic_index().last_updated(row.get("appid"))
+    staleness_days = 30 if updated is None else min((time.time() - updated) / 86400, 30)
+    return players * (1 + staleness_days / 30)
+
 ### Alters the original DataFrame to include information from OpenCritic API ###
 def include_opencritic_data(dataframe: pd.DataFrame, max_games: int) -> pd.DataFrame:
 
@@ -271,298 +656,341 @@ def include_opencritic_data(dataframe: pd.DataFrame, max_games: int) -> pd.DataF
 
     dataframe = dataframe.copy()
 
-    dataframe["OC_ID"] = pd.NA
-    dataframe["OC_Name"] = pd.NA
-    dataframe["TopCriticScore"] = pd.NA
-    dataframe["MedianCriticScore"] = pd.NA
-    dataframe["PercentRecommended"] = pd.NA
-    dataframe["TotalReviews"] = pd.NA
-    dataframe["OC_Tier"] = pd.NA
-
     rows = dataframe.head(max_games) if max_games is not None else dataframe
+    ### Found values are collected per column and added as whole columns at the end instead of one .at write per cell ###
+    found_index = []
+    found_columns = {column: [] for column in OPENCRITIC_COLUMNS}
+
+    metrics = get_metrics()
+    with metrics.stage("opencritic"):
+        ### Games that cost no quota go first, the rest in priority order so the quota goes to the most valuable games ###
+        order = sorted(
+            rows.iterrows(),
+            key=lambda item: (opencritic_cost(item[1]["game name"], item[1]["appid"]) > 0, -opencritic_priority(item[1])),
+        )
 
-    for i, (row_index, row) in enumerate(rows.iterrows(), start=1):
-        name = row["game name"]
-        print(f"Processing row {i}/{len(rows)}...Currently searching for {name}")
-
-        results = check_opencritic(name)
-        if not results:
-            continue
-
-        OC_ID = results.get("id")
-        OC_Name = results.get("name")
-
-        dataframe.at[row_index, "OC_ID"] = OC_ID
-        dataframe.at[row_index, "OC_Name"] = OC_Name
+        for i, (row_index, row) in enumerate(order, start=1):
+            name = row["game name"]
+            log.info(f"Processing row {i}/{len(rows)}...Currently searching for {name}", extra={"game": name})
 
-        if OC_ID is None:
-            print(f"No OpenCritic ID found for {name}... moving on")
-            continue
+            try:
+                fields = opencritic_fields(name, row["appid"])
+            except QuotaExhausted as error:
+                log.warning(f"{error}, deferring the remaining {len(rows) - i + 1} games to the next run.")
+                break
+            if not fields:
+                continue
 
-        reviews = retrieve_opencritic(OC_ID)
-        if not reviews:
-            print(f"No OpenCritic reviews for {OC_ID}... moving on")
-            continue
+            found_index.append(row_index)
+            for column in OPENCRITIC_COLUMNS:
+                found_columns[column].append(fields.get(column))
+    metrics.add_rows("opencritic", len(rows))
 
-        dataframe.at[row_index, "TopCriticScore"] = reviews.get("topCriticScore")
-        dataframe.at[row_index, "MedianCriticScore"] = reviews.get("medianScore")
-        dataframe.at[row_index, "PercentRecommended"] = reviews.get("percentRecommended")
-        dataframe.at[row_index, "TotalReviews"] = reviews.get("numReviews")
-        dataframe.at[row_index, "OC_Tier"] = reviews.get("tier")
+    found = pd.DataFrame(found_columns, index=found_index, columns=OPENCRITIC_COLUMNS)
+    for column in OPENCRITIC_COLUMNS:
+        dataframe[column] = found[column].reindex(dataframe.index)
 
-    time.sleep(0.25)
-    print("The dataframe now has information from OpenCritic.")
+    log.info("The dataframe now has information from OpenCritic.")
 
     return dataframe
 
 ### Saves to /data in a .csv ###
-def save_csv(df: pd.DataFrame, path: str = "data/most_popular_steam_games.csv") -> None:
+def save_csv(df: pd.DataFrame, path: str = DEFAULT_CSV_PATH) -> None:
     os.makedirs(os.path.dirname(path), exist_ok=True)
     df.to_csv(path, index=False)
-    print(f"Saved {len(df)} games to {path}")
-
-def analyze_data(file_path: str = "data/most_popular_steam_games.csv") -> None:
-    plt.style.use("Solarize_Light2")
-    sns.set_theme()
-
-    df = pd.read_csv(file_path)
-    print(df.shape)
-    df.head()
-
-    output_folder = "results"
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
-
-    # Clean release dates into datetime and years
-    if "Release Date" in df.columns:
-        df["Release Date Formatted"] = pd.to_datetime(df["Release Date"], errors="coerce")
-        df["Release Year"] = df["Release Date Formatted"].dt.year
-    else:
-        df["Release Year"] = np.nan
-
-    # Extract age of each game
-    current_year = pd.Timestamp.today().year
-    df["Game Age (Years)"] = current_year - df["Release Year"]
-
-    df["Popularity_Factor"] = df["Current Players"] / df["Peak Players"]
-
-    # Modify the critic score to be between a range of 0-1
-    df["Critic Score Normalized"] = df["TopCriticScore"] / 100
-
-    # Attempt to account for $$$ by incorporating the cost
-    df["Dollar Value"] = df["Critic Score Normalized"] / (df["Current Price (USD)"] + 1)
-
-    print(df.shape)
-    df.head(50)
-
-    # Creates a clean copy of the dataframe if there is an opencritic tier review - eliminates all NaN
-    df_clean = df.copy()
-
-    df_clean = df_clean[df_clean["OC_Tier"].notna() & (df_clean["OC_Tier"].astype(str).str.strip() != "")]
-
-    print("After OpenCritic Filtering:", len(df_clean), "from", len(df))
-
-    # Some games are not marked as free and do not contain a price, sometimes these are bundles for games and work as a single launcher. These are filtered out.
-    df_clean["Current Price (USD)"] = pd.to_numeric(df_clean["Current Price (USD)"], errors="coerce")
-
-    Mask_Valid_Paid = ((df_clean["Free game?"] == False) & (df_clean["Current Price (USD)"] > 0))
-    Mask_Valid_Free = (df_clean["Free game?"] == True)
-
-    df_clean = df_clean[Mask_Valid_Paid | Mask_Valid_Free]
-    print("After removing erroneous price entries, for example games that appear as bundles and have no price:",
-          len(df_clean))
-
-    print(df_clean.shape)
-    df_clean.head(50)
-
-    # Copies separate data sets for free and paid games
-    df_free = df_clean[df_clean["Free game?"] == True].copy()
-    df_paid = df_clean[df_clean["Free game?"] == False].copy()
-    df_discounted = df_paid[df_paid["Discount Percentage"].fillna(0) > 0].copy()
-
-    print("Total free games:", len(df_free))
-    print("Total paid games:", len(df_paid))
-    print("Total discounted games:", len(df_discounted))
-
-    # Histogram of Critic Tiers
-    plt.figure(figsize=(4, 3))
-    df_clean["OC_Tier"].value_counts().plot(kind="bar")
-
-    plt.xlabel("OpenCritic Tier")
-    plt.ylabel("Number of Games")
-    plt.title("Distribution of OpenCritic Tiers [Filtered]")
-    plt.xticks(rotation=0)
-
-    full_path = os.path.join(output_folder, "OC_Tiers_Histo.png")
-    plt.savefig(full_path)
-
-    # Histogram of Release Date
-    plt.figure(figsize=(4, 3))
-    sns.histplot(df_clean["Release Year"].dropna(), bins=20)
-
-    plt.xlabel("Release Year")
-    plt.ylabel("Number of Games")
-    plt.title("Games per Release Year [Filtered]")
-    plt.xticks(rotation=0)
-
-    full_path = os.path.join(output_folder, "Release_Date_Histo.png")
-    plt.savefig(full_path)
-
-    # Boxplot of Free vs Paid (Top Score)
-    plt.figure(figsize=(4, 3))
-    sns.boxplot(df_clean, x=df_clean["Free game?"].map({True: "Free", False: "Paid"}), y=df_clean["TopCriticScore"])
-
-    plt.xlabel("Free/Paid")
-    plt.ylabel("Top Critic Score")
-    plt.title("Top Critic Scores - Free vs Paid")
-    plt.xticks(rotation=0)
-
-    full_path = os.path.join(output_folder, "Free_vs_Paid_Top_Score.png")
-    plt.savefig(full_path)
-
-    # Boxplot of Free vs Paid (Median Score)
-    plt.figure(figsize=(4, 3))
-    sns.boxplot(df_clean, x=df_clean["Free game?"].map({True: "Free", False: "Paid"}), y=df_clean["MedianCriticScore"])
-
-    plt.xlabel("Free/Paid")
-    plt.ylabel("Median Critic Score")
-    plt.title("Median Critic Scores - Free vs Paid")
-    plt.xticks(rotation=0)
-
-    full_path = os.path.join(output_folder, "Free_vs_Paid_Med_Score.png")
-    plt.savefig(full_path)
-
-    # Boxplot of Free vs Paid (Popularity Factor)
-    plt.figure(figsize=(4, 3))
-    sns.boxplot(df_clean.dropna(subset=["Popularity_Factor"]),
-                x=df_clean["Free game?"].map({True: "Free", False: "Paid"}), y=df_clean["Popularity_Factor"])
-
-    plt.xlabel("Free/Paid")
-    plt.ylabel("Popularity Factor")
-    plt.title("Popularity Factor - Free vs Paid")
-    plt.xticks(rotation=0)
-
-    full_path = os.path.join(output_folder, "Free_vs_Paid_PopularityFactor.png")
-    plt.savefig(full_path)
-
-    # Scatterplot Discount Percentage and Popularity
-    plt.figure(figsize=(4, 3))
-    sns.scatterplot(df_discounted, x="Discount Percentage", y="Popularity_Factor")
-
-    plt.xlabel("Discount Percentage")
-    plt.ylabel("Popularity Factor")
-    plt.title("Discount Percentage vs Popularity Factor")
-    plt.xticks(rotation=0)
-
-    full_path = os.path.join(output_folder, "Scatter_Discount_Popularity.png")
-    plt.savefig(full_path)
-
-    correlation_discount_popularity = df_discounted[["Discount Percentage", "Popularity_Factor"]].corr().iloc[0, 1]
-    print(f"Correlation between the discount percentage and the popularity factor: {correlation_discount_popularity}")
-
-    # Scatterplot of Ratings vs Age
-    plt.figure(figsize=(4, 3))
-    sns.scatterplot(df_clean.dropna(subset=["Game Age (Years)", "TopCriticScore"]), x="Game Age (Years)",
-                    y="TopCriticScore")
-
-    plt.xlabel("Game Age (Years)")
-    plt.ylabel("Top Critic Score")
-    plt.title("Game Age vs Top Critic Score")
-    plt.xticks(rotation=0)
-
-    full_path = os.path.join(output_folder, "Scatter_Ratings_Age.png")
-    plt.savefig(full_path)
-
-    # Pair plot for comparison of reviews
-    columns = ["TopCriticScore", "MedianCriticScore", "PercentRecommended", "TotalReviews"]
-    sns.pairplot(df_clean[columns].dropna())
-    plt.suptitle("Pair Plot: Critic Scores", y=1.02)
-
-    full_path = os.path.join(output_folder, "Pair_Plot_Reviews.png")
-    plt.savefig(full_path)
-
-    # Scatterplot to compare  # of Reviews and # of Current Players
-    plt.figure(figsize=(4, 3))
-    sns.scatterplot(df_clean, x="TotalReviews", y="Current Players")
-
-    plt.xlabel("Number of OpenCritic Reviews")
-    plt.ylabel("Current Players")
-    plt.title("Current Players vs Number of Reviews")
-
-    full_path = os.path.join(output_folder, "Scatter_ReviewCount_CurrentPlayers.png")
-    plt.savefig(full_path)
-
-    correlation_totalreviews_currentplayers = df_discounted[["TotalReviews", "Current Players"]].corr().iloc[0, 1]
-    print(
-        f"Correlation between the total OpenCritic reviews and the current number of players: {correlation_totalreviews_currentplayers}")
-
-    Price = df_clean["Current Price (USD)"].fillna(0)
-    Score = df_clean["TopCriticScore"].fillna(0)
-
-    df_clean["Value"] = (Score * df_clean["Popularity_Factor"]) / (Price + 200)
-
-    best_overall_games = df_clean.sort_values("Value", ascending=False).head(5)
-    worst_games = df_clean.sort_values("Value", ascending=True).head(5)
-
-    print("Top 5 best value games:")
-    best_overall_games[["game name", "Current Price (USD)", "TopCriticScore", "Popularity_Factor", "Value"]]
-
-    print("Bottom 5 value games:")
-    worst_games[["game name", "Current Price (USD)", "TopCriticScore", "Popularity_Factor", "Value"]]
-
-    Price = df_paid["Current Price (USD)"].fillna(0)
-    Score = df_paid["TopCriticScore"].fillna(0)
-
-    df_paid["Value"] = ((Score * df_paid["Popularity_Factor"]) / (Price + 200))
-
-    best_paid_games = df_paid.sort_values("Value", ascending=False).head(5)
-
-    print("Top 5 best paid value games:")
-    best_paid_games[["game name", "Current Price (USD)", "TopCriticScore", "Popularity_Factor", "Value"]]
-
-    Price = df_free["Current Price (USD)"].fillna(0)
-    Score = df_free["TopCriticScore"].fillna(0)
-
-    df_free["Value"] = ((Score * df_free["Popularity_Factor"]) / (Price + 200))
-
-    best_free_games = df_free.sort_values("Value", ascending=False).head(5)
-
-    print("Top 5 best free games:")
-    best_free_games[["game name", "Current Price (USD)", "TopCriticScore", "Popularity_Factor", "Value"]]
-
-    plt.figure(figsize=(7, 5))
-    columns = ["TopCriticScore", "MedianCriticScore", "PercentRecommended", "TotalReviews", "Current Players",
-               "Peak Players", "Current Price (USD)"]
-    sns.heatmap(df_clean[columns].corr(), annot=True, fmt=".2f", cmap="coolwarm")
-    plt.title("Correlation Matrix of Game Stats")
-    plt.xticks(rotation=45)
-
-    full_path = os.path.join(output_folder, "Heat_Map.png")
-    plt.savefig(full_path)
-
-    plt.figure(figsize=(4, 3))
-    sns.histplot(df_clean["Popularity_Factor"], bins=30, kde=True)
-    plt.title("Popularity Factor Histogram - (Current/Peak)")
-    plt.xlabel("Popularity Factor")
-    plt.ylabel("Count")
-
-    full_path = os.path.join(output_folder, "PopularityFactor_Count.png")
-    plt.savefig(full_path)
-
-    # Pair plot for comparison of free vs paid
-    df_temporary = df_clean.copy()
-    df_temporary["Game Type"] = df_temporary["Free game?"].map({True: "Free", False: "Paid"})
-
-    columns = ["TopCriticScore", "PercentRecommended", "TotalReviews", "Popularity_Factor"]
-    sns.pairplot(df_temporary, vars=columns, hue="Game Type", diag_kind="kde", corner=False, palette="viridis")
-
-    plt.suptitle("Pair Plot: Free vs Paid", y=1.02)
+    log.info(f"Saved {len(df)} games to {path}", extra={"rows": len(df), "path": path})
+
+### Price-only refresh of the games in a snapshot (the latest by default), prices are fetched in batches and every other column is kept ###
+### The refreshed dataset is written as today's snapshot and to the csv ###
+def refresh_prices(snapshot_root: str = DEFAULT_SNAPSHOT_ROOT, snapshot_date=None, batch_size: int = STEAM_PRICE_BATCH_SIZE, max_workers: int = 2,
+                   offline: bool = False, csv_path: str = DEFAULT_CSV_PATH, report_path: str = DEFAULT_REPORT_PATH,
+                   prometheus_path: str = None) -> pd.DataFrame:
+    configure_cache(offline=offline)
+    metrics = reset_metrics()
+    if snapshot_date is None:
+        dates = snapshot_dates(snapshot_root)
+        if not dates:
+            raise FileNotFoundError(f"No snapshots found in {snapshot_root}")
+        snapshot_date = dates[-1]
+    df = read_snapshots(snapshot_root, dates=[snapshot_date]).drop(columns="snapshot_date")
+    free = dict(zip(df["appid"], df["Free game?"].fillna(False)))
+
+    refreshed = {}
+    price_results = iter_price_results(df["appid"].dropna().astype(int).tolist(), batch_size, max_workers)
+    for appid, price_info, status in metrics.timed("price_refresh", price_results):
+        if status == STATUS_OK:
+            refreshed[appid] = price_fields(price_info, bool(free.get(appid)))
+    log.info(f"Refreshed the prices of {len(refreshed)} of {len(df)} games.", extra={"refreshed": len(refreshed)})
+
+    refreshed = pd.DataFrame.from_dict(refreshed, orient="index", columns=PRICE_COLUMNS)
+    found = df["appid"].isin(refreshed.index)
+    for column in PRICE_COLUMNS:
+        df[column] = df["appid"].map(refreshed[column]).where(found, df[column])
+
+    df = df[[column for column in DATASET_COLUMNS if column in df.columns]]
+    with metrics.stage("save"):
+        write_snapshot(df, snapshot_root)
+        save_csv(df, csv_path)
+    write_run_report(report_path, prometheus_path)
+    return df
+
+### Pipeline stage 1: SteamCharts scrape, reuses the checkpoint if it already holds enough games ###
+### Freshly scraped player counts are also added to the player history ###
+def scrape_stage(games: int, checkpoint: Checkpoint, history: PlayerHistory = None, limiter: TokenBucket = None):
+    records = checkpoint.load()
+    if len(records) >= games:
+        log.info(f"Using {games} checkpointed SteamCharts rows.")
+        for record in list(records.values())[:games]:
+            yield record["row"]
+        return
+
+    for chart_row in iter_steamcharts_rows(games, limiter=limiter):
+        if chart_row["appid"] not in records:
+            checkpoint.append(chart_row["appid"], chart_row)
+            if history is not None:
+                history.record(chart_row, chart_row.get("scraped_at"))
+        yield chart_row
+
+### Pipeline stage 2: Steam Store enrichment, appids already in the checkpoint are passed straight through and the rest are fetched ###
+def steam_stage(chart_rows, checkpoint: Checkpoint, max_workers: int = 4):
+    ### Finished appids are held as compact records (None for games Steam doesn't have) until their chart row comes by ###
+    records = {
+        appid: GameRecord.from_row(record["row"]) if record["status"] == STATUS_OK else None
+        for appid, record in checkpoint.load().items() if record["status"] != STATUS_FAILED
+    }
+    log.info(f"Steam stage: {len(records)} appids already done.", extra={"resumed": len(records)})
 
-    full_path = os.path.join(output_folder, "Pair_Plot_Free_vs_Paid.png")
-    plt.savefig(full_path)
+    def todo():
+        for chart_row in chart_rows:
+            if chart_row["appid"] not in records:
+                yield chart_row
+                continue
+            record = records.pop(chart_row["appid"])
+            if record is not None:
+                done_rows.append(record.to_row(GAME_COLUMNS))
+
+    done_rows = deque()
+    for appid, row, status in iter_game_rows(todo(), max_workers=max_workers):
+        while done_rows:
+            yield done_rows.popleft()
+        checkpoint.append(appid, row, status)
+        if status == STATUS_OK:
+            yield row
+    yield from done_rows
+
+### At most this many games wait for OpenCritic quota at once, so the stage's memory doesn't grow with the number of games ###
+OPENCRITIC_PRIORITY_WINDOW = 100
+
+### Pipeline stage 3: OpenCritic enrichment for the first max_games rows, one checkpoint line per game ###
+### Games already stored locally stream straight through, and so does every game while the quota left covers all of them ###
+### Otherwise games that need quota wait in a priority window of at most window games, the best one goes out each time it overflows ###
+### Whatever the quota can't cover today is written without OpenCritic data and picked up by the next run ###
+def opencritic_stage(game_rows, checkpoint: Checkpoint, max_games: int = None, window: int = OPENCRITIC_PRIORITY_WINDOW):
+    records = {appid: record for appid, record in checkpoint.load().items() if record["status"] == STATUS_OK}
+    needs_quota = [] #heap of (-priority, arrival, record)
+    exhausted = False
+
+    def enrich(row):
+        nonlocal exhausted
+        found = None
+        if not exhausted:
+            name = row["game name"]
+            log.info(f"Currently searching OpenCritic for {name}", extra={"game": name, "appid": row["appid"]})
+            try:
+                found = opencritic_fields(name, row["appid"])
+            except QuotaExhausted as error:
+                log.warning(f"{error}, deferring the rest of the games to the next run.")
+                exhausted = True
+            else:
+                checkpoint.append(row["appid"], found, STATUS_OK if found else STATUS_FAILED)
+        return merge_opencritic_fields(row, found)
+
+    def quota_to_spare(seen: int) -> bool:
+        if max_games is None:
+            return False
+        #At most a search and a reviews request per game
+        return get_quota_ledger().remaining() >= 2 * (max_games - seen + 1 + len(needs_quota))
+
+    for i, row in enumerate(game_rows, start=1):
+        if max_games is not None and i > max_games:
+            yield merge_opencritic_fields(row)
+            continue
+        record = records.pop(row["appid"], None)
+        if record is not None:
+            yield merge_opencritic_fields(row, record["row"])
+        elif quota_to_spare(i) or opencritic_cost(row["game name"], row["appid"]) == 0:
+            yield enrich(row)
+        else:
+            heapq.heappush(needs_quota, (-opencritic_priority(row), i, GameRecord.from_row(row)))
+            if len(needs_quota) > window:
+                yield enrich(heapq.heappop(needs_quota)[2].to_row())
+
+    log.info(f"{len(needs_quota)} games still wait for OpenCritic requests, {get_quota_ledger().remaining()} requests left today.", extra={"needs_quota": len(needs_quota)})
+    while needs_quota:
+        yield enrich(heapq.heappop(needs_quota)[2].to_row())
+
+### Pipeline stage 4: the csv is kept for the notebook, the typed Parquet snapshot for the day is what analyze_data reads ###
+def save_stage(rows, snapshot_root: str = DEFAULT_SNAPSHOT_ROOT, csv_path: str = DEFAULT_CSV_PATH) -> int:
+    metrics = get_metrics()
+    parquet_path = os.path.join(snapshot_path(snapshot_root), "part-0.parquet")
+    with metrics.stage("save"):
+        with CsvSink(csv_path, columns=DATASET_COLUMNS) as csv_sink, ParquetSink(parquet_path, columns=DATASET_COLUMNS) as parquet_sink:
+            for row in rows:
+                csv_sink.write_row(row)
+                parquet_sink.write_row(row)
+    metrics.add_rows("save", csv_sink.rows_written)
+    return csv_sink.rows_written
 
 ### Simple function to run the program assuming a set number of games ###
-def run(games: int = 100):
-    dataFrame = collect_top_steamcharts_games(games)
-    dataFrame_appended = include_opencritic_data(dataFrame, games)
-    save_csv(dataFrame_appended, path="data/most_popular_steam_games.csv")
\ No newline at end of file
+### Each stage checkpoints to data/checkpoints, a crashed run picks up where it stopped and the checkpoints are cleared once the csv is saved ###
+### Stage timings, request latency per host, cache/retry/failure counters and rows per second go to report_path (and prometheus_path if given) ###
+### enrich=False stops after the Steam stage so no OpenCritic quota is spent, enrich_snapshot() adds the OpenCritic data later ###
+def run(games: int = 100, max_workers: int = 4, offline: bool = False, checkpoint_dir: str = "data/checkpoints", resume: bool = True, snapshot_root: str = DEFAULT_SNAPSHOT_ROOT, history_path: str = DEFAULT_HISTORY_PATH,
+        report_path: str = DEFAULT_REPORT_PATH, prometheus_path: str = None, csv_path: str = DEFAULT_CSV_PATH, enrich: bool = True):
+    configure_cache(offline=offline) #Offline mode only reads from the on-disk cache in data/http_cache.sqlite
+    metrics = reset_metrics()
+    checkpoints = {stage: Checkpoint(os.path.join(checkpoint_dir, f"{stage}.jsonl")) for stage in ("scrape", "steam", "opencritic")}
+    if not resume:
+        for checkpoint in checkpoints.values():
+            checkpoint.clear()
+
+    ### Stages are chained generators, a row flows all the way to the csv as soon as it is ready ###
+    history = PlayerHistory(history_path)
+    ### Each stage is timed on its own, the time a stage spends waiting on the one before it isn't counted against it ###
+    chart_rows = metrics.timed("scrape", scrape_stage(games, checkpoints["scrape"], history))
+    game_rows = metrics.timed("steam", steam_stage(chart_rows, checkpoints["steam"], max_workers=max_workers))
+    enriched_rows = metrics.timed("opencritic", opencritic_stage(game_rows, checkpoints["opencritic"], games)) if enrich else game_rows
+    save_stage(enriched_rows, snapshot_root, csv_path)
+    history.close()
+
+    for checkpoint in checkpoints.values():
+        checkpoint.clear()
+    write_run_report(report_path, prometheus_path)
+
+### The latest snapshot as a dict of appid -> compact record, what a refresh diffs the new SteamCharts rows against ###
+def load_previous(snapshot_root: str = DEFAULT_SNAPSHOT_ROOT) -> dict:
+    dates = snapshot_dates(snapshot_root)
+    if not dates:
+        return {}
+    df = read_snapshots(snapshot_root, columns=DATASET_COLUMNS, dates=[dates[-1]]).drop(columns="snapshot_date")
+    df = df.dropna(subset=["appid"]).astype(object)
+    df = df.where(df.notna(), None)
+    return {int(row["appid"]): GameRecord.from_row(row) for row in df.to_dict("records")}
+
+### Refresh stage 2: only new appids and games whose store data is older than max_age_days go to the Steam Store ###
+### Every other game keeps its stored row with today's player counts, its prices are checked in batched price requests at the end ###
+def steam_refresh_stage(chart_rows, previous: dict, checkpoint: Checkpoint, max_workers: int = 4, max_age_days: float = STEAM_MAX_AGE_DAYS):
+    metrics = get_metrics()
+    reused = []
+
+    def todo():
+        for chart_row in chart_rows:
+            record = previous.get(chart_row["appid"])
+            if record is None:
+                metrics.count("refresh_steam", status="new")
+                yield chart_row
+            elif is_stale(record.steam_updated, max_age_days):
+                metrics.count("refresh_steam", status="stale")
+                yield chart_row
+            else:
+                metrics.count("refresh_steam", status="reused")
+                record.chart_name = chart_row["name"]
+                record.current_players = chart_row["current_players"]
+                record.peak_players = chart_row["peak_players"]
+                reused.append(record)
+
+    yield from steam_stage(todo(), checkpoint, max_workers=max_workers)
+
+    changed = 0
+    prices = {}
+    for appid, price_info, status in iter_price_results([record.appid for record in reused]):
+        if status == STATUS_OK:
+            prices[appid] = price_info
+    for record in reused:
+        row = record.to_row()
+        if row["appid"] in prices:
+            fields = price_fields(prices[row["appid"]], bool(row.get("Free game?")))
+            changed += any(fields[column] != row.get(column) for column in PRICE_COLUMNS)
+            row.update(fields)
+        yield row
+    log.info(f"Reused the store data of {len(reused)} games, {changed} had a new price.", extra={"reused": len(reused), "price_changes": changed})
+
+### Refresh stage 3: games with OpenCritic data newer than max_age_days keep it, the rest go through the usual OpenCritic stage ###
+### A game whose Steam name changed is looked up again since its match may have changed too ###
+def opencritic_refresh_stage(game_rows, previous: dict, checkpoint: Checkpoint, max_age_days: float = OPENCRITIC_MAX_AGE_DAYS):
+    metrics = get_metrics()
+    kept_rows = deque()
+
+    def todo():
+        for row in game_rows:
+            old = previous.get(row["appid"])
+            if old is None:
+                metrics.count("refresh_opencritic", status="lookup")
+                yield row
+            elif old.name != row["game name"] or is_stale(old.oc_updated, max_age_days):
+                metrics.count("refresh_opencritic", status="lookup")
+                yield {**old.to_row(OPENCRITIC_COLUMNS), **row} #the stored scores stay if the lookup fails or the quota runs out
+            else:
+                metrics.count("refresh_opencritic", status="reused")
+                kept_rows.append({**row, **old.to_row(OPENCRITIC_COLUMNS)})
+
+    for row in opencritic_stage(todo(), checkpoint):
+        while kept_rows:
+            yield kept_rows.popleft()
+        yield row
+    yield from kept_rows
+
+### Daily refresh built on the previous run's dataset: the SteamCharts pages are scraped again for today's player counts, ###
+### but the Steam Store and OpenCritic are only asked about new appids and games whose data is older than the max ages ###
+### Falls back to a full run when there is no snapshot to compare against ###
+def refresh(games: int = 100, max_workers: int = 4, offline: bool = False, steam_max_age_days: float = STEAM_MAX_AGE_DAYS,
+            opencritic_max_age_days: float = OPENCRITIC_MAX_AGE_DAYS, checkpoint_dir: str = "data/checkpoints", resume: bool = True,
+            snapshot_root: str = DEFAULT_SNAPSHOT_ROOT, history_path: str = DEFAULT_HISTORY_PATH, report_path: str = DEFAULT_REPORT_PATH,
+            prometheus_path: str = None, csv_path: str = DEFAULT_CSV_PATH):
+    previous = load_previous(snapshot_root)
+    if not previous:
+        log.info(f"No snapshot in {snapshot_root} to refresh, doing a full run instead.")
+        return run(games, max_workers, offline, checkpoint_dir, resume, snapshot_root, history_path, report_path=report_path, prometheus_path=prometheus_path, csv_path=csv_path)
+
+    configure_cache(offline=offline)
+    metrics = reset_metrics()
+    log.info(f"Refreshing against {len(previous)} games from the latest snapshot.", extra={"previous": len(previous)})
+    checkpoints = {stage: Checkpoint(os.path.join(checkpoint_dir, f"refresh-{stage}.jsonl")) for stage in ("scrape", "steam", "opencritic")}
+    if not resume:
+        for checkpoint in checkpoints.values():
+            checkpoint.clear()
+
+    history = PlayerHistory(history_path)
+    chart_rows = metrics.timed("scrape", scrape_stage(games, checkpoints["scrape"], history))
+    game_rows = metrics.timed("steam", steam_refresh_stage(chart_rows, previous, checkpoints["steam"], max_workers, steam_max_age_days))
+    enriched_rows = metrics.timed("opencritic", opencritic_refresh_stage(game_rows, previous, checkpoints["opencritic"], opencritic_max_age_days))
+    save_stage(enriched_rows, snapshot_root, csv_path)
+    history.close()
+
+    for checkpoint in checkpoints.values():
+        checkpoint.clear()
+    write_run_report(report_path, prometheus_path)
+
+### OpenCritic stage over the latest snapshot: games without OpenCritic data (e.g. from a fetch with enrich=False) or with data older than max_age_days ###
+### are looked up, everything else is kept. The enriched dataset is written as today's snapshot and to the csv ###
+def enrich_snapshot(offline: bool = False, max_age_days: float = OPENCRITIC_MAX_AGE_DAYS, checkpoint_dir: str = "data/checkpoints", resume: bool = True,
+                    snapshot_root: str = DEFAULT_SNAPSHOT_ROOT, report_path: str = DEFAULT_REPORT_PATH, prometheus_path: str = None,
+                    csv_path: str = DEFAULT_CSV_PATH) -> int:
+    previous = load_previous(snapshot_root)
+    if not previous:
+        raise FileNotFoundError(f"No snapshots found in {snapshot_root}")
+
+    configure_cache(offline=offline)
+    metrics = reset_metrics()
+    log.info(f"Enriching {len(previous)} games from the latest snapshot with OpenCritic data.", extra={"previous": len(previous)})
+    checkpoint = Checkpoint(os.path.join(checkpoint_dir, "enrich-opencritic.jsonl"))
+    if not resume:
+        checkpoint.clear()
+
+    game_rows = (record.to_row() for record in previous.values())
+    enriched_rows = metrics.timed("opencritic", opencritic_refresh_stage(game_rows, previous, checkpoint, max_age_days))
+    rows = save_stage(enriched_rows, snapshot_root, csv_path)
+
+    checkpoint.clear()
+    write_run_report(report_path, prometheus_path)
+    return rows
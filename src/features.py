@@ -0,0 +1,95 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#Derived metrics for the analysis, computed once and in place on the whole dataset
+#Free/paid/discounted views are boolean masks over that one frame instead of copies, so memory doesn't grow with each view
+
+
+import pandas as pd
+
+from schema import parse_release_dates
+
+### Columns shown for the best/worst value rankings ###
+VALUE_COLUMNS = ["game name", "Current Price (USD)", "TopCriticScore", "Popularity_Factor", "Value"]
+
+### Columns described by the summary statistics ###
+SUMMARY_COLUMNS = ["Current Players", "Peak Players", "Current Price (USD)", "Discount Percentage", "TopCriticScore", "MedianCriticScore",
+                   "PercentRecommended", "TotalReviews", "Popularity_Factor", "Value"]
+
+### Columns of the correlation heat map ###
+CORRELATION_COLUMNS = ["TopCriticScore", "MedianCriticScore", "PercentRecommended", "TotalReviews", "Current Players", "Peak Players", "Current Price (USD)"]
+
+### Added to Price in the Value metric so free games don't divide by zero and cheap games aren't boosted too much ###
+VALUE_PRICE_OFFSET = 200
+
+
+### Adds every derived column in place: Release Year, Game Age (Years), Popularity_Factor, Critic Score Normalized, Dollar Value and Value ###
+def add_features(df: pd.DataFrame, today=None) -> pd.DataFrame:
+    current_year = pd.Timestamp(today or pd.Timestamp.today()).year
+
+    if "Release Date" in df.columns:
+        df["Release Year"] = parse_release_dates(df["Release Date"]).dt.year
+    else:
+        df["Release Year"] = float("nan")
+    df["Game Age (Years)"] = current_year - df["Release Year"]
+
+    df["Popularity_Factor"] = df["Current Players"] / df["Peak Players"]
+
+    # Modify the critic score to be between a range of 0-1
+    df["Critic Score Normalized"] = df["TopCriticScore"] / 100
+
+    # Attempt to account for $$$ by incorporating the cost
+    price = pd.to_numeric(df["Current Price (USD)"], errors="coerce")
+    df["Current Price (USD)"] = price
+    df["Dollar Value"] = df["Critic Score Normalized"] / (price + 1)
+
+    df["Value"] = (df["TopCriticScore"].fillna(0) * df["Popularity_Factor"]) / (price.fillna(0) + VALUE_PRICE_OFFSET)
+    return df
+
+### True where the column is missing or only whitespace, categoricals only check their categories instead of every row ###
+def _blank(values: pd.Series) -> pd.Series:
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        categories = values.cat.categories
+        blank_categories = categories[categories.astype("string").str.strip() == ""]
+        return values.isna() | values.isin(blank_categories)
+    return values.isna() | (values.astype("string").str.strip() == "")
+
+### Games with an OpenCritic tier ###
+def rated_mask(df: pd.DataFrame) -> pd.Series:
+    return ~_blank(df["OC_Tier"])
+
+### Some games are not marked as free and do not contain a price, sometimes these are bundles for games and work as a single launcher ###
+def valid_price_mask(df: pd.DataFrame) -> pd.Series:
+    free = df["Free game?"].fillna(False).astype(bool)
+    paid = ~df["Free game?"].fillna(True).astype(bool) & (df["Current Price (USD)"] > 0).fillna(False).astype(bool)
+    return free | paid
+
+def free_mask(df: pd.DataFrame) -> pd.Series:
+    return df["Free game?"].fillna(False).astype(bool)
+
+def paid_mask(df: pd.DataFrame) -> pd.Series:
+    return ~df["Free game?"].fillna(True).astype(bool)
+
+def discounted_mask(df: pd.DataFrame) -> pd.Series:
+    return paid_mask(df) & (df["Discount Percentage"].fillna(0) > 0).astype(bool)
+
+### Correlation of two columns over the rows in mask, only those two columns are pulled out ###
+def correlation(df: pd.DataFrame, mask: pd.Series, x: str, y: str) -> float:
+    return df.loc[mask, [x, y]].corr().iloc[0, 1]
+
+### count, mean, std, min and max of each column over the rows in mask ###
+def summary_statistics(df: pd.DataFrame, mask: pd.Series, columns: list = None) -> pd.DataFrame:
+    values = df.loc[mask, columns or SUMMARY_COLUMNS].astype("float64")
+    return values.agg(["count", "mean", "std", "min", "max"]).T
+
+### Top k rows by a column without sorting the whole frame, nlargest/nsmallest only keep k rows around ###
+def top_k(df: pd.DataFrame, k: int = 5, mask: pd.Series = None, column: str = "Value", largest: bool = True) -> pd.DataFrame:
+    values = df[column] if mask is None else df.loc[mask, column]
+    values = values.astype("float64").dropna()
+    best = values.nlargest(k) if largest else values.nsmallest(k)
+    return df.loc[best.index, VALUE_COLUMNS]
+
+### Best value games: well reviewed and still played relative to their peak, for what they cost ###
+def hidden_gems(df: pd.DataFrame, k: int = 5, mask: pd.Series = None) -> pd.DataFrame:
+    return top_k(df, k, mask, "Value", largest=True)
+
+def worst_value(df: pd.DataFrame, k: int = 5, mask: pd.Series = None) -> pd.DataFrame:
+    return top_k(df, k, mask, "Value", largest=False)
@@ -0,0 +1,303 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#Figure rendering for analyze_data
+#Every figure is an independent task that draws on the off-screen Agg backend in a process pool and is closed as soon as it is saved
+#A figure is skipped when the data it is drawn from hasn't changed since the last time it was rendered
+
+
+import hashlib
+import json
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+import pandas as pd
+import seaborn as sns
+
+from features import CORRELATION_COLUMNS
+from metrics import get_logger
+
+### Bump when the plotting code changes so every figure is redrawn even if the data is the same ###
+FIGURE_VERSION = 1
+
+MANIFEST_NAME = ".figure_hashes.json"
+
+### filename under results/, the function that draws it and the only columns it needs ###
+FigureTask = namedtuple("FigureTask", ["filename", "plot", "data"])
+
+log = get_logger("figures")
+
+
+def _free_or_paid(df: pd.DataFrame) -> pd.Series:
+    return df["Free game?"].map({True: "Free", False: "Paid"})
+
+### Histogram of Critic Tiers ###
+def tiers_histogram(df: pd.DataFrame):
+    fig = plt.figure(figsize=(4, 3))
+    df["OC_Tier"].astype("string").value_counts().plot(kind="bar")
+
+    plt.xlabel("OpenCritic Tier")
+    plt.ylabel("Number of Games")
+    plt.title("Distribution of OpenCritic Tiers [Filtered]")
+    plt.xticks(rotation=0)
+    return fig
+
+### Histogram of Release Date ###
+def release_year_histogram(df: pd.DataFrame):
+    fig = plt.figure(figsize=(4, 3))
+    sns.histplot(df["Release Year"].dropna(), bins=20)
+
+    plt.xlabel("Release Year")
+    plt.ylabel("Number of Games")
+    plt.title("Games per Release Year [Filtered]")
+    plt.xticks(rotation=0)
+    return fig
+
+### Boxplot of Free vs Paid (Top Score) ###
+def free_vs_paid_top_score(df: pd.DataFrame):
+    fig = plt.figure(figsize=(4, 3))
+    sns.boxplot(df, x=_free_or_paid(df), y=df["TopCriticScore"])
+
+    plt.xlabel("Free/Paid")
+    plt.ylabel("Top Critic Score")
+    plt.title("Top Critic Scores - Free vs Paid")
+    plt.xticks(rotation=0)
+    return fig
+
+### Boxplot of Free vs Paid (Median Score) ###
+def free_vs_paid_median_score(df: pd.DataFrame):
+    fig = plt.figure(figsize=(4, 3))
+    sns.boxplot(df, x=_free_or_paid(df), y=df["MedianCriticScore"])
+
+    plt.xlabel("Free/Paid")
+    plt.ylabel("Median Critic Score")
+    plt.title("Median Critic Scores - Free vs Paid")
+    plt.xticks(rotation=0)
+    return fig
+
+### Boxplot of Free vs Paid (Popularity Factor) ###
+def free_vs_paid_popularity(df: pd.DataFrame):
+    fig = plt.figure(figsize=(4, 3))
+    sns.boxplot(df.dropna(subset=["Popularity_Factor"]), x=_free_or_paid(df), y=df["Popularity_Factor"])
+
+    plt.xlabel("Free/Paid")
+    plt.ylabel("Popularity Factor")
+    plt.title("Popularity Factor - Free vs Paid")
+    plt.xticks(rotation=0)
+    return fig
+
+### Scatterplot Discount Percentage and Popularity ###
+def discount_vs_popularity(df: pd.DataFrame):
+    fig = plt.figure(figsize=(4, 3))
+    sns.scatterplot(df, x="Discount Percentage", y="Popularity_Factor")
+
+    plt.xlabel("Discount Percentage")
+    plt.ylabel("Popularity Factor")
+    plt.title("Discount Percentage vs Popularity Factor")
+    plt.xticks(rotation=0)
+    return fig
+
+### Scatterplot of Ratings vs Age ###
+def ratings_vs_age(df: pd.DataFrame):
+    fig = plt.figure(figsize=(4, 3))
+    sns.scatterplot(df.dropna(subset=["Game Age (Years)", "TopCriticScore"]), x="Game Age (Years)", y="TopCriticScore")
+
+    plt.xlabel("Game Age (Years)")
+    plt.ylabel("Top Critic Score")
+    plt.title("Game Age vs Top Critic Score")
+    plt.xticks(rotation=0)
+    return fig
+
+### Pair plot for comparison of reviews ###
+def reviews_pair_plot(df: pd.DataFrame):
+    grid = sns.pairplot(df.dropna())
+    plt.suptitle("Pair Plot: Critic Scores", y=1.02)
+    return grid.figure
+
+### Scatterplot to compare  # of Reviews and # of Current Players ###
+def review_count_vs_players(df: pd.DataFrame):
+    fig = plt.figure(figsize=(4, 3))
+    sns.scatterplot(df, x="TotalReviews", y="Current Players")
+
+    plt.xlabel("Number of OpenCritic Reviews")
+    plt.ylabel("Current Players")
+    plt.title("Current Players vs Number of Reviews")
+    return fig
+
+### Correlation heat map ###
+def correlation_heat_map(df: pd.DataFrame):
+    return correlation_matrix_heat_map(df.corr())
+
+### Correlation heat map of a matrix that is already computed ###
+def correlation_matrix_heat_map(matrix: pd.DataFrame):
+    fig = plt.figure(figsize=(7, 5))
+    sns.heatmap(matrix, annot=True, fmt=".2f", cmap="coolwarm")
+    plt.title("Correlation Matrix of Game Stats")
+    plt.xticks(rotation=45)
+    return fig
+
+### Popularity Factor histogram ###
+def popularity_histogram(df: pd.DataFrame):
+    fig = plt.figure(figsize=(4, 3))
+    sns.histplot(df["Popularity_Factor"], bins=30, kde=True)
+    plt.title("Popularity Factor Histogram - (Current/Peak)")
+    plt.xlabel("Popularity Factor")
+    plt.ylabel("Count")
+    return fig
+
+### Pair plot for comparison of free vs paid ###
+def free_vs_paid_pair_plot(df: pd.DataFrame):
+    df_temporary = df.copy()
+    df_temporary["Game Type"] = _free_or_paid(df_temporary)
+
+    columns = ["TopCriticScore", "PercentRecommended", "TotalReviews", "Popularity_Factor"]
+    grid = sns.pairplot(df_temporary, vars=columns, hue="Game Type", diag_kind="kde", corner=False, palette="viridis")
+
+    plt.suptitle("Pair Plot: Free vs Paid", y=1.02)
+    return grid.figure
+
+### Histogram of counts binned ahead of time (left, right, count per bin), drawn with the same bars as histplot on the raw values ###
+def _counted_histogram(bins: pd.DataFrame) -> None:
+    edges = [*bins["left"], bins["right"].iloc[-1]] if len(bins) else 1
+    sns.histplot(x=bins["left"], weights=bins["count"], bins=edges)
+
+### Histogram of Critic Tiers from counted tiers ###
+def tier_counts_histogram(counts: pd.DataFrame):
+    fig = plt.figure(figsize=(4, 3))
+    counts.set_index("OC_Tier")["count"].plot(kind="bar")
+
+    plt.xlabel("OpenCritic Tier")
+    plt.ylabel("Number of Games")
+    plt.title("Distribution of OpenCritic Tiers [Filtered]")
+    plt.xticks(rotation=0)
+    return fig
+
+### Histogram of Release Date from binned counts ###
+def release_year_counts_histogram(bins: pd.DataFrame):
+    fig = plt.figure(figsize=(4, 3))
+    _counted_histogram(bins)
+
+    plt.xlabel("Release Year")
+    plt.ylabel("Number of Games")
+    plt.title("Games per Release Year [Filtered]")
+    plt.xticks(rotation=0)
+    return fig
+
+### Popularity Factor histogram from binned counts, there is no kde curve without the raw values ###
+def popularity_counts_histogram(bins: pd.DataFrame):
+    fig = plt.figure(figsize=(4, 3))
+    _counted_histogram(bins)
+    plt.title("Popularity Factor Histogram - (Current/Peak)")
+    plt.xlabel("Popularity Factor")
+    plt.ylabel("Count")
+    return fig
+
+### Every figure analyze_data produces, each task only carries the columns it draws ###
+### clean and discounted are boolean masks over df, only the selected rows and columns are copied out for each task ###
+def figure_tasks(df: pd.DataFrame, clean: pd.Series, discounted: pd.Series) -> list:
+    def rows(mask, columns):
+        return df.loc[mask, columns]
+
+    return [
+        FigureTask("OC_Tiers_Histo.png", tiers_histogram, rows(clean, ["OC_Tier"])),
+        FigureTask("Release_Date_Histo.png", release_year_histogram, rows(clean, ["Release Year"])),
+        FigureTask("Free_vs_Paid_Top_Score.png", free_vs_paid_top_score, rows(clean, ["Free game?", "TopCriticScore"])),
+        FigureTask("Free_vs_Paid_Med_Score.png", free_vs_paid_median_score, rows(clean, ["Free game?", "MedianCriticScore"])),
+        FigureTask("Free_vs_Paid_PopularityFactor.png", free_vs_paid_popularity, rows(clean, ["Free game?", "Popularity_Factor"])),
+        FigureTask("Scatter_Discount_Popularity.png", discount_vs_popularity, rows(discounted, ["Discount Percentage", "Popularity_Factor"])),
+        FigureTask("Scatter_Ratings_Age.png", ratings_vs_age, rows(clean, ["Game Age (Years)", "TopCriticScore"])),
+        FigureTask("Pair_Plot_Reviews.png", reviews_pair_plot, rows(clean, ["TopCriticScore", "MedianCriticScore", "PercentRecommended", "TotalReviews"])),
+        FigureTask("Scatter_ReviewCount_CurrentPlayers.png", review_count_vs_players, rows(clean, ["TotalReviews", "Current Players"])),
+        FigureTask("Heat_Map.png", correlation_heat_map, rows(clean, CORRELATION_COLUMNS)),
+        FigureTask("PopularityFactor_Count.png", popularity_histogram, rows(clean, ["Popularity_Factor"])),
+        FigureTask("Pair_Plot_Free_vs_Paid.png", free_vs_paid_pair_plot,
+                   rows(clean, ["Free game?", "TopCriticScore", "PercentRecommended", "TotalReviews", "Popularity_Factor"])),
+    ]
+
+### The same figures for analyze_streaming: histograms and the heat map come from the accumulated counts and correlation matrix, ###
+### the scatter, box and pair plots are drawn from the reservoir sample (every filtered game when there are fewer than the sample size) ###
+def streaming_figure_tasks(sample: pd.DataFrame, discounted: pd.Series, tiers: pd.DataFrame, release_years: pd.DataFrame,
+                           popularity: pd.DataFrame, correlations: pd.DataFrame) -> list:
+    counted = {
+        "OC_Tiers_Histo.png": FigureTask("OC_Tiers_Histo.png", tier_counts_histogram, tiers),
+        "Release_Date_Histo.png": FigureTask("Release_Date_Histo.png", release_year_counts_histogram, release_years),
+        "Heat_Map.png": FigureTask("Heat_Map.png", correlation_matrix_heat_map, correlations),
+        "PopularityFactor_Count.png": FigureTask("PopularityFactor_Count.png", popularity_counts_histogram, popularity),
+    }
+    everything = pd.Series(True, index=sample.index)
+    return [counted.get(task.filename, task) for task in figure_tasks(sample, everything, discounted)]
+
+### Hash of everything that decides what a figure looks like: the plotting code version, the function and its input data ###
+def task_hash(task: FigureTask) -> str:
+    digest = hashlib.sha256()
+    digest.update(f"{FIGURE_VERSION}:{task.plot.__name__}:{list(task.data.columns)}:{list(task.data.dtypes.astype(str))}".encode())
+    digest.update(pd.util.hash_pandas_object(task.data, index=False).values.tobytes())
+    return digest.hexdigest()
+
+### Worker setup, every process draws off-screen with the same style as the notebook ###
+def _init_worker() -> None:
+    matplotlib.use("Agg")
+    plt.style.use("Solarize_Light2")
+    sns.set_theme()
+
+### Draws one figure, saves it and closes it straight away so memory doesn't build up ###
+def render_figure(task: FigureTask, output_folder: str) -> str:
+    fig = task.plot(task.data)
+    full_path = os.path.join(output_folder, task.filename)
+    fig.savefig(full_path)
+    plt.close(fig)
+    return full_path
+
+def _load_manifest(output_folder: str) -> dict:
+    path = os.path.join(output_folder, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except ValueError:
+        return {}
+
+def _save_manifest(output_folder: str, manifest: dict) -> None:
+    path = os.path.join(output_folder, MANIFEST_NAME)
+    with open(path + ".partial", "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + ".partial", path)
+
+### Renders every task whose data changed (or whose file is missing) in a process pool, returns the files that were redrawn ###
+def render_figures(tasks: list, output_folder: str = "results", max_workers: int = None, force: bool = False) -> list:
+    os.makedirs(output_folder, exist_ok=True)
+    manifest = _load_manifest(output_folder)
+
+    stale = []
+    for task in tasks:
+        digest = task_hash(task)
+        up_to_date = manifest.get(task.filename) == digest and os.path.exists(os.path.join(output_folder, task.filename))
+        if force or not up_to_date:
+            stale.append((task, digest))
+
+    log.info(f"Rendering {len(stale)} of {len(tasks)} figures, the rest are unchanged.", extra={"stale": len(stale), "figures": len(tasks)})
+    if not stale:
+        return []
+
+    rendered = []
+    try:
+        if max_workers == 1:
+            _init_worker()
+            for task, digest in stale:
+                rendered.append(render_figure(task, output_folder))
+                manifest[task.filename] = digest
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as pool:
+                futures = [(pool.submit(render_figure, task, output_folder), task, digest) for task, digest in stale]
+                for future, task, digest in futures:
+                    rendered.append(future.result())
+                    manifest[task.filename] = digest
+    finally:
+        #Figures that did render are remembered even if another one failed
+        _save_manifest(output_folder, manifest)
+    return rendered
@@ -0,0 +1,122 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#Shared HTTP client for every fetcher: pooled keep-alive sessions, retries with backoff and separate connect/read timeouts
+
+
+import email.utils
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import get_metrics
+
+### (connect, read) timeouts in seconds, a dead host fails fast instead of stalling the whole run ###
+DEFAULT_TIMEOUT = (5, 30)
+
+### Statuses worth retrying, anything else is returned to the caller straight away ###
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+### Connections kept alive per pool, the Steam pool is resized to the worker count by the fetch engine ###
+POOL_SIZES = {
+    "steamcharts": 2,
+    "steam": 4,
+    "opencritic": 2,
+}
+
+DEFAULT_HEADERS = {"User-Agent": "Mozilla/5.0"}
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+def _new_session(maxsize: int) -> requests.Session:
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=maxsize, pool_block=True)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+### One keep-alive session per pool, created the first time it is used ###
+def get_session(pool: str) -> requests.Session:
+    with _lock:
+        session = _sessions.get(pool)
+        if session is None:
+            session = _new_session(POOL_SIZES.get(pool, 2))
+            _sessions[pool] = session
+        return session
+
+### Resizes a pool, e.g. so the Steam pool holds exactly one connection per worker ###
+def configure_pool(pool: str, maxsize: int) -> None:
+    with _lock:
+        if POOL_SIZES.get(pool) == maxsize and pool in _sessions:
+            return
+        POOL_SIZES[pool] = maxsize
+        old = _sessions.pop(pool, None)
+        _sessions[pool] = _new_session(maxsize)
+    if old is not None:
+        old.close()
+
+def close_sessions() -> None:
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+### Seconds the server asked us to wait, Retry-After can be a number of seconds or an HTTP date ###
+def retry_after_seconds(response) -> float:
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(when.timestamp() - time.time(), 0.0)
+
+### Exponential backoff with full jitter so retrying workers don't all hit the server at the same moment ###
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+### RapidAPI answers 429 both for bursts and for a used up daily quota, retrying the second one only wastes time ###
+def _quota_exhausted(response) -> bool:
+    return response.headers.get("x-ratelimit-requests-remaining") == "0"
+
+### GET through a pooled session, retrying connection errors, 429 and 5xx with backoff that respects Retry-After ###
+### on_attempt is called before every attempt, e.g. to claim quota, and the last response (or error) is returned/raised ###
+### Every attempt's latency, size and status is recorded per host in the run metrics ###
+def get(url: str, pool: str = "default", params: dict = None, headers: dict = None, timeout=DEFAULT_TIMEOUT, retries: int = 3, on_attempt=None) -> requests.Response:
+    session = get_session(pool)
+    host = urlsplit(url).netloc
+    metrics = get_metrics()
+    for attempt in range(retries + 1):
+        if on_attempt:
+            on_attempt()
+        started = time.perf_counter()
+        try:
+            response = session.get(url, params=params, headers=headers, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as error:
+            metrics.observe_request(host, time.perf_counter() - started, status=type(error).__name__)
+            if attempt == retries:
+                metrics.count("request_failures", host=host)
+                raise
+            delay = backoff_delay(attempt)
+        else:
+            metrics.observe_request(host, time.perf_counter() - started, len(response.content), response.status_code)
+            if response.status_code not in RETRY_STATUSES or attempt == retries or _quota_exhausted(response):
+                if response.status_code >= 400:
+                    metrics.count("request_failures", host=host)
+                return response
+            delay = retry_after_seconds(response)
+            if delay is None:
+                delay = backoff_delay(attempt)
+        metrics.count("retries", host=host)
+        metrics.count("retry_wait_seconds", delay, host=host)
+        time.sleep(delay)
@@ -1,6 +1,145 @@
-from data_pull import run
+#DSCI 510 - Ryan McDermott - Final Project
+#Command line entry point: python main.py {fetch,enrich,catalog,refresh,analyze} [options], fetch is the default
+#Each command imports only the modules it runs, a scheduled fetch never loads the analysis or plotting libraries
+
+
+import argparse
+import sys
+
+from metrics import configure_logging
+
+### Default number of SteamCharts games, kept low because of the OpenCritic API key limitations ###
+MostPopularGames = 25
+
+COMMANDS = ("fetch", "enrich", "catalog", "refresh", "analyze")
+
+
+### Top SteamCharts games -> Steam Store -> OpenCritic -> csv and today's Parquet snapshot, --no-enrich stops before OpenCritic ###
+def run_fetch(args) -> None:
+    options = dict(offline=args.offline, resume=not args.fresh, prometheus_path=args.prometheus, csv_path=args.output)
+    if args.use_async and args.enrich:
+        from async_pipeline import run_async
+
+        run_async(args.games, steam_workers=args.workers, **options)
+    else:
+        from data_pull import run
+
+        run(args.games, max_workers=args.workers, enrich=args.enrich, **options)
+
+### OpenCritic data for the games of the latest snapshot that don't have it yet or whose data is older than --max-age days ###
+def run_enrich(args) -> None:
+    from data_pull import DEFAULT_CSV_PATH, OPENCRITIC_MAX_AGE_DAYS, enrich_snapshot
+
+    max_age_days = OPENCRITIC_MAX_AGE_DAYS if args.max_age is None else args.max_age
+    enrich_snapshot(offline=args.offline, max_age_days=max_age_days, resume=not args.fresh, prometheus_path=args.prometheus, csv_path=args.output or DEFAULT_CSV_PATH)
+
+### Every appid in Steam's app list instead of the SteamCharts top games, one shard per process ###
+def run_catalog_command(args) -> None:
+    from catalog import run_catalog
+
+    shard, shards = (int(part) for part in args.shard.split("/"))
+    run_catalog(shard - 1, shards, max_workers=args.workers, limit=args.limit, offline=args.offline, resume=not args.fresh, catalog_dir=args.output, rate=args.rate)
+
+### Builds on the latest snapshot: a full refresh, only the prices, or the prices in other store regions ###
+def run_refresh(args) -> None:
+    if args.regions:
+        from regions import DEFAULT_REGIONS, run_regional_prices
+
+        regions = DEFAULT_REGIONS if args.regions == "default" else args.regions.split(",")
+        output = {"csv_path": args.output} if args.output else {}
+        run_regional_prices(regions, max_workers=args.workers, offline=args.offline, prometheus_path=args.prometheus, **output)
+        return
+
+    from data_pull import DEFAULT_CSV_PATH, refresh, refresh_prices
+
+    csv_path = args.output or DEFAULT_CSV_PATH
+    if args.prices_only:
+        refresh_prices(max_workers=args.workers, offline=args.offline, csv_path=csv_path, prometheus_path=args.prometheus)
+    else:
+        refresh(args.games, max_workers=args.workers, offline=args.offline, resume=not args.fresh, prometheus_path=args.prometheus, csv_path=csv_path)
+
+### Statistics, value rankings and the figures in results/ for a snapshot folder or a csv, in memory or in chunks ###
+def run_analyze(args) -> None:
+    if args.stream or args.all_dates:
+        from analysis import analyze_streaming
+        from schema import snapshot_dates
+
+        dates = snapshot_dates(args.input) if args.all_dates else [args.date] if args.date else None
+        analyze_streaming(args.input, dates, chunk_size=args.chunk_size, sample_size=args.sample_size, max_workers=args.workers)
+    else:
+        from analysis import analyze_data
+
+        analyze_data(args.input, args.date, max_workers=args.workers)
+
+def build_parser() -> argparse.ArgumentParser:
+    log_options = argparse.ArgumentParser(add_help=False)
+    log_options.add_argument("--log-level", default="INFO", help="Logging level, e.g. DEBUG, INFO or WARNING")
+    log_options.add_argument("--log-json", action="store_true", help="Write logs as one JSON object per line instead of plain text")
+
+    #Only the commands that make requests and write a run report
+    run_options = argparse.ArgumentParser(add_help=False, parents=[log_options])
+    run_options.add_argument("--offline", action="store_true", help="Only use responses already stored in the on-disk cache, no network calls")
+    run_options.add_argument("--prometheus", default=None, help="Also write the run metrics to this file in the Prometheus text format")
+
+    parser = argparse.ArgumentParser(description="Steam Hidden Gems data pull")
+    commands = parser.add_subparsers(dest="command", metavar="{" + ",".join(COMMANDS) + "}")
+
+    command = commands.add_parser("fetch", parents=[run_options], help="Fetch and enrich the top SteamCharts games (default)")
+    command.add_argument("-n", "--games", type=int, default=MostPopularGames, help="Number of SteamCharts games to fetch")
+    command.add_argument("-o", "--output", default="data/most_popular_steam_games.csv", help="csv to write, the Parquet snapshot always goes to data/snapshots")
+    command.add_argument("-w", "--workers", type=int, default=4, help="Concurrent Steam Store requests")
+    command.add_argument("--async", dest="use_async", action="store_true", help="Run the scrape, Steam and OpenCritic stages at the same time with asyncio")
+    command.add_argument("--no-enrich", dest="enrich", action="store_false",
+                         help="Stop after the Steam stage without spending OpenCritic quota (always the synchronous pipeline), run enrich later")
+    command.add_argument("--fresh", action="store_true", help="Ignore the checkpoints of an unfinished run and start over")
+    command.set_defaults(handler=run_fetch)
+
+    command = commands.add_parser("enrich", parents=[run_options], help="Add OpenCritic data to the latest snapshot's games that are missing it or have stale data")
+    command.add_argument("-o", "--output", default=None, help="csv to write, defaults to the dataset csv")
+    command.add_argument("--max-age", type=float, default=None, help="Look games up again once their OpenCritic data is this many days old (30 by default)")
+    command.add_argument("--fresh", action="store_true", help="Ignore the checkpoint of an unfinished enrich and start over")
+    command.set_defaults(handler=run_enrich)
+
+    command = commands.add_parser("catalog", parents=[run_options], help="Enrich every appid in Steam's app list instead of the SteamCharts top games")
+    command.add_argument("--shard", default="1/1", help="Catalog shard to run as INDEX/COUNT, e.g. 2/4 runs the second of four shards")
+    command.add_argument("--limit", type=int, default=None, help="Stop after this many appids")
+    command.add_argument("-o", "--output", default="data/catalog", help="Folder for the shard's csv")
+    command.add_argument("-w", "--workers", type=int, default=4, help="Concurrent Steam Store requests")
+    command.add_argument("--rate", type=float, default=None,
+                         help="Steam Store requests a second for this shard, defaults to Steam's budget split between the shards (only raise it for shards on different IPs)")
+    command.add_argument("--fresh", action="store_true", help="Ignore the shard's checkpoint and start over")
+    command.set_defaults(handler=run_catalog_command)
+
+    command = commands.add_parser("refresh", parents=[run_options], help="Refresh the latest snapshot: new player counts for every game, Steam and OpenCritic only for new or stale games")
+    command.add_argument("-n", "--games", type=int, default=MostPopularGames, help="Number of SteamCharts games to refresh")
+    command.add_argument("-o", "--output", default=None, help="csv to write, defaults to the dataset csv (or data/regional_prices.csv with --regions)")
+    command.add_argument("-w", "--workers", type=int, default=4, help="Concurrent Steam Store requests")
+    command.add_argument("--prices-only", action="store_true", help="Only refresh the prices of the games in the latest snapshot, in batched requests")
+    command.add_argument("--regions", nargs="?", const="default", default=None,
+                         help="Fetch the prices of the latest snapshot's games in these comma separated store regions, e.g. us,gb,de (20 regions if no list is given)")
+    command.add_argument("--fresh", action="store_true", help="Ignore the checkpoints of an unfinished refresh and start over")
+    command.set_defaults(handler=run_refresh)
+
+    command = commands.add_parser("analyze", parents=[log_options], help="Print the statistics and value rankings and draw the figures in results/")
+    command.add_argument("-i", "--input", default="data/snapshots", help="Snapshot folder or csv to analyze")
+    command.add_argument("--date", default=None, help="Snapshot day to analyze as YYYY-MM-DD, the latest by default")
+    command.add_argument("-w", "--workers", type=int, default=None, help="Processes scanning snapshot files and drawing the figures")
+    command.add_argument("--stream", action="store_true", help="Analyse in chunks with bounded memory instead of loading the whole day")
+    command.add_argument("--all-dates", action="store_true", help="Analyse every stored snapshot day together (implies --stream)")
+    command.add_argument("--chunk-size", type=int, default=50_000, help="Rows read at a time with --stream")
+    command.add_argument("--sample-size", type=int, default=5_000, help="Rows sampled for the scatter, box and pair plots with --stream")
+    command.set_defaults(handler=run_analyze)
+    return parser
+
+def main(argv: list = None) -> None:
+    argv = sys.argv[1:] if argv is None else list(argv)
+    #No command (or only options) runs fetch, so plain `python main.py` still does what it always did
+    if not argv or (argv[0] not in COMMANDS and argv[0] not in ("-h", "--help")):
+        argv = ["fetch", *argv]
+    args = build_parser().parse_args(argv)
+    configure_logging(args.log_level.upper(), json_lines=args.log_json)
+    args.handler(args)
 
 
 if __name__ == "__main__":
-    MostPopularGames = 25
-    run(MostPopularGames)
+    main()
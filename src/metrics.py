@@ -0,0 +1,292 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#Run metrics and logging for the pipeline: per-stage timers, per-host request latency, bytes, retry/cache/failure counters and rows per second
+#Everything is collected in one process-wide Metrics object and written out as a JSON run report (and optionally a Prometheus text file)
+
+
+import bisect
+import contextlib
+import datetime
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+DEFAULT_REPORT_PATH = "data/run_report.json"
+
+### Upper bounds (seconds) of the request latency histogram buckets ###
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float("inf"))
+
+LOGGER_NAME = "hidden_gems"
+
+
+### Latency histogram with fixed buckets, memory doesn't grow with the number of requests ###
+class Histogram:
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    ### Upper bound of the bucket the q-th quantile falls in, good enough to spot a slow host ###
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.buckets[-1]
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum_seconds": round(self.sum, 6),
+            "mean_seconds": round(self.sum / self.count, 6) if self.count else None,
+            "p50_seconds": self.quantile(0.5),
+            "p95_seconds": self.quantile(0.95),
+            "buckets": {("+Inf" if bound == float("inf") else str(bound)): count for bound, count in zip(self.buckets, self.counts)},
+        }
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started = time.time()
+        self.stages = {}
+        self.hosts = {}
+        self.counters = {}
+
+    ### Adds to a counter, labels (e.g. source="steam") are kept as separate series ###
+    def count(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    ### One HTTP attempt: latency, bytes received and status (or the error type) per host ###
+    def observe_request(self, host: str, seconds: float, size: int = 0, status=None) -> None:
+        with self.lock:
+            stats = self.hosts.get(host)
+            if stats is None:
+                stats = {"requests": 0, "bytes": 0, "statuses": {}, "latency": Histogram()}
+                self.hosts[host] = stats
+            stats["requests"] += 1
+            stats["bytes"] += size
+            stats["statuses"][str(status)] = stats["statuses"].get(str(status), 0) + 1
+            stats["latency"].observe(seconds)
+
+    def _stack(self) -> list:
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def _stage_stats(self, name: str) -> dict:
+        return self.stages.setdefault(name, {"seconds": 0.0, "self_seconds": 0.0, "calls": 0, "rows": 0})
+
+    ### Times a block of code as a stage ###
+    ### Stages can nest, self_seconds leaves out the time spent in the stages running inside this one ###
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        stack = self._stack()
+        frame = [name, time.perf_counter(), 0.0]
+        stack.append(frame)
+        try:
+            yield
+        finally:
+            stack.pop()
+            elapsed = time.perf_counter() - frame[1]
+            if stack:
+                stack[-1][2] += elapsed
+            with self.lock:
+                stats = self._stage_stats(name)
+                stats["seconds"] += elapsed
+                stats["self_seconds"] += elapsed - frame[2]
+                stats["calls"] += 1
+
+    ### Times a generator stage: only the time spent producing each row counts, and every row it yields is counted ###
+    ### Upstream generators pulled from inside it are timed as their own stages and left out of its self_seconds ###
+    def timed(self, name: str, rows):
+        rows = iter(rows)
+        stack = self._stack()
+        with self.lock:
+            self._stage_stats(name)["calls"] += 1
+        while True:
+            frame = [name, time.perf_counter(), 0.0]
+            stack.append(frame)
+            try:
+                row = next(rows)
+            except StopIteration:
+                return
+            finally:
+                stack.pop()
+                elapsed = time.perf_counter() - frame[1]
+                if stack:
+                    stack[-1][2] += elapsed
+                with self.lock:
+                    stats = self._stage_stats(name)
+                    stats["seconds"] += elapsed
+                    stats["self_seconds"] += elapsed - frame[2]
+            with self.lock:
+                self._stage_stats(name)["rows"] += 1
+            yield row
+
+    ### Adds rows to a stage timed with stage(), e.g. the rows a DataFrame was built from ###
+    def add_rows(self, name: str, rows: int) -> None:
+        with self.lock:
+            self._stage_stats(name)["rows"] += rows
+
+    def report(self) -> dict:
+        with self.lock:
+            stages = {}
+            for name, stage in self.stages.items():
+                stages[name] = {
+                    **{key: round(value, 6) if isinstance(value, float) else value for key, value in stage.items()},
+                    "rows_per_second": round(stage["rows"] / stage["seconds"], 3) if stage["seconds"] > 0 and stage["rows"] else None,
+                }
+            hosts = {
+                host: {"requests": stats["requests"], "bytes": stats["bytes"], "statuses": dict(stats["statuses"]), "latency": stats["latency"].to_dict()}
+                for host, stats in self.hosts.items()
+            }
+            counters = {}
+            for (name, labels), value in sorted(self.counters.items()):
+                series = ",".join(f"{key}={label}" for key, label in labels)
+                counters.setdefault(name, {})[series or "total"] = value
+        return {
+            "started": datetime.datetime.fromtimestamp(self.started, datetime.timezone.utc).isoformat(),
+            "duration_seconds": round(time.time() - self.started, 3),
+            "stages": stages,
+            "hosts": hosts,
+            "counters": counters,
+        }
+
+    ### Writes the run report as JSON, replacing the previous one only once it is fully written ###
+    def write_report(self, path: str = DEFAULT_REPORT_PATH) -> str:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".partial", "w") as f:
+            json.dump(self.report(), f, indent=2)
+        os.replace(path + ".partial", path)
+        return path
+
+    ### Same numbers in the Prometheus text format, for the node exporter textfile collector ###
+    def write_prometheus(self, path: str) -> str:
+        lines = []
+
+        def metric(name, kind, help_text):
+            lines.append(f"# HELP hidden_gems_{name} {help_text}")
+            lines.append(f"# TYPE hidden_gems_{name} {kind}")
+
+        def labels(**values):
+            return "{" + ",".join(f'{key}="{value}"' for key, value in values.items()) + "}"
+
+        with self.lock:
+            metric("stage_seconds", "gauge", "Wall time spent in each pipeline stage")
+            for name, stage in self.stages.items():
+                lines.append(f"hidden_gems_stage_seconds{labels(stage=name)} {stage['seconds']:.6f}")
+            metric("stage_rows", "gauge", "Rows produced by each pipeline stage")
+            for name, stage in self.stages.items():
+                lines.append(f"hidden_gems_stage_rows{labels(stage=name)} {stage['rows']}")
+            metric("http_response_bytes", "counter", "Bytes received per host")
+            for host, stats in self.hosts.items():
+                lines.append(f"hidden_gems_http_response_bytes{labels(host=host)} {stats['bytes']}")
+            metric("http_request_seconds", "histogram", "HTTP request latency per host")
+            for host, stats in self.hosts.items():
+                histogram = stats["latency"]
+                seen = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    seen += count
+                    le = "+Inf" if bound == float("inf") else str(bound)
+                    lines.append(f"hidden_gems_http_request_seconds_bucket{labels(host=host, le=le)} {seen}")
+                lines.append(f"hidden_gems_http_request_seconds_sum{labels(host=host)} {histogram.sum:.6f}")
+                lines.append(f"hidden_gems_http_request_seconds_count{labels(host=host)} {histogram.count}")
+            names = sorted({name for name, _ in self.counters})
+            for name in names:
+                metric(f"{name}_total", "counter", name.replace("_", " ").capitalize())
+                for (counter, series), value in sorted(self.counters.items()):
+                    if counter == name:
+                        lines.append(f"hidden_gems_{name}_total{labels(**dict(series)) if series else ''} {value}")
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".partial", "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(path + ".partial", path)
+        return path
+
+
+_metrics = Metrics()
+
+def get_metrics() -> Metrics:
+    return _metrics
+
+### Starts a fresh set of metrics, called at the start of every run ###
+def reset_metrics() -> Metrics:
+    global _metrics
+    _metrics = Metrics()
+    return _metrics
+
+### Writes the report (and the Prometheus file if a path is given) and logs where they went ###
+def write_run_report(report_path: str = DEFAULT_REPORT_PATH, prometheus_path: str = None) -> dict:
+    metrics = get_metrics()
+    if report_path:
+        metrics.write_report(report_path)
+        get_logger("metrics").info(f"Run report written to {report_path}", extra={"path": report_path})
+    if prometheus_path:
+        metrics.write_prometheus(prometheus_path)
+    return metrics.report()
+
+
+### Attributes every LogRecord has, anything else was passed through extra= and is a structured field ###
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+### One JSON object per line: time, level, logger, message and any extra= fields ###
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_FIELDS})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+### Plain text, the extra= fields are appended as key=value so they can still be grepped ###
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s", "%H:%M:%S")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = " ".join(f"{key}={value}" for key, value in vars(record).items() if key not in _RECORD_FIELDS)
+        return f"{text} [{fields}]" if fields else text
+
+### Sets up the pipeline's loggers: level and text or JSON lines, written to stdout like the old prints ###
+def configure_logging(level="INFO", json_lines: bool = False) -> logging.Logger:
+    logger = logging.getLogger(LOGGER_NAME)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if json_lines else TextFormatter())
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+    return logger
+
+### Logger for one module, logging is set up with the defaults the first time one is asked for ###
+def get_logger(name: str) -> logging.Logger:
+    parent = logging.getLogger(LOGGER_NAME)
+    if not parent.handlers:
+        configure_logging()
+    return parent.getChild(name)
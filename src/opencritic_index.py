@@ -0,0 +1,165 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#Local Steam appid -> OpenCritic ID mapping plus a fuzzy name index over every OpenCritic name already seen
+#OpenCritic IDs basically never change, so /meta/search only needs to run for games we have never matched before
+
+
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import Counter
+
+try:
+    from rapidfuzz import fuzz
+except ImportError:
+    fuzz = None
+
+DEFAULT_INDEX_PATH = "data/opencritic_index.sqlite"
+
+### Score (0-1) a local match has to reach before we trust it over a remote search ###
+CONFIDENT_MATCH = 0.85
+
+### Lowercase, drop trademark symbols / accents / punctuation so "DOOM: Eternal™" and "Doom Eternal" compare equal ###
+def normalize_name(name: str) -> str:
+    name = re.sub(r"[™®©]", "", name or "")
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(character for character in name if not unicodedata.combining(character))
+    name = name.lower().replace("&", " and ")
+    name = re.sub(r"[^a-z0-9]+", " ", name)
+    return " ".join(name.split())
+
+def trigrams(normalized: str) -> set:
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+### Similarity between two normalized names, rapidfuzz if installed otherwise trigram Jaccard ###
+### Numbers have to match exactly so sequels ("Dying Light" vs "Dying Light 2") never count as the same game ###
+def similarity(a: str, b: str) -> float:
+    if re.findall(r"\d+", a) != re.findall(r"\d+", b):
+        return 0.0
+    if a == b:
+        return 1.0
+    if fuzz is not None:
+        return fuzz.token_sort_ratio(a, b) / 100.0
+    grams_a, grams_b = trigrams(a), trigrams(b)
+    return len(grams_a & grams_b) / len(grams_a | grams_b)
+
+
+class OpenCriticIndex:
+    def __init__(self, path: str = DEFAULT_INDEX_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS steam_map (
+                appid INTEGER PRIMARY KEY,
+                oc_id INTEGER NOT NULL,
+                oc_name TEXT,
+                method TEXT NOT NULL,
+                updated REAL NOT NULL
+            )
+            """
+        )
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS oc_names (
+                oc_id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                normalized TEXT NOT NULL
+            )
+            """
+        )
+        self.connection.commit()
+
+        ### In memory trigram -> OpenCritic IDs lookup, built once from every name seen so far ###
+        self.names = {}
+        self.grams = {}
+        for oc_id, name, normalized in self.connection.execute("SELECT oc_id, name, normalized FROM oc_names"):
+            self._index(oc_id, name, normalized)
+
+    def _index(self, oc_id: int, name: str, normalized: str) -> None:
+        self.names[oc_id] = (name, normalized)
+        for gram in trigrams(normalized):
+            self.grams.setdefault(gram, set()).add(oc_id)
+
+    ### Remembers an OpenCritic name, e.g. every result that comes back from a search ###
+    def add_name(self, oc_id: int, name: str) -> None:
+        if oc_id is None or not name:
+            return
+        normalized = normalize_name(name)
+        with self.lock:
+            if self.names.get(oc_id, (None, None))[1] == normalized:
+                return
+            self.connection.execute("INSERT OR REPLACE INTO oc_names (oc_id, name, normalized) VALUES (?, ?, ?)", (oc_id, name, normalized))
+            self.connection.commit()
+            self._index(oc_id, name, normalized)
+
+    ### Stored mapping for a Steam appid, {"id", "name"} or None ###
+    def lookup(self, appid: int) -> dict:
+        with self.lock:
+            row = self.connection.execute("SELECT oc_id, oc_name FROM steam_map WHERE appid = ?", (appid,)).fetchone()
+        if row is None:
+            return None
+        return {"id": row[0], "name": row[1]}
+
+    ### When the appid was last matched to OpenCritic, None if it never was ###
+    def last_updated(self, appid: int):
+        with self.lock:
+            row = self.connection.execute("SELECT updated FROM steam_map WHERE appid = ?", (appid,)).fetchone()
+        return row[0] if row else None
+
+    def remember(self, appid: int, oc_id: int, oc_name: str, method: str) -> None:
+        if appid is None or oc_id is None:
+            return
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO steam_map (appid, oc_id, oc_name, method, updated) VALUES (?, ?, ?, ?, ?)",
+                (appid, oc_id, oc_name, method, time.time()),
+            )
+            self.connection.commit()
+
+    ### Best local match for a Steam name as ({"id", "name"}, score), only names sharing the most trigrams get fully scored ###
+    def best_match(self, name: str, candidates: int = 20) -> tuple:
+        normalized = normalize_name(name)
+        if not normalized:
+            return None, 0.0
+        shared = Counter()
+        for gram in trigrams(normalized):
+            shared.update(self.grams.get(gram, ()))
+
+        best, best_score = None, 0.0
+        for oc_id, _ in shared.most_common(candidates):
+            oc_name, oc_normalized = self.names[oc_id]
+            score = similarity(normalized, oc_normalized)
+            if score > best_score:
+                best, best_score = {"id": oc_id, "name": oc_name}, score
+        return best, best_score
+
+    ### Picks the search result that best matches the Steam name instead of blindly taking the first one ###
+    def pick_result(self, name: str, results: list) -> dict:
+        normalized = normalize_name(name)
+        best, best_score = None, -1.0
+        for result in results:
+            score = similarity(normalized, normalize_name(result.get("name", "")))
+            if score > best_score:
+                best, best_score = result, score
+        return best
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+
+_index = None
+
+
+def get_opencritic_index() -> OpenCriticIndex:
+    global _index
+    if _index is None:
+        _index = OpenCriticIndex()
+    return _index
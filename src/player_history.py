@@ -0,0 +1,200 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#Append-only history of SteamCharts player counts, one row per (appid, timestamp)
+#Daily means and rolling 7/30 day aggregates are updated as rows come in so per-game trend queries never rescan the raw history
+
+
+import datetime
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_HISTORY_PATH = "data/player_history.sqlite"
+
+### Least squares slope of (day number, players) points, players gained/lost per day ###
+def _slope(points: list) -> float:
+    if len(points) < 2:
+        return None
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    if spread == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+
+def _day(ts: int) -> str:
+    return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).date().isoformat()
+
+
+class PlayerHistory:
+    def __init__(self, path: str = DEFAULT_HISTORY_PATH, batch_size: int = 100):
+        self.path = path
+        self.batch_size = batch_size
+        self.pending = []
+        self.lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        ### WITHOUT ROWID tables are stored in primary key order, so one game's rows sit together and range queries are a single index seek ###
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS player_counts (
+                appid INTEGER NOT NULL,
+                ts INTEGER NOT NULL,
+                current_players INTEGER,
+                peak_players INTEGER,
+                PRIMARY KEY (appid, ts)
+            ) WITHOUT ROWID;
+
+            CREATE TABLE IF NOT EXISTS daily_players (
+                appid INTEGER NOT NULL,
+                day TEXT NOT NULL,
+                samples INTEGER NOT NULL,
+                current_samples INTEGER NOT NULL DEFAULT 0,
+                mean_current REAL,
+                max_peak INTEGER,
+                PRIMARY KEY (appid, day)
+            ) WITHOUT ROWID;
+
+            CREATE TABLE IF NOT EXISTS rolling_players (
+                appid INTEGER NOT NULL,
+                day TEXT NOT NULL,
+                mean_7d REAL,
+                mean_30d REAL,
+                trend_7d REAL,
+                trend_30d REAL,
+                PRIMARY KEY (appid, day)
+            ) WITHOUT ROWID;
+            """
+        )
+        self._add_current_samples()
+        self.connection.commit()
+
+    ### Histories written before current_samples existed get it counted from the raw samples, with their daily means recomputed over the non-NULL ones ###
+    def _add_current_samples(self) -> None:
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(daily_players)")]
+        if "current_samples" in columns:
+            return
+        self.connection.execute("ALTER TABLE daily_players ADD COLUMN current_samples INTEGER NOT NULL DEFAULT 0")
+        self.connection.execute(
+            """
+            UPDATE daily_players SET
+                current_samples = (SELECT COUNT(current_players) FROM player_counts p WHERE p.appid = daily_players.appid AND date(p.ts, 'unixepoch') = daily_players.day),
+                mean_current = (SELECT AVG(current_players) FROM player_counts p WHERE p.appid = daily_players.appid AND date(p.ts, 'unixepoch') = daily_players.day)
+            """
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.flush()
+        return False
+
+    ### Queues one SteamCharts chart row, rows are written in batches ###
+    def record(self, chart_row: dict, ts: int = None) -> None:
+        ts = int(ts if ts is not None else time.time())
+        self.pending.append((chart_row["appid"], ts, chart_row.get("current_players"), chart_row.get("peak_players")))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def record_many(self, chart_rows, ts: int = None) -> None:
+        for chart_row in chart_rows:
+            self.record(chart_row, ts)
+
+    ### Writes the queued rows, then refreshes the daily and rolling aggregates of every (appid, day) they touched ###
+    ### samples counts every row of the day, the mean only counts the current_samples rows that had a player count ###
+    def flush(self) -> None:
+        with self.lock:
+            if not self.pending:
+                return
+            touched = set()
+            for appid, ts, current_players, peak_players in self.pending:
+                inserted = self.connection.execute(
+                    "INSERT OR IGNORE INTO player_counts (appid, ts, current_players, peak_players) VALUES (?, ?, ?, ?)",
+                    (appid, ts, current_players, peak_players),
+                ).rowcount
+                if not inserted:
+                    continue
+                day = _day(ts)
+                self.connection.execute(
+                    """
+                    INSERT INTO daily_players (appid, day, samples, current_samples, mean_current, max_peak) VALUES (?, ?, 1, ?, ?, ?)
+                    ON CONFLICT (appid, day) DO UPDATE SET
+                        samples = samples + 1,
+                        current_samples = current_samples + excluded.current_samples,
+                        mean_current = CASE
+                            WHEN excluded.mean_current IS NULL THEN mean_current
+                            WHEN mean_current IS NULL THEN excluded.mean_current
+                            ELSE mean_current + (excluded.mean_current - mean_current) / (current_samples + 1)
+                        END,
+                        max_peak = MAX(COALESCE(max_peak, excluded.max_peak), COALESCE(excluded.max_peak, max_peak))
+                    """,
+                    (appid, day, int(current_players is not None), current_players, peak_players),
+                )
+                touched.add((appid, day))
+            for appid, day in touched:
+                self._update_rolling(appid, day)
+            self.connection.commit()
+            self.pending = []
+
+    def _update_rolling(self, appid: int, day: str) -> None:
+        end = datetime.date.fromisoformat(day)
+        start = (end - datetime.timedelta(days=29)).isoformat()
+        rows = self.connection.execute(
+            "SELECT day, mean_current FROM daily_players WHERE appid = ? AND day BETWEEN ? AND ? AND mean_current IS NOT NULL",
+            (appid, start, day),
+        ).fetchall()
+        points_30 = [((datetime.date.fromisoformat(d) - end).days, mean) for d, mean in rows]
+        points_7 = [(x, y) for x, y in points_30 if x > -7]
+        mean_7d = sum(y for _, y in points_7) / len(points_7) if points_7 else None
+        mean_30d = sum(y for _, y in points_30) / len(points_30) if points_30 else None
+        self.connection.execute(
+            "INSERT OR REPLACE INTO rolling_players (appid, day, mean_7d, mean_30d, trend_7d, trend_30d) VALUES (?, ?, ?, ?, ?, ?)",
+            (appid, day, mean_7d, mean_30d, _slope(points_7), _slope(points_30)),
+        )
+
+    ### Raw samples for one game between two unix timestamps ###
+    def history(self, appid: int, start: int = None, end: int = None) -> list:
+        with self.lock:
+            return self.connection.execute(
+                "SELECT ts, current_players, peak_players FROM player_counts WHERE appid = ? AND ts BETWEEN ? AND ? ORDER BY ts",
+                (appid, start if start is not None else 0, end if end is not None else 2 ** 62),
+            ).fetchall()
+
+    ### Daily mean player counts for one game, days are "YYYY-MM-DD" ###
+    def daily(self, appid: int, start: str = None, end: str = None) -> list:
+        with self.lock:
+            return self.connection.execute(
+                "SELECT day, samples, mean_current, max_peak FROM daily_players WHERE appid = ? AND day BETWEEN ? AND ? ORDER BY day",
+                (appid, start or "0000-00-00", end or "9999-99-99"),
+            ).fetchall()
+
+    ### Latest precomputed rolling aggregates for one game: 7/30 day mean and trend (players per day) ###
+    def rolling(self, appid: int, day: str = None) -> dict:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT day, mean_7d, mean_30d, trend_7d, trend_30d FROM rolling_players WHERE appid = ? AND day <= ? ORDER BY day DESC LIMIT 1",
+                (appid, day or "9999-99-99"),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("day", "mean_7d", "mean_30d", "trend_7d", "trend_30d"), row))
+
+    ### Rolling aggregates of every game on one day as a DataFrame, e.g. to join on to a snapshot ###
+    def rolling_for_day(self, day: str = None):
+        import pandas as pd
+
+        day = day or datetime.datetime.now(datetime.timezone.utc).date().isoformat() #days are UTC, like _day
+        with self.lock:
+            return pd.read_sql_query(
+                "SELECT appid, day, mean_7d, mean_30d, trend_7d, trend_30d FROM rolling_players WHERE day = ?",
+                self.connection,
+                params=(day,),
+            )
+
+    def close(self) -> None:
+        self.flush()
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,282 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#Query layer over the enriched dataset: filter, top-K and range queries without editing analyze_data or re-reading the csv
+#The dataset is loaded once in to numpy columns with a presorted order for each indexed column, so a query is a binary search
+#plus a slice instead of a scan and sort. The columns can be saved as .npy files and memory-mapped back in
+#Run as a small HTTP service with: python query.py serve --port 8080
+
+
+import argparse
+import json
+import os
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from analysis import load_dataset
+from features import add_features, discounted_mask, free_mask, paid_mask, rated_mask, valid_price_mask
+from metrics import get_logger
+from schema import DEFAULT_SNAPSHOT_ROOT, snapshot_dates
+
+log = get_logger("query")
+
+DEFAULT_INDEX_PATH = "data/query_index"
+
+### Short names used by queries and the HTTP endpoint -> dataset columns with a presorted index ###
+INDEXED_COLUMNS = {
+    "value": "Value",
+    "price": "Current Price (USD)",
+    "discount": "Discount Percentage",
+    "critic": "TopCriticScore",
+    "popularity": "Popularity_Factor",
+}
+
+### Other numeric columns kept for results and range filters, no sorted index ###
+NUMERIC_COLUMNS = {
+    "appid": "appid",
+    "players": "Current Players",
+    "peak": "Peak Players",
+    "reviews": "TotalReviews",
+    "year": "Release Year",
+}
+
+### Numeric columns returned as ints ###
+INTEGER_NAMES = {"appid", "players", "peak", "reviews", "year"}
+
+TEXT_COLUMNS = {"name": "game name", "tier": "OC_Tier"}
+
+### Boolean views that can be combined in a query, the same masks analyze_data uses ###
+FLAGS = {
+    "rated": rated_mask,
+    "valid_price": valid_price_mask,
+    "free": free_mask,
+    "paid": paid_mask,
+    "discounted": discounted_mask,
+}
+
+
+### Column arrays, sorted orders and flag masks for one dataset ###
+class QueryIndex:
+    def __init__(self, columns: dict, orders: dict, sorted_values: dict, flags: dict, text: dict, snapshot_date: str = None):
+        self.columns = columns  # short name -> float64 array, NaN where missing
+        self.orders = orders  # short name -> row positions sorted by that column, missing values left out
+        self.sorted_values = sorted_values  # short name -> that column's values in sorted order, what the binary searches run on
+        self.flags = flags  # flag name -> bool array
+        self.text = text  # short name -> list of str/None
+        self.snapshot_date = snapshot_date
+        self.size = len(next(iter(columns.values()))) if columns else 0
+
+    ### Builds the index from a dataset, the derived columns are added here so any snapshot or csv works ###
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, snapshot_date: str = None) -> "QueryIndex":
+        df = add_features(df.reset_index(drop=True))
+        columns, orders, sorted_values = {}, {}, {}
+        for name, column in {**INDEXED_COLUMNS, **NUMERIC_COLUMNS}.items():
+            columns[name] = pd.to_numeric(df[column], errors="coerce").astype("float64").to_numpy(na_value=np.nan)
+        for name in INDEXED_COLUMNS:
+            values = columns[name]
+            present = np.flatnonzero(~np.isnan(values))
+            orders[name] = present[np.argsort(values[present], kind="stable")]
+            sorted_values[name] = values[orders[name]]
+        flags = {name: mask(df).to_numpy(dtype=bool, na_value=False) for name, mask in FLAGS.items()}
+        text = {name: [None if pd.isna(value) else str(value) for value in df[column]] for name, column in TEXT_COLUMNS.items()}
+        return cls(columns, orders, sorted_values, flags, text, snapshot_date)
+
+    ### Candidate positions where every condition holds, in the order given: ranges are {short name: (low, high)} with None for an open end, ###
+    ### flags must all be true. Each condition only looks at the candidates left by the one before, never at the whole column ###
+    def _matching(self, candidates: np.ndarray, ranges: dict = None, flags: list = None) -> np.ndarray:
+        for flag in flags or []:
+            candidates = candidates[self.flags[flag][candidates]]
+        for name, (low, high) in (ranges or {}).items():
+            values = self.columns[name][candidates]
+            if low is not None:
+                candidates, values = candidates[values >= low], values[values >= low]
+            if high is not None:
+                candidates = candidates[values <= high]
+        return candidates
+
+    ### Positions of the indexed column's sorted order that fall inside [low, high], found with a binary search ###
+    def _sorted_slice(self, name: str, low=None, high=None) -> np.ndarray:
+        order = self.orders[name]
+        values = self.sorted_values[name]
+        start = 0 if low is None else np.searchsorted(values, low, side="left")
+        stop = len(order) if high is None else np.searchsorted(values, high, side="right")
+        return order[start:stop]
+
+    ### Result rows as plain dicts, each column is gathered for all the positions at once ###
+    def _rows(self, positions) -> list:
+        positions = np.asarray(positions)
+        fields = {name: [self.text[name][position] for position in positions] for name in TEXT_COLUMNS}
+        for name, values in self.columns.items():
+            picked = values[positions]
+            fields[name] = [None if value != value else (int(value) if name in INTEGER_NAMES else value) for value in picked.tolist()]
+        return [dict(zip(fields, row)) for row in zip(*fields.values())]
+
+    ### Top k rows by an indexed column, e.g. top_k("value", 5, {"price": (None, 20)}, ["paid"]) for the best paid value games under $20 ###
+    def top_k(self, by: str = "value", k: int = 10, ranges: dict = None, flags: list = None, descending: bool = True) -> list:
+        ranges = dict(ranges or {})
+        low, high = ranges.pop(by, (None, None))
+        candidates = self._sorted_slice(by, low, high)
+        if descending:
+            candidates = candidates[::-1]
+        return self._rows(self._matching(candidates, ranges, flags)[:k])
+
+    ### Every row with an indexed column inside [low, high], in that column's order ###
+    def range(self, by: str, low=None, high=None, flags: list = None, limit: int = None) -> list:
+        return self._rows(self._matching(self._sorted_slice(by, low, high), flags=flags)[:limit])
+
+    ### Rows matching the conditions in dataset order, starting from the narrowest sorted slice when a range is on an indexed column ###
+    def filter(self, ranges: dict = None, flags: list = None, limit: int = None) -> list:
+        ranges = dict(ranges or {})
+        slices = {name: self._sorted_slice(name, low, high) for name, (low, high) in ranges.items() if name in INDEXED_COLUMNS and (low, high) != (None, None)}
+        if slices:
+            narrowest = min(slices, key=lambda name: len(slices[name]))
+            ranges.pop(narrowest)
+            candidates = np.sort(slices[narrowest])
+        else:
+            candidates = np.arange(self.size)
+        return self._rows(self._matching(candidates, ranges, flags)[:limit])
+
+    ### Saves every array as its own .npy file so load() can memory-map them instead of reading them in ###
+    def save(self, path: str = DEFAULT_INDEX_PATH) -> str:
+        os.makedirs(path, exist_ok=True)
+        for kind, arrays in (("column", self.columns), ("order", self.orders), ("sorted", self.sorted_values), ("flag", self.flags)):
+            for name, array in arrays.items():
+                np.save(os.path.join(path, f"{kind}-{name}.npy"), array)
+        with open(os.path.join(path, "index.json"), "w", encoding="utf-8") as f:
+            json.dump({"snapshot_date": self.snapshot_date, "size": self.size, "text": self.text}, f)
+        return path
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_INDEX_PATH, mmap: bool = True) -> "QueryIndex":
+        with open(os.path.join(path, "index.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        mode = "r" if mmap else None
+        columns = {name: np.load(os.path.join(path, f"column-{name}.npy"), mmap_mode=mode) for name in {**INDEXED_COLUMNS, **NUMERIC_COLUMNS}}
+        orders = {name: np.load(os.path.join(path, f"order-{name}.npy"), mmap_mode=mode) for name in INDEXED_COLUMNS}
+        sorted_values = {name: np.load(os.path.join(path, f"sorted-{name}.npy"), mmap_mode=mode) for name in INDEXED_COLUMNS}
+        flags = {name: np.load(os.path.join(path, f"flag-{name}.npy"), mmap_mode=mode) for name in FLAGS}
+        return cls(columns, orders, sorted_values, flags, meta["text"], meta["snapshot_date"])
+
+### Index over one day's snapshot (the latest by default) or a csv export ###
+def build_index(file_path: str = DEFAULT_SNAPSHOT_ROOT, snapshot_date=None) -> QueryIndex:
+    df = load_dataset(file_path, snapshot_date)
+    day = None
+    if "snapshot_date" in df.columns and len(df):
+        day = pd.Timestamp(df["snapshot_date"].iloc[0]).date().isoformat()
+    return QueryIndex.from_frame(df, day)
+
+
+### The saved index when it was built from the latest snapshot, otherwise the index is rebuilt and saved over the stale one ###
+### A csv carries no date, an index saved from one is always used ###
+def current_index(index_path: str = DEFAULT_INDEX_PATH, file_path: str = DEFAULT_SNAPSHOT_ROOT) -> QueryIndex:
+    if not os.path.exists(os.path.join(index_path, "index.json")):
+        return build_index(file_path)
+    index = QueryIndex.load(index_path)
+    dates = [] if file_path.endswith(".csv") else snapshot_dates(file_path)
+    if dates and dates[-1] != index.snapshot_date:
+        log.warning(f"The saved query index is from the {index.snapshot_date} snapshot, rebuilding it from {dates[-1]}.",
+                    extra={"index_date": index.snapshot_date, "snapshot_date": dates[-1]})
+        index = build_index(file_path)
+        index.save(index_path)
+    return index
+
+
+### Query string -> (ranges, flags): min_<name>/max_<name> for any numeric column and flags=paid,discounted ###
+def parse_query(params: dict) -> tuple:
+    ranges = {}
+    for name in {**INDEXED_COLUMNS, **NUMERIC_COLUMNS}:
+        low, high = params.get(f"min_{name}"), params.get(f"max_{name}")
+        if low is not None or high is not None:
+            ranges[name] = (None if low is None else float(low), None if high is None else float(high))
+    flags = [flag for flag in params.get("flags", "").split(",") if flag]
+    unknown = [flag for flag in flags if flag not in FLAGS]
+    if unknown:
+        raise ValueError(f"Unknown flags: {', '.join(unknown)}")
+    return ranges, flags
+
+### GET /top?by=value&k=5&max_price=20&flags=paid, /range?by=price&min=5&max=10, /filter?flags=discounted&min_popularity=0.8 and /health ###
+def make_handler(index: QueryIndex):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, payload) -> None:
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            started = time.perf_counter()
+            url = urlsplit(self.path)
+            params = {key: values[0] for key, values in parse_qs(url.query).items()}
+            try:
+                ranges, flags = parse_query(params)
+                by = params.get("by", "value")
+                limit = int(params["limit"]) if "limit" in params else None
+                if url.path == "/top":
+                    if by not in INDEXED_COLUMNS:
+                        raise ValueError(f"Can only sort by {', '.join(INDEXED_COLUMNS)}")
+                    rows = index.top_k(by, int(params.get("k", 10)), ranges, flags, descending=params.get("order", "desc") != "asc")
+                elif url.path == "/range":
+                    if by not in INDEXED_COLUMNS:
+                        raise ValueError(f"Can only range over {', '.join(INDEXED_COLUMNS)}")
+                    low, high = params.get("min"), params.get("max")
+                    rows = index.range(by, None if low is None else float(low), None if high is None else float(high), flags, limit)
+                elif url.path == "/filter":
+                    rows = index.filter(ranges, flags, limit)
+                elif url.path == "/health":
+                    return self._send(200, {"games": index.size, "snapshot_date": index.snapshot_date})
+                else:
+                    return self._send(404, {"error": f"Unknown path {url.path}"})
+            except (KeyError, ValueError) as error:
+                return self._send(400, {"error": str(error)})
+            self._send(200, {"count": len(rows), "query_ms": round((time.perf_counter() - started) * 1000, 3), "games": rows})
+
+    return Handler
+
+def serve(index: QueryIndex, host: str = "127.0.0.1", port: int = 8080) -> ThreadingHTTPServer:
+    httpd = ThreadingHTTPServer((host, port), make_handler(index))
+    httpd.daemon_threads = True
+    log.info(f"Serving {index.size} games on http://{host}:{httpd.server_address[1]}", extra={"games": index.size, "port": httpd.server_address[1]})
+    return httpd
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the enriched Steam dataset")
+    parser.add_argument("command", choices=["build", "serve", "top"])
+    parser.add_argument("--data", default=DEFAULT_SNAPSHOT_ROOT, help="Snapshot folder or csv to index")
+    parser.add_argument("--index", default=DEFAULT_INDEX_PATH, help="Folder the saved index is written to / memory-mapped from")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--by", default="value", choices=list(INDEXED_COLUMNS))
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--max-price", type=float, default=None)
+    parser.add_argument("--flags", default="", help="Comma separated: " + ", ".join(FLAGS))
+    args = parser.parse_args()
+
+    if args.command == "build":
+        path = build_index(args.data).save(args.index)
+        log.info(f"Query index written to {path}", extra={"path": path})
+        return
+
+    index = current_index(args.index, args.data)
+    if args.command == "top":
+        ranges = {"price": (None, args.max_price)} if args.max_price is not None else {}
+        flags = [flag for flag in args.flags.split(",") if flag]
+        print(pd.DataFrame(index.top_k(args.by, args.k, ranges, flags)).to_string(index=False))
+        return
+
+    httpd = serve(index, args.host, args.port)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#Tracks how much of the daily OpenCritic (RapidAPI) quota is left
+#RapidAPI reports the remaining requests in the response headers, a local ledger covers the requests we made before seeing any headers
+
+
+import datetime
+import json
+import os
+import threading
+import time
+
+DEFAULT_LEDGER_PATH = "data/opencritic_quota.json"
+DEFAULT_DAILY_LIMIT = 25 #free RapidAPI plan
+
+
+### Raised instead of sending a request when the quota for the day is used up ###
+class QuotaExhausted(Exception):
+    pass
+
+
+class QuotaLedger:
+    def __init__(self, path: str = DEFAULT_LEDGER_PATH, daily_limit: int = DEFAULT_DAILY_LIMIT):
+        self.path = path
+        self.daily_limit = daily_limit
+        self.lock = threading.Lock()
+        self.state = self._load()
+
+    def _load(self) -> dict:
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r") as f:
+                    return json.load(f)
+            except ValueError:
+                pass
+        return self._new_day()
+
+    def _new_day(self) -> dict:
+        return {"day": datetime.date.today().isoformat(), "used": 0, "limit": self.daily_limit, "header_remaining": None, "reset_at": None}
+
+    def _save(self) -> None:
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump(self.state, f)
+
+    ### Starts a fresh day once RapidAPI's reset time has passed, or on a new calendar day if we never saw a reset header ###
+    def _roll(self) -> None:
+        reset_at = self.state.get("reset_at")
+        if reset_at is not None:
+            expired = time.time() >= reset_at
+        else:
+            expired = self.state.get("day") != datetime.date.today().isoformat()
+        if expired:
+            self.state = self._new_day()
+
+    def _remaining(self) -> int:
+        remaining = self.state["limit"] - self.state["used"]
+        if self.state.get("header_remaining") is not None:
+            remaining = min(remaining, self.state["header_remaining"])
+        return max(remaining, 0)
+
+    def remaining(self) -> int:
+        with self.lock:
+            self._roll()
+            return self._remaining()
+
+    ### Claims one request from the quota, raises QuotaExhausted if there is nothing left today ###
+    def reserve(self) -> None:
+        with self.lock:
+            self._roll()
+            if self._remaining() <= 0:
+                raise QuotaExhausted(f"OpenCritic quota used up ({self.state['used']}/{self.state['limit']} today)")
+            self.state["used"] += 1
+            if self.state.get("header_remaining") is not None:
+                self.state["header_remaining"] -= 1
+            self._save()
+
+    ### RapidAPI sends x-ratelimit-requests-limit / -remaining / -reset (seconds until the quota resets) ###
+    def update_from_headers(self, headers) -> None:
+        remaining = headers.get("x-ratelimit-requests-remaining")
+        if remaining is None:
+            return
+        with self.lock:
+            try:
+                self.state["header_remaining"] = int(remaining)
+                if headers.get("x-ratelimit-requests-limit") is not None:
+                    self.state["limit"] = int(headers["x-ratelimit-requests-limit"])
+                if headers.get("x-ratelimit-requests-reset") is not None:
+                    self.state["reset_at"] = time.time() + int(headers["x-ratelimit-requests-reset"])
+            except ValueError:
+                return
+            self._save()
+
+
+_ledger = None
+
+
+def get_quota_ledger() -> QuotaLedger:
+    global _ledger
+    if _ledger is None:
+        _ledger = QuotaLedger()
+    return _ledger
@@ -0,0 +1,66 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#Token bucket rate limiter shared by every thread that talks to the same API
+
+
+import threading
+import time
+
+from metrics import get_metrics
+
+### Steam Store API allows ~200 requests inside a 5 minute window ###
+STEAM_REQUESTS_PER_WINDOW = 200
+STEAM_WINDOW_SECONDS = 300
+
+### SteamCharts has no published limit, one page a second keeps the scrape polite ###
+STEAMCHARTS_REQUESTS_PER_SECOND = 1
+
+### RapidAPI's OpenCritic plan allows a few requests a second on top of the daily quota ###
+OPENCRITIC_REQUESTS_PER_SECOND = 4
+
+
+### Token bucket: tokens refill at a steady rate, each request spends one token ###
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = 1):
+        if rate <= 0:
+            raise ValueError("Rate must be positive")
+        if capacity < 1:
+            raise ValueError("Capacity must be at least 1")
+        self.rate = rate  # tokens added per second
+        self.capacity = capacity  # largest burst allowed
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    ### Block until a token is available, the time spent waiting is counted so throttling shows up in the run report ###
+    def acquire(self, tokens: float = 1) -> None:
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    break
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+        if waited:
+            get_metrics().count("rate_limit_wait_seconds", waited)
+
+
+### Limiter sized to the Steam Store budget, 200 requests / 300 seconds is ~0.67 requests a second ###
+### A small burst lets the first few workers start at once without breaking the 5 minute window ###
+### shards splits the budget between processes on the same IP, rate (requests a second) overrides it, e.g. for a shard with an IP of its own ###
+def steam_rate_limiter(burst: int = 10, shards: int = 1, rate: float = None) -> TokenBucket:
+    rate = rate or STEAM_REQUESTS_PER_WINDOW / STEAM_WINDOW_SECONDS / shards
+    return TokenBucket(rate=rate, capacity=max(1, burst // shards))
+
+def steamcharts_rate_limiter(burst: int = 2) -> TokenBucket:
+    return TokenBucket(rate=STEAMCHARTS_REQUESTS_PER_SECOND, capacity=burst)
+
+def opencritic_rate_limiter(burst: int = 4) -> TokenBucket:
+    return TokenBucket(rate=OPENCRITIC_REQUESTS_PER_SECOND, capacity=burst)
@@ -0,0 +1,98 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#Compact game records for rows that are held in memory in bulk (checkpoints being resumed, the previous snapshot, games waiting on quota)
+#A slotted record has no per-row dict of long column names, and prices are kept as integer cents instead of floats
+#Rows are still plain dicts where they are written out (checkpoints, csv/Parquet sinks), to_row/from_row convert between the two
+
+
+from dataclasses import dataclass
+
+import pandas as pd
+
+
+@dataclass(slots=True)
+class GameRecord:
+    appid: int
+    chart_name: str = None
+    current_players: int = None
+    peak_players: int = None
+    name: str = None
+    free: bool = None
+    base_cents: int = None
+    final_cents: int = None
+    discount: int = None
+    on_sale: bool = None
+    release_date: object = None
+    metacritic: int = None
+    recommendations: int = None
+    steam_updated: object = None
+    oc_id: int = None
+    oc_name: str = None
+    top_critic: float = None
+    median_critic: float = None
+    percent_recommended: float = None
+    total_reviews: int = None
+    oc_tier: str = None
+    oc_updated: object = None
+
+    ### Builds a record from a dataset row, missing columns and NaN/NA values become None ###
+    @classmethod
+    def from_row(cls, row: dict) -> "GameRecord":
+        record = cls(row["appid"])
+        for column, field in COLUMN_FIELDS.items():
+            value = row.get(column)
+            if value is None or pd.isna(value):
+                continue
+            if column in CENT_COLUMNS:
+                value = round(value * 100)
+            setattr(record, field, value)
+        return record
+
+    ### Back to a dataset row with the given columns (every known column by default), cents are turned back in to dollars ###
+    def to_row(self, columns: list = None) -> dict:
+        row = {}
+        for column in columns or COLUMN_FIELDS:
+            value = getattr(self, COLUMN_FIELDS[column])
+            if column in CENT_COLUMNS and value is not None:
+                value = value / 100
+            row[column] = value
+        return row
+
+### Dataset column -> record field ###
+COLUMN_FIELDS = {
+    "appid": "appid",
+    "SteamCharts Name": "chart_name",
+    "Current Players": "current_players",
+    "Peak Players": "peak_players",
+    "game name": "name",
+    "Free game?": "free",
+    "Base Price (USD)": "base_cents",
+    "Current Price (USD)": "final_cents",
+    "Discount Percentage": "discount",
+    "On sale?": "on_sale",
+    "Release Date": "release_date",
+    "Metacritic Score": "metacritic",
+    "Total Recommendations": "recommendations",
+    "Steam Updated": "steam_updated",
+    "OC_ID": "oc_id",
+    "OC_Name": "oc_name",
+    "TopCriticScore": "top_critic",
+    "MedianCriticScore": "median_critic",
+    "PercentRecommended": "percent_recommended",
+    "TotalReviews": "total_reviews",
+    "OC_Tier": "oc_tier",
+    "OC Updated": "oc_updated",
+}
+
+### Columns stored as integer cents in a record ###
+CENT_COLUMNS = {"Base Price (USD)", "Current Price (USD)"}
+
+### Builds a DataFrame column by column in one step instead of row by row, cents are divided out for the whole column at once ###
+def records_to_frame(records: list, columns: list) -> pd.DataFrame:
+    data = {}
+    for column in columns:
+        field = COLUMN_FIELDS[column]
+        values = [getattr(record, field) for record in records]
+        if column in CENT_COLUMNS:
+            values = pd.array(values, dtype="Int64") / 100
+        data[column] = values
+    return pd.DataFrame(data, columns=columns)
@@ -0,0 +1,98 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#Multi-region prices: price_overview for the games in the latest snapshot from several Steam store regions (country codes)
+#Only the prices are fetched per region, everything else about a game comes from the snapshot the US run already wrote
+#Every region goes through the same batched price requests and the one shared Steam rate limiter, with a bounded number in flight
+#A game that isn't sold in a region (no price_overview there) gets no row for that region
+
+
+import os
+
+import pandas as pd
+
+from cache import configure_cache
+from checkpoint import STATUS_NOT_FOUND, STATUS_OK
+from data_pull import STEAM_PRICE_BATCH_SIZE, iter_regional_price_results
+from metrics import DEFAULT_REPORT_PATH, get_logger, reset_metrics, write_run_report
+from rate_limiter import steam_rate_limiter
+from schema import DEFAULT_SNAPSHOT_ROOT, REGIONAL_PRICE_DTYPES, read_snapshots, snapshot_dates, snapshot_path
+from sinks import CsvSink, ParquetSink
+
+log = get_logger("regions")
+
+### Store regions (Steam country codes) priced by default ###
+DEFAULT_REGIONS = ("us", "ca", "mx", "br", "ar", "gb", "de", "fr", "pl", "tr", "ua", "za", "in", "jp", "kr", "cn", "id", "ph", "au", "nz")
+
+REGIONAL_PRICE_COLUMNS = list(REGIONAL_PRICE_DTYPES)
+
+DEFAULT_REGIONAL_CSV = "data/regional_prices.csv"
+DEFAULT_REGIONAL_SNAPSHOT_ROOT = "data/regional_price_snapshots"
+
+
+### One row of the long price table from a region's price_overview ###
+def regional_price_row(appid: int, region: str, price_info: dict) -> dict:
+    discount = price_info.get("discount_percent")
+    return {
+        "appid": appid,
+        "region": region,
+        "currency": price_info.get("currency"),
+        "Base Price": price_info["initial"] / 100.0 if isinstance(price_info.get("initial"), int) else None, #smallest currency unit, same as USD cents
+        "Current Price": price_info["final"] / 100.0 if isinstance(price_info.get("final"), int) else None,
+        "Discount Percentage": discount,
+        "On sale?": discount is not None and discount > 0,
+    }
+
+### Paid games in one day's snapshot (the latest by default), free games have no price in any region ###
+def snapshot_paid_appids(snapshot_root: str = DEFAULT_SNAPSHOT_ROOT, snapshot_date=None, games: int = None) -> list:
+    if snapshot_date is None:
+        dates = snapshot_dates(snapshot_root)
+        if not dates:
+            raise FileNotFoundError(f"No snapshots found in {snapshot_root}")
+        snapshot_date = dates[-1]
+    df = read_snapshots(snapshot_root, columns=["appid", "Free game?"], dates=[snapshot_date])
+    if games is not None:
+        df = df.head(games)
+    paid = df.loc[~df["Free game?"].fillna(False).astype(bool), "appid"].dropna().astype(int)
+    return list(dict.fromkeys(paid.tolist()))
+
+### Fetches every region's prices for the paid games of the latest snapshot and writes them as a long (appid, region, price) table ###
+### max_workers bounds the requests in flight across all regions, the shared limiter keeps the total within Steam's budget ###
+def run_regional_prices(regions: tuple = DEFAULT_REGIONS, games: int = None, batch_size: int = STEAM_PRICE_BATCH_SIZE, max_workers: int = 4,
+                        offline: bool = False, snapshot_root: str = DEFAULT_SNAPSHOT_ROOT, csv_path: str = DEFAULT_REGIONAL_CSV,
+                        regional_snapshot_root: str = DEFAULT_REGIONAL_SNAPSHOT_ROOT, report_path: str = DEFAULT_REPORT_PATH,
+                        prometheus_path: str = None) -> int:
+    configure_cache(offline=offline)
+    metrics = reset_metrics()
+    regions = tuple(dict.fromkeys(region.lower() for region in regions))
+    appids = snapshot_paid_appids(snapshot_root, games=games)
+    log.info(f"Pricing {len(appids)} paid games in {len(regions)} regions.", extra={"games": len(appids), "regions": len(regions)})
+
+    results = iter_regional_price_results(appids, regions, batch_size, max_workers, limiter=steam_rate_limiter())
+    parquet_path = os.path.join(snapshot_path(regional_snapshot_root), "part-0.parquet")
+    with metrics.stage("save"), CsvSink(csv_path, columns=REGIONAL_PRICE_COLUMNS) as csv_sink, \
+            ParquetSink(parquet_path, columns=REGIONAL_PRICE_COLUMNS, dtypes=REGIONAL_PRICE_DTYPES) as parquet_sink:
+        for appid, region, price_info, status in metrics.timed("regional_prices", results):
+            if status == STATUS_OK and not price_info:
+                status = STATUS_NOT_FOUND #not sold in this region, dropped like an appid Steam doesn't know
+            metrics.count("regional_price_results", status=status, region=region)
+            if status != STATUS_OK:
+                continue
+            row = regional_price_row(appid, region, price_info)
+            csv_sink.write_row(row)
+            parquet_sink.write_row(row)
+    metrics.add_rows("save", csv_sink.rows_written)
+    write_run_report(report_path, prometheus_path)
+    return csv_sink.rows_written
+
+### The regional price table of one day as a DataFrame, the latest day by default ###
+def read_regional_prices(regional_snapshot_root: str = DEFAULT_REGIONAL_SNAPSHOT_ROOT, snapshot_date=None) -> pd.DataFrame:
+    if snapshot_date is None:
+        dates = snapshot_dates(regional_snapshot_root)
+        if not dates:
+            raise FileNotFoundError(f"No regional price snapshots found in {regional_snapshot_root}")
+        snapshot_date = dates[-1]
+    folder = snapshot_path(regional_snapshot_root, snapshot_date)
+    df = pd.read_parquet(folder, dtype_backend="numpy_nullable")
+    for column, dtype in REGIONAL_PRICE_DTYPES.items():
+        if dtype == "category":
+            df[column] = df[column].astype("category")
+    return df
@@ -0,0 +1,132 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#Typed schema for the combined Steam + OpenCritic dataset and the Parquet snapshot store
+#Snapshots are written to data/snapshots/snapshot_date=YYYY-MM-DD/ so a day can be read on its own and only the needed columns are loaded
+
+
+import datetime
+import os
+
+import pandas as pd
+
+DEFAULT_SNAPSHOT_ROOT = "data/snapshots"
+
+### pandas dtype for every column, nullable ints/bools keep missing values as <NA> instead of turning the column in to floats or objects ###
+DATASET_DTYPES = {
+    "appid": "Int64",
+    "SteamCharts Name": "category",
+    "Current Players": "Int64",
+    "Peak Players": "Int64",
+    "game name": "category",
+    "Free game?": "boolean",
+    "Base Price (USD)": "Float64",
+    "Current Price (USD)": "Float64",
+    "Discount Percentage": "Int16",
+    "On sale?": "boolean",
+    "Release Date": "datetime64[ns]",
+    "Metacritic Score": "Int16",
+    "Total Recommendations": "Int64",
+    "OC_ID": "Int64",
+    "OC_Name": "category",
+    "TopCriticScore": "Float64",
+    "MedianCriticScore": "Float64",
+    "PercentRecommended": "Float64",
+    "TotalReviews": "Int64",
+    "OC_Tier": "category",
+    "Steam Updated": "datetime64[ns]",
+    "OC Updated": "datetime64[ns]",
+}
+
+### Long format regional price table, one row per appid and store region, prices are in that region's currency ###
+REGIONAL_PRICE_DTYPES = {
+    "appid": "Int64",
+    "region": "category",
+    "currency": "category",
+    "Base Price": "Float64",
+    "Current Price": "Float64",
+    "Discount Percentage": "Int16",
+    "On sale?": "boolean",
+}
+
+### Steam release dates are free text like "Aug 21, 2012" or "Coming soon", anything unparseable becomes NaT ###
+### Each distinct text is parsed once, there are only a few thousand different dates however many rows (or snapshot days) there are ###
+def parse_release_dates(values: pd.Series) -> pd.Series:
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.astype("datetime64[ns]")
+    codes, texts = pd.factorize(values.astype("string"))
+    parsed = pd.to_datetime(pd.Series(texts, dtype="string"), errors="coerce", format="mixed").to_numpy(dtype="datetime64[ns]")
+    return pd.Series(pd.api.extensions.take(parsed, codes, allow_fill=True), index=values.index, name=values.name)
+
+### Casts a frame to the dataset schema (or another table's dtypes), columns the schema doesn't know about are left alone ###
+def apply_schema(df: pd.DataFrame, dtypes: dict = None) -> pd.DataFrame:
+    df = df.copy()
+    for column, dtype in (dtypes or DATASET_DTYPES).items():
+        if column not in df.columns:
+            continue
+        if dtype == "datetime64[ns]":
+            df[column] = parse_release_dates(df[column])
+        elif dtype in ("Int16", "Int64"):
+            df[column] = pd.to_numeric(df[column], errors="coerce").round().astype(dtype)
+        elif dtype == "Float64":
+            df[column] = pd.to_numeric(df[column], errors="coerce").astype(dtype)
+        elif dtype == "boolean":
+            df[column] = df[column].map({True: True, False: False, "True": True, "False": False}).astype(dtype)
+        else:
+            df[column] = df[column].astype("string").astype(dtype)
+    return df
+
+### Arrow schema used when writing Parquet, names are stored as plain strings (Parquet dictionary encodes them) and come back as categories ###
+def arrow_schema(columns: list = None, dtypes: dict = None):
+    import pyarrow as pa
+
+    dtypes = dtypes or DATASET_DTYPES
+    arrow_types = {
+        "Int16": pa.int16(),
+        "Int64": pa.int64(),
+        "Float64": pa.float64(),
+        "boolean": pa.bool_(),
+        "category": pa.string(),
+        "datetime64[ns]": pa.timestamp("ns"),
+    }
+    columns = columns or list(dtypes)
+    return pa.schema([(column, arrow_types[dtypes[column]]) for column in columns])
+
+### Folder for one day's snapshot in the hive style layout pandas/pyarrow understand ###
+def snapshot_path(root: str = DEFAULT_SNAPSHOT_ROOT, snapshot_date=None) -> str:
+    snapshot_date = snapshot_date or datetime.date.today()
+    return os.path.join(root, f"snapshot_date={pd.Timestamp(snapshot_date).date().isoformat()}")
+
+### Writes a whole frame as one day's snapshot, replacing whatever was stored for that day ###
+def write_snapshot(df: pd.DataFrame, root: str = DEFAULT_SNAPSHOT_ROOT, snapshot_date=None) -> str:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    folder = snapshot_path(root, snapshot_date)
+    os.makedirs(folder, exist_ok=True)
+    columns = [column for column in DATASET_DTYPES if column in df.columns]
+    table = pa.Table.from_pandas(apply_schema(df[columns]), schema=arrow_schema(columns), preserve_index=False)
+    path = os.path.join(folder, "part-0.parquet")
+    pq.write_table(table, path)
+    return path
+
+### Dates that have a snapshot stored, oldest first ###
+def snapshot_dates(root: str = DEFAULT_SNAPSHOT_ROOT) -> list:
+    if not os.path.isdir(root):
+        return []
+    return sorted(name.split("=", 1)[1] for name in os.listdir(root) if name.startswith("snapshot_date="))
+
+### Reads snapshots back with column projection, only the requested columns and days are loaded ###
+### The full schema is passed in so columns added later come back empty for older days instead of being dropped ###
+def read_snapshots(root: str = DEFAULT_SNAPSHOT_ROOT, columns: list = None, dates: list = None) -> pd.DataFrame:
+    import pyarrow as pa
+
+    filters = None
+    if dates is not None:
+        filters = [("snapshot_date", "in", [pd.Timestamp(date).date().isoformat() for date in dates])]
+    read_columns = None if columns is None else list(dict.fromkeys(list(columns) + ["snapshot_date"]))
+    schema = arrow_schema().append(pa.field("snapshot_date", pa.string()))
+    df = pd.read_parquet(root, columns=read_columns, filters=filters, schema=schema, dtype_backend="numpy_nullable")
+    df["snapshot_date"] = pd.to_datetime(df["snapshot_date"].astype("string"))
+    for column in df.columns:
+        if DATASET_DTYPES.get(column) == "category":
+            df[column] = df[column].astype("category")
+    return df
@@ -0,0 +1,111 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#Streaming sinks that write rows out in chunks instead of building one big DataFrame first
+
+
+import os
+
+import pandas as pd
+
+from metrics import get_logger
+
+log = get_logger("sinks")
+
+
+### Buffers rows and hands them to _write_chunk as DataFrames, the file only appears at its final path once everything is written ###
+### Until then it is written next to it as _<name>.tmp, pyarrow skips files starting with _ so a snapshot folder stays readable mid-write ###
+### The buffer is one list per column, so each chunk's DataFrame is built column by column instead of from a list of row dicts ###
+class ChunkedSink:
+    def __init__(self, path: str, columns: list, chunk_size: int = 500):
+        self.path = path
+        self.columns = columns
+        self.chunk_size = chunk_size
+        self.partial_path = os.path.join(os.path.dirname(path), f"_{os.path.basename(path)}.tmp")
+        self.buffer = {column: [] for column in columns}
+        self.buffered = 0
+        self.rows_written = 0
+        self.started = False
+
+    def __enter__(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if os.path.exists(self.partial_path):
+            os.remove(self.partial_path)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is not None:
+            #Leave the previous file untouched if the run failed part way
+            self._abort()
+            if os.path.exists(self.partial_path):
+                os.remove(self.partial_path)
+            return False
+        self.close()
+        return False
+
+    def write_row(self, row: dict) -> None:
+        for column, values in self.buffer.items():
+            values.append(row.get(column))
+        self.buffered += 1
+        if self.buffered >= self.chunk_size:
+            self.flush()
+
+    def write_rows(self, rows) -> None:
+        for row in rows:
+            self.write_row(row)
+
+    def flush(self) -> None:
+        if not self.buffered and self.started:
+            return
+        self._write_chunk(pd.DataFrame(self.buffer, columns=self.columns))
+        self.started = True
+        self.rows_written += self.buffered
+        self.buffer = {column: [] for column in self.columns}
+        self.buffered = 0
+
+    def close(self) -> None:
+        self.flush()
+        self._finish()
+        os.replace(self.partial_path, self.path)
+        log.info(f"Saved {self.rows_written} games to {self.path}", extra={"rows": self.rows_written, "path": self.path})
+
+    def _write_chunk(self, chunk: pd.DataFrame) -> None:
+        raise NotImplementedError
+
+    def _finish(self) -> None:
+        pass
+
+    def _abort(self) -> None:
+        pass
+
+
+### Appends each chunk to a csv, the header is written with the first chunk ###
+class CsvSink(ChunkedSink):
+    def _write_chunk(self, chunk: pd.DataFrame) -> None:
+        chunk.to_csv(self.partial_path, mode="a", header=not self.started, index=False)
+
+
+### Writes each chunk as a row group of one Parquet file, cast to the typed dataset schema (or the dtypes given) ###
+class ParquetSink(ChunkedSink):
+    def __init__(self, path: str, columns: list, chunk_size: int = 500, dtypes: dict = None):
+        super().__init__(path, columns, chunk_size)
+        self.dtypes = dtypes
+        self.writer = None
+
+    def _write_chunk(self, chunk: pd.DataFrame) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        from schema import apply_schema, arrow_schema
+
+        schema = arrow_schema(self.columns, self.dtypes)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.partial_path, schema)
+        self.writer.write_table(pa.Table.from_pandas(apply_schema(chunk, self.dtypes), schema=schema, preserve_index=False))
+
+    def _finish(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def _abort(self) -> None:
+        self._finish()
@@ -0,0 +1,122 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#Parsers for the top games table on SteamCharts
+#selectolax and lxml only build what they need and are much faster than BeautifulSoup, BeautifulSoup is kept as the fallback
+
+
+import re
+from functools import lru_cache
+
+APPID_PATTERN = re.compile(r"/app/(\d+)")
+
+### Clean and Strip Numbers from Web Scraping ###
+def to_int(text: str):
+    text = text.replace(",", "").strip()
+    try:
+        return int(text)
+    except:
+        return None
+
+### Builds a chart row from the text pulled out of one table row, None if the row is not a game ###
+### There should be 6 columns of data for the table, Rank / Name / Current Count / Last30 Count / Peak Count / HoursPlayed in last 30d ###
+def _chart_row(href: str, name: str, current_players: str, peak_players: str) -> dict:
+    chunk = APPID_PATTERN.search(href or "")
+    if not chunk:
+        return None
+    return {
+        "appid": int(chunk.group(1)),
+        "name": name.strip(),
+        "current_players": to_int(current_players),
+        "peak_players": to_int(peak_players),
+    }
+
+### selectolax backend, only walks the first table on the page ###
+def parse_selectolax(html: str) -> list:
+    from selectolax.lexbor import LexborHTMLParser
+
+    table = LexborHTMLParser(html).css_first("table")
+    if table is None:
+        return []
+
+    rows = []
+    for table_row in table.css("tr"):
+        table_data = table_row.css("td")
+        if len(table_data) < 6:
+            continue
+        Identifier = table_data[1].css_first("a")
+        if Identifier is None:
+            continue
+        row = _chart_row(Identifier.attributes.get("href"), Identifier.text(strip=True), table_data[2].text(), table_data[4].text())
+        if row:
+            rows.append(row)
+    return rows
+
+### lxml backend, only walks the first table on the page ###
+def parse_lxml(html: str) -> list:
+    from lxml import html as lxml_html
+
+    tables = lxml_html.fromstring(html).xpath("(//table)[1]")
+    if not tables:
+        return []
+
+    rows = []
+    for table_row in tables[0].iter("tr"):
+        table_data = table_row.findall("td")
+        if len(table_data) < 6:
+            continue
+        Identifier = table_data[1].find(".//a")
+        if Identifier is None:
+            continue
+        row = _chart_row(Identifier.get("href"), Identifier.text_content(), table_data[2].text_content(), table_data[4].text_content())
+        if row:
+            rows.append(row)
+    return rows
+
+### BeautifulSoup backend, same behaviour as the original scraper ###
+def parse_bs4(html: str) -> list:
+    from bs4 import BeautifulSoup
+
+    table = BeautifulSoup(html, "html.parser").find("table")
+    if table is None:
+        return []
+
+    rows = []
+    for table_row in table.find_all("tr"):
+        table_data = table_row.find_all("td")
+        if len(table_data) < 6:
+            continue
+        Identifier = table_data[1].find("a")
+        if not Identifier:
+            continue
+        row = _chart_row(Identifier.get("href", ""), Identifier.get_text(strip=True), table_data[2].get_text(strip=True), table_data[4].get_text(strip=True))
+        if row:
+            rows.append(row)
+    return rows
+
+PARSERS = {
+    "selectolax": parse_selectolax,
+    "lxml": parse_lxml,
+    "bs4": parse_bs4,
+}
+
+### Backends that can be imported here, fastest first ###
+@lru_cache(maxsize=None)
+def available_backends() -> tuple:
+    backends = []
+    for backend, module in (("selectolax", "selectolax.lexbor"), ("lxml", "lxml.html"), ("bs4", "bs4")):
+        try:
+            __import__(module)
+        except ImportError:
+            continue
+        backends.append(backend)
+    return tuple(backends)
+
+### Parses the top games table into chart rows, "auto" picks the fastest backend that is installed ###
+def parse_top_table(html: str, backend: str = "auto") -> list:
+    if backend == "auto":
+        backends = available_backends()
+        if not backends:
+            raise ImportError("No HTML parser installed, install selectolax, lxml or beautifulsoup4")
+        backend = backends[0]
+    if backend not in PARSERS:
+        raise ValueError(f"Unknown parser backend: {backend}")
+    return PARSERS[backend](html)
@@ -0,0 +1,53 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#Shared pytest fixtures: every test runs in its own working directory against the local fixture server, no network needed
+
+
+import os
+import sys
+
+import pytest
+
+TESTS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_FOLDER, "..", "src"))
+sys.path.insert(0, os.path.join(TESTS_FOLDER, "..", "benchmarks"))
+
+
+### Fresh working directory with a key file, the per-process cache, quota ledger and OpenCritic index start over in it ###
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    import cache
+    import opencritic_index
+    import quota
+    from metrics import configure_logging
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "key.txt").write_text("fixture-key")
+    configure_logging("WARNING")
+    monkeypatch.setattr(cache, "_cache", None)
+    monkeypatch.setattr(opencritic_index, "_index", None)
+    monkeypatch.setattr(quota, "_ledger", None)
+    return tmp_path
+
+### data_pull pointed at a running fixture server ###
+@pytest.fixture
+def fixture_server(workdir, monkeypatch):
+    import data_pull
+    from fixture_server import FixtureServer
+
+    with FixtureServer() as server:
+        for name in ("SteamCharts_URL_base", "SteamStore_URL", "OpenCritic_URL"):
+            monkeypatch.setattr(data_pull, name, getattr(data_pull, name))
+        server.patch(data_pull)
+        yield server
+
+### Today's snapshot of 400 synthetic games built from the saved payloads, with varied prices, player counts and scores ###
+@pytest.fixture
+def snapshot(workdir):
+    import pandas as pd
+
+    from bench_pipeline import synthetic_rows
+    from data_pull import DATASET_COLUMNS
+    from schema import DEFAULT_SNAPSHOT_ROOT, write_snapshot
+
+    write_snapshot(pd.DataFrame(synthetic_rows(400), columns=DATASET_COLUMNS))
+    return DEFAULT_SNAPSHOT_ROOT
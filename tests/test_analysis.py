@@ -0,0 +1,36 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#analyze_streaming read in small chunks gives the same statistics as analyze_data on the whole day
+
+
+import numpy as np
+import pandas as pd
+
+from analysis import HISTOGRAM_BINS, analyze_data, analyze_streaming
+
+
+def test_streaming_matches_in_memory(snapshot, capsys):
+    expected = analyze_data(snapshot, max_workers=1)
+    state = analyze_streaming(snapshot, chunk_size=64, max_workers=1)
+    capsys.readouterr()
+
+    df, clean = expected["frame"], expected["masks"]["clean"]
+    assert len(df) > 64
+    assert state.rows == len(df)
+    assert {name: state.counts[name] for name in expected["counts"]} == expected["counts"]
+
+    for ranking, expected_ranking in zip(state.rankings, expected["rankings"]):
+        pd.testing.assert_frame_equal(ranking.result().astype(object), expected_ranking.astype(object)) #the chunks have no shared categories
+
+    for column, bins in HISTOGRAM_BINS.items():
+        values = df.loc[clean, column].astype("float64").dropna()
+        counts, edges = np.histogram(values, bins=bins)
+        np.testing.assert_array_equal(state.histograms[column].counts, counts)
+        np.testing.assert_allclose(state.histograms[column].edges, edges)
+
+    streamed_summary = state.summary.summary()
+    np.testing.assert_allclose(streamed_summary.to_numpy(), expected["summary"].to_numpy(), rtol=1e-9, equal_nan=True)
+
+    correlations = [state.discount_correlations.correlation(x, y) for x, y in (("Discount Percentage", "Popularity_Factor"), ("TotalReviews", "Current Players"))]
+    np.testing.assert_allclose(correlations, expected["correlations"], rtol=1e-9, atol=1e-12)
+    in_memory_matrix = df.loc[clean, state.correlations.columns].astype("float64").corr()
+    np.testing.assert_allclose(state.correlations.matrix().to_numpy(), in_memory_matrix.to_numpy(), rtol=1e-9, atol=1e-12, equal_nan=True)
@@ -0,0 +1,36 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#The async Steam stage logs one retry per extra attempt and a failure once they run out
+
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import async_pipeline
+from async_pipeline import DONE, Stage, enrich_steam
+from checkpoint import STATUS_FAILED, Checkpoint
+from metrics import LOGGER_NAME
+
+
+def test_steam_retries_log_once_per_retry(workdir, monkeypatch, caplog):
+    calls = []
+    monkeypatch.setattr(async_pipeline, "request_steam", lambda appid, url, limiter: calls.append(appid) or (None, True))
+    logger = logging.getLogger(LOGGER_NAME)
+    monkeypatch.setattr(logger, "handlers", [caplog.handler])
+    monkeypatch.setattr(logger, "level", logging.INFO)
+    checkpoint = Checkpoint("data/checkpoints/steam.jsonl")
+
+    async def steam_stage():
+        inbox, outbox = asyncio.Queue(), asyncio.Queue()
+        await inbox.put({"appid": 10, "name": "Some Game", "current_players": 1, "peak_players": 1})
+        await inbox.put(DONE)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            await enrich_steam(Stage("steam", asyncio.get_running_loop(), executor), checkpoint, None, 2, inbox, outbox, 1)
+
+    asyncio.run(steam_stage())
+    assert len(calls) == 3
+    assert [record.levelname for record in caplog.records] == ["INFO", "INFO", "INFO", "ERROR"] #resumed count, two retries, gave up
+    assert [record.getMessage() for record in caplog.records if "Retrying" in record.getMessage()] == [
+        "Retrying appid=10 (attempt 1/2)...", "Retrying appid=10 (attempt 2/2)...",
+    ]
+    assert checkpoint.load()[10]["status"] == STATUS_FAILED
@@ -0,0 +1,59 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#Response cache bookkeeping, and --offline serving a whole fetch from it without a single request
+
+
+import json
+import os
+import time
+
+import data_pull
+import main
+import quota
+from cache import ResponseCache
+from rate_limiter import TokenBucket
+from schema import read_snapshots
+
+
+def stored_bytes(cache):
+    return cache.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+
+def test_running_size_and_batched_access(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = ResponseCache(path)
+    cache.put("steam", "a", "a" * 100)
+    cache.put("steam", "b", "b" * 100)
+    cache.put("steam", "b", "b" * 10) #replacing a row only counts its new size
+    assert cache.total_bytes == stored_bytes(cache)
+
+    cache.max_bytes = cache.total_bytes + 5
+    assert cache.get("steam", "a") is not None
+    assert "a" in cache.accessed #the hit is only noted in memory
+    cache.put("steam", "c", "c" * 100) #the hit on a is written first, so b is the least recently used and goes
+    assert cache.has("steam", "a") and not cache.has("steam", "b") and cache.has("steam", "c")
+    assert cache.total_bytes == stored_bytes(cache)
+    assert cache.accessed == {}
+    cache.close()
+
+    reopened = ResponseCache(path)
+    assert reopened.total_bytes == stored_bytes(reopened)
+    reopened.clear()
+    assert reopened.total_bytes == 0
+    reopened.close()
+
+
+def test_offline_fetch_makes_no_requests(fixture_server, monkeypatch):
+    monkeypatch.setattr(data_pull, "steam_rate_limiter", lambda: TokenBucket(1000, 100))
+    os.makedirs("data", exist_ok=True)
+    with open(quota.DEFAULT_LEDGER_PATH, "w") as f:
+        json.dump({"day": time.strftime("%Y-%m-%d"), "used": 0, "limit": 1000, "header_remaining": None, "reset_at": None}, f)
+
+    main.main(["fetch", "-n", "25", "--log-level", "WARNING"])
+    online = read_snapshots("data/snapshots")
+    requests = {route: stats["requests"] for route, stats in fixture_server.stats.items()}
+    assert requests
+
+    main.main(["fetch", "-n", "25", "--offline", "--fresh", "--log-level", "WARNING"])
+    assert {route: stats["requests"] for route, stats in fixture_server.stats.items()} == requests
+    offline = read_snapshots("data/snapshots")
+    assert sorted(offline["appid"]) == sorted(online["appid"])
@@ -0,0 +1,57 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#Catalog mode against the fixture app list: shards split the appids without overlap, a crashed shard resumes, --limit stops early
+
+
+import pandas as pd
+import pytest
+
+import catalog
+from fixture_server import APP_LIST_SIZE, APP_LIST_START, NOT_FOUND_EVERY
+
+SHARDS = 3
+
+
+def _appids(shard: int, shards: int = SHARDS) -> set:
+    return set(pd.read_csv(f"data/catalog/steam_catalog-{shard}-of-{shards}.csv")["appid"])
+
+def _run(server, shard: int, shards: int = SHARDS, **options):
+    return catalog.run_catalog(shard, shards, app_list_url=server.app_list_url, store_url=server.base_url + "/api/appdetails", rate=1000, **options)
+
+
+def test_shards_are_disjoint_and_complete_after_a_resume(fixture_server, monkeypatch):
+    _run(fixture_server, 0)
+    _run(fixture_server, 1)
+
+    #The last shard crashes part way through, the rerun only asks Steam for the appids it hadn't finished
+    original = catalog.iter_steam_results
+
+    def crashing(*args, **kwargs):
+        for finished, result in enumerate(original(*args, **kwargs)):
+            if finished == 20:
+                raise RuntimeError("crash")
+            yield result
+
+    monkeypatch.setattr(catalog, "iter_steam_results", crashing)
+    with pytest.raises(RuntimeError):
+        _run(fixture_server, 2)
+    monkeypatch.setattr(catalog, "iter_steam_results", original)
+    before = fixture_server.stats["steam"]["requests"]
+    progress = _run(fixture_server, 2)
+    shard_size = len(range(APP_LIST_START + (2 - APP_LIST_START) % SHARDS, APP_LIST_START + APP_LIST_SIZE, SHARDS))
+    assert progress.resumed >= 20
+    #Requests still in flight at the crash were cached, so they aren't sent again either (at most 2 per worker)
+    assert shard_size - progress.resumed - 8 <= fixture_server.stats["steam"]["requests"] - before <= shard_size - progress.resumed
+
+    shards = [_appids(shard) for shard in range(SHARDS)]
+    for shard, appids in enumerate(shards):
+        assert all(appid % SHARDS == shard for appid in appids)
+    assert sum(len(appids) for appids in shards) == len(set().union(*shards))
+    expected = {appid for appid in range(APP_LIST_START, APP_LIST_START + APP_LIST_SIZE) if appid % NOT_FOUND_EVERY}
+    assert set().union(*shards) == expected
+
+
+def test_limit_stops_a_shard_early(fixture_server):
+    progress = _run(fixture_server, 0, 2, limit=15)
+    assert progress.total == 15
+    assert fixture_server.stats["steam"]["requests"] == 15
+    assert len(_appids(0, 2)) <= 15
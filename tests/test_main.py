@@ -0,0 +1,33 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#fetch --no-enrich leaves OpenCritic alone, enrich adds it to the snapshot afterwards
+
+
+import json
+import os
+import time
+
+import data_pull
+import main
+import quota
+from rate_limiter import TokenBucket
+from schema import read_snapshots
+
+
+def test_fetch_without_enrich_then_enrich(fixture_server, monkeypatch):
+    monkeypatch.setattr(data_pull, "steam_rate_limiter", lambda: TokenBucket(1000, 100))
+    os.makedirs("data", exist_ok=True)
+    with open(quota.DEFAULT_LEDGER_PATH, "w") as f:
+        json.dump({"day": time.strftime("%Y-%m-%d"), "used": 0, "limit": 1000, "header_remaining": None, "reset_at": None}, f)
+
+    main.main(["fetch", "-n", "25", "--no-enrich", "--log-level", "WARNING"])
+    assert "opencritic" not in fixture_server.stats
+    fetched = read_snapshots("data/snapshots")
+    assert len(fetched)
+    assert fetched["OC Updated"].isna().all()
+
+    main.main(["enrich", "--log-level", "WARNING"])
+    assert fixture_server.stats["opencritic"]["requests"] > 0
+    enriched = read_snapshots("data/snapshots")
+    assert sorted(enriched["appid"]) == sorted(fetched["appid"])
+    assert enriched["OC Updated"].notna().all()
+    assert enriched["TopCriticScore"].notna().any()
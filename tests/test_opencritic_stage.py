@@ -0,0 +1,31 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#The OpenCritic stage streams: games waiting for quota are bounded by the priority window instead of the whole input
+
+
+import data_pull
+from checkpoint import Checkpoint
+
+
+def test_games_needing_quota_stream_through_a_bounded_window(workdir, monkeypatch):
+    monkeypatch.setattr(data_pull, "opencritic_cost", lambda name, appid=None: 1)
+    monkeypatch.setattr(data_pull, "opencritic_priority", lambda row: row["Current Players"])
+    monkeypatch.setattr(data_pull, "opencritic_fields", lambda name, appid=None: {"OC_ID": appid, "OC_Name": name})
+    consumed = 0
+
+    def game_rows():
+        nonlocal consumed
+        for appid in range(1, 51):
+            consumed += 1
+            yield {"appid": appid, "game name": f"Game {appid}", "Current Players": appid % 7}
+
+    largest_wait = 0
+    out = []
+    for row in data_pull.opencritic_stage(game_rows(), Checkpoint("data/checkpoints/opencritic.jsonl"), window=5):
+        largest_wait = max(largest_wait, consumed - len(out) - 1)
+        out.append(row)
+
+    assert largest_wait <= 5
+    assert sorted(row["appid"] for row in out) == list(range(1, 51))
+    assert all(row["OC_ID"] == row["appid"] for row in out)
+    #Inside the window the most popular waiting game goes first
+    assert [row["Current Players"] for row in out[:3]] == [6, 5, 4]
@@ -0,0 +1,55 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#SteamCharts pages served from the cache mustn't be recorded as new player count samples
+
+
+import time
+
+import pytest
+
+from checkpoint import Checkpoint
+from data_pull import scrape_stage
+from player_history import PlayerHistory
+
+
+def test_cached_pages_are_not_new_samples(fixture_server, monkeypatch):
+    now = time.time()
+    with PlayerHistory("data/player_history.sqlite") as history:
+        for run in range(2):
+            monkeypatch.setattr(time, "time", lambda: now + run * 600) #second run ten minutes later, inside the page's cache TTL
+            checkpoint = Checkpoint(f"data/checkpoints/scrape-{run}.jsonl")
+            chart_rows = list(scrape_stage(25, checkpoint, history))
+
+    assert fixture_server.stats["steamcharts"]["requests"] == 1 #the second run read the cached page
+    for chart_row in chart_rows:
+        assert len(history.history(chart_row["appid"])) == 1
+        assert history.daily(chart_row["appid"])[0][1] == 1
+
+
+def test_daily_mean_skips_missing_player_counts(tmp_path):
+    day = 1_700_000_000
+    with PlayerHistory(str(tmp_path / "history.sqlite")) as history:
+        for i, current_players in enumerate([100, None, 200]):
+            history.record({"appid": 1, "current_players": current_players, "peak_players": 300}, day + i * 60)
+    assert history.daily(1)[0][1:3] == (3, 150)
+
+
+def test_old_history_gets_current_samples(tmp_path):
+    path = str(tmp_path / "history.sqlite")
+    day = 1_700_000_000
+    with PlayerHistory(path) as history:
+        for i, current_players in enumerate([100, None, 200]):
+            history.record({"appid": 1, "current_players": current_players, "peak_players": 300}, day + i * 60)
+    history.connection.executescript("ALTER TABLE daily_players DROP COLUMN current_samples; UPDATE daily_players SET mean_current = 133.3;")
+    history.close()
+
+    with PlayerHistory(path) as history:
+        assert history.daily(1)[0][1:3] == (3, 150)
+        history.record({"appid": 1, "current_players": 350, "peak_players": 400}, day + 600)
+    assert history.daily(1)[0][1:3] == (4, pytest.approx(650 / 3))
+
+
+def test_rolling_for_day_defaults_to_utc_today(tmp_path):
+    now = int(time.time())
+    with PlayerHistory(str(tmp_path / "history.sqlite")) as history:
+        history.record({"appid": 1, "current_players": 100, "peak_players": 100}, now)
+    assert history.rolling_for_day()["appid"].tolist() == [1]
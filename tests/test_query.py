@@ -0,0 +1,62 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#Query index answers checked against plain pandas filtering on the same snapshot
+
+
+import datetime
+
+import numpy as np
+import pytest
+
+from analysis import load_dataset
+from features import add_features, discounted_mask, paid_mask
+from query import QueryIndex, build_index, current_index
+
+
+@pytest.fixture
+def dataset(snapshot):
+    return add_features(load_dataset(snapshot).reset_index(drop=True))
+
+def _appids(rows: list) -> list:
+    return [row["appid"] for row in rows]
+
+
+def test_top_k_matches_nlargest(snapshot, dataset):
+    index = build_index(snapshot)
+    mask = paid_mask(dataset) & (dataset["Current Price (USD)"] <= 20)
+    expected = dataset.loc[mask, "Value"].astype("float64").nlargest(5)
+    rows = index.top_k("value", 5, {"price": (None, 20)}, ["paid"])
+    np.testing.assert_allclose([row["value"] for row in rows], expected.to_numpy())
+
+    cheapest = dataset["Current Price (USD)"].astype("float64").nsmallest(3)
+    assert [row["price"] for row in index.top_k("price", 3, descending=False)] == cheapest.tolist()
+
+def test_range_and_filter_match_boolean_masks(snapshot, dataset):
+    index = build_index(snapshot)
+    price = dataset["Current Price (USD)"].astype("float64")
+    in_range = dataset.loc[price.between(5, 10), "appid"]
+    rows = index.range("price", 5, 10)
+    assert sorted(_appids(rows)) == sorted(in_range.astype(int).tolist())
+    assert [row["price"] for row in rows] == sorted(row["price"] for row in rows)
+
+    mask = discounted_mask(dataset) & (dataset["Discount Percentage"] >= 25) & (dataset["Current Players"] <= 300_000)
+    rows = index.filter({"discount": (25, None), "players": (None, 300_000)}, ["discounted"])
+    assert _appids(rows) == dataset.loc[mask, "appid"].astype(int).tolist()
+    assert _appids(index.filter(flags=["paid"], limit=7)) == dataset.loc[paid_mask(dataset), "appid"].astype(int).tolist()[:7]
+
+def test_saved_index_memory_maps_back(snapshot):
+    index = build_index(snapshot)
+    loaded = QueryIndex.load(index.save("data/query_index"))
+    assert isinstance(loaded.columns["value"], np.memmap)
+    assert loaded.snapshot_date == index.snapshot_date
+    assert loaded.top_k("value", 10, {"price": (None, 30)}, ["paid"]) == index.top_k("value", 10, {"price": (None, 30)}, ["paid"])
+    assert loaded.filter({"critic": (70, 90)}, ["rated"]) == index.filter({"critic": (70, 90)}, ["rated"])
+
+def test_stale_saved_index_is_rebuilt(snapshot, dataset):
+    yesterday = datetime.date.today() - datetime.timedelta(days=1)
+    old = QueryIndex.from_frame(dataset.head(10), yesterday.isoformat())
+    old.save("data/query_index")
+
+    index = current_index("data/query_index", snapshot)
+    assert index.snapshot_date == datetime.date.today().isoformat()
+    assert index.size == len(dataset)
+    assert QueryIndex.load("data/query_index").snapshot_date == index.snapshot_date
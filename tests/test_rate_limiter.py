@@ -0,0 +1,26 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#The shared token bucket keeps the Steam Store requests under its rate, retries included
+
+
+import time
+
+from data_pull import iter_steam_results
+from rate_limiter import TokenBucket
+
+RATE = 20
+BURST = 2
+
+
+def test_steam_requests_stay_under_bucket_rate(fixture_server):
+    limiter = TokenBucket(RATE, BURST)
+    appids = list(range(1000, 1040))
+    start = time.monotonic()
+    results = list(iter_steam_results(appids, max_workers=8, limiter=limiter, url=fixture_server.base_url + "/api/appdetails"))
+    elapsed = time.monotonic() - start
+
+    requests = fixture_server.stats["steam"]["requests"]
+    assert len(results) == len(appids)
+    assert requests >= len(appids)
+    #At most the burst plus one token per 1/RATE seconds can have been spent
+    assert requests <= BURST + RATE * elapsed
+    assert elapsed >= (len(appids) - BURST) / RATE
@@ -0,0 +1,23 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#Steam prices go in to a record as the integer cents Steam returns, and only become dollars when a row is written
+
+
+from data_pull import build_game_record, build_game_row, price_fields
+from records import GameRecord
+
+CHART_ROW = {"appid": 10, "name": "Some Game", "current_players": 120, "peak_players": 300}
+
+
+def test_record_keeps_steam_cents():
+    game_info = {"name": "Some Game", "is_free": False, "price_overview": {"currency": "USD", "initial": 2999, "final": 1499, "discount_percent": 50}}
+    record = build_game_record(10, CHART_ROW, game_info)
+    assert (record.base_cents, record.final_cents, record.discount, record.on_sale) == (2999, 1499, 50, True)
+
+    row = build_game_row(10, CHART_ROW, game_info)
+    assert (row["Base Price (USD)"], row["Current Price (USD)"]) == (29.99, 14.99)
+    assert GameRecord.from_row(row).base_cents == 2999
+
+
+def test_free_game_prices():
+    assert price_fields(None, True) == {"Base Price (USD)": 0.0, "Current Price (USD)": 0.0, "Discount Percentage": None, "On sale?": False}
+    assert price_fields(None, False)["Base Price (USD)"] is None
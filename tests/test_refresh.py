@@ -0,0 +1,57 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#Refresh against the previous snapshot when OpenCritic can't be asked again
+
+
+import json
+import os
+import time
+
+import data_pull
+import opencritic_index
+import quota
+from rate_limiter import TokenBucket
+from schema import read_snapshots
+
+SCORE_COLUMNS = ["OC_ID", "TopCriticScore", "MedianCriticScore", "PercentRecommended", "TotalReviews", "OC_Tier"]
+
+
+def _write_ledger(used: int, limit: int) -> None:
+    os.makedirs(os.path.dirname(quota.DEFAULT_LEDGER_PATH), exist_ok=True)
+    with open(quota.DEFAULT_LEDGER_PATH, "w") as f:
+        json.dump({"day": time.strftime("%Y-%m-%d"), "used": used, "limit": limit, "header_remaining": None, "reset_at": None}, f)
+
+def _scores() -> dict:
+    df = read_snapshots("data/snapshots").set_index("appid")
+    return df.loc[df["TopCriticScore"].notna(), SCORE_COLUMNS].astype(object).to_dict("index")
+
+### Nothing stored locally and no quota left, every OpenCritic lookup has to fail ###
+def _exhaust_quota(monkeypatch) -> None:
+    monkeypatch.setattr(opencritic_index, "_index", None)
+    monkeypatch.setattr(quota, "_ledger", None)
+    for path in ("data/http_cache.sqlite", "data/opencritic_index.sqlite"):
+        os.remove(path)
+    _write_ledger(25, 25)
+
+
+def test_refresh_keeps_scores_when_quota_is_exhausted(fixture_server, monkeypatch):
+    monkeypatch.setattr(data_pull, "steam_rate_limiter", lambda: TokenBucket(1000, 100))
+    _write_ledger(0, 1000)
+    data_pull.run(25)
+    before = _scores()
+    requests = fixture_server.stats["opencritic"]["requests"]
+    assert before
+
+    _exhaust_quota(monkeypatch)
+    data_pull.refresh(25, opencritic_max_age_days=-1)
+    assert fixture_server.stats["opencritic"]["requests"] == requests
+    assert _scores() == before
+
+
+def test_new_match_replaces_old_opencritic_columns():
+    old = {"appid": 1, "game name": "Renamed", "OC_ID": 10, "OC_Name": "Old Game", "TopCriticScore": 88, "OC_Tier": "Mighty"}
+    merged = data_pull.merge_opencritic_fields(old, {"OC_ID": 20, "OC_Name": "Other Game", "TopCriticScore": None, "OC_Tier": None})
+    assert (merged["OC_ID"], merged["OC_Name"], merged["TopCriticScore"], merged["OC_Tier"]) == (20, "Other Game", None, None)
+
+    same = data_pull.merge_opencritic_fields(old, {"OC_ID": 10, "OC_Name": "Old Game", "TopCriticScore": 90, "OC_Tier": None})
+    assert (same["TopCriticScore"], same["OC_Tier"]) == (90, "Mighty")
+    assert data_pull.merge_opencritic_fields(old, None)["TopCriticScore"] == 88
@@ -0,0 +1,21 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#The Parquet sink's unfinished file mustn't break reading the snapshot folder it is written into
+
+
+import os
+
+from data_pull import DATASET_COLUMNS
+from schema import read_snapshots, snapshot_path
+from sinks import ParquetSink
+
+
+def test_snapshot_readable_while_parquet_sink_writes(workdir):
+    root = "data/snapshots"
+    with ParquetSink(os.path.join(snapshot_path(root, "2025-01-01"), "part-0.parquet"), columns=DATASET_COLUMNS) as sink:
+        sink.write_row({"appid": 10, "game name": "Yesterday"})
+
+    with ParquetSink(os.path.join(snapshot_path(root), "part-0.parquet"), columns=DATASET_COLUMNS, chunk_size=1) as sink:
+        sink.write_row({"appid": 20, "game name": "Today"})
+        assert os.listdir(snapshot_path(root)) #a chunk is already on disk
+        assert read_snapshots(root)["appid"].tolist() == [10]
+    assert sorted(read_snapshots(root)["appid"].tolist()) == [10, 20]
@@ -0,0 +1,20 @@
+#DSCI 510 - Ryan McDermott - Final Project
+#Every installed HTML parser backend must read the saved SteamCharts pages in to the same chart rows
+
+
+import pytest
+
+from bench_parsers import load_pages
+from steamcharts_parser import available_backends, parse_top_table
+
+
+@pytest.mark.parametrize("page", range(len(load_pages())))
+def test_backends_agree(page):
+    backends = available_backends()
+    if len(backends) < 2:
+        pytest.skip(f"Only {backends} installed, nothing to compare")
+    html = load_pages()[page]
+    expected = parse_top_table(html, backend=backends[0])
+    assert expected
+    for backend in backends[1:]:
+        assert parse_top_table(html, backend=backend) == expected, backend